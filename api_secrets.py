@@ -8,17 +8,22 @@ API密钥管理模块
 3. Streamlit secrets
 4. config.json文件
 5. 用户交互输入
+
+各来源文件只在首次查询时解析一次，之后的查询只读取内存字典；
+文件被修改后调用 refresh_api_sources() 重新加载
 """
 
 import os
 import json
 import getpass
+import logging
+import threading
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 
 # 尝试导入dotenv，如果安装了的话
 try:
-    from dotenv import load_dotenv
+    from dotenv import dotenv_values
     DOTENV_AVAILABLE = True
 except ImportError:
     DOTENV_AVAILABLE = False
@@ -30,6 +35,113 @@ try:
 except ImportError:
     STREAMLIT_AVAILABLE = False
 
+logger = logging.getLogger(__name__)
+
+
+class ApiKeySources:
+    """
+    API密钥来源链
+    
+    .env、Streamlit secrets和config.json在首次使用时各解析一次，
+    每个提供商的解析结果缓存到调用 refresh() 为止；环境变量每次实时读取
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dotenv: Optional[Dict[str, Optional[str]]] = None
+        self._config: Optional[Dict[str, Any]] = None
+        self._resolved: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+    
+    def refresh(self):
+        """丢弃已解析的文件内容和密钥，下次查询时重新加载"""
+        with self._lock:
+            self._dotenv = None
+            self._config = None
+            self._resolved.clear()
+    
+    def _load_dotenv(self) -> Dict[str, Optional[str]]:
+        if self._dotenv is None:
+            values: Dict[str, Optional[str]] = {}
+            if DOTENV_AVAILABLE and Path(".env").exists():
+                try:
+                    values = dict(dotenv_values(".env"))
+                except Exception as e:
+                    logger.warning(f"无法解析.env文件: {e}")
+            self._dotenv = values
+        return self._dotenv
+    
+    def _load_config(self) -> Dict[str, Any]:
+        if self._config is None:
+            config: Dict[str, Any] = {}
+            config_path = Path("config.json")
+            if config_path.exists():
+                try:
+                    with open(config_path, "r", encoding="utf-8") as f:
+                        config = json.load(f)
+                except Exception as e:
+                    logger.warning(f"无法从config.json加载: {e}")
+            self._config = config
+        return self._config
+    
+    @staticmethod
+    def _read_streamlit_secret(name: str) -> Optional[str]:
+        if not STREAMLIT_AVAILABLE:
+            return None
+        try:
+            return st.secrets.get(name)
+        except Exception:
+            return None  # Streamlit secrets不可用或未配置
+    
+    def _resolve(self, env_var_name: str) -> Tuple[Optional[str], Optional[str]]:
+        """按 .env → Streamlit secrets → config.json 的顺序解析，返回 (密钥, 来源)"""
+        api_key = self._load_dotenv().get(env_var_name)
+        if api_key:
+            return api_key, ".env"
+        
+        api_key = self._read_streamlit_secret(env_var_name)
+        if api_key:
+            return api_key, "Streamlit secrets"
+        
+        api_key = self._load_config().get("api_key")
+        if api_key:
+            return api_key, "config.json"
+        return None, None
+    
+    def get_api_key(self, provider: str) -> Optional[str]:
+        env_var_name = f"{provider.upper()}_API_KEY"
+        
+        # 环境变量优先，读取本身就是一次字典查找
+        api_key = os.environ.get(env_var_name)
+        if api_key:
+            return api_key
+        
+        resolved = self._resolved.get(env_var_name)
+        if resolved is None:
+            with self._lock:
+                resolved = self._resolved.get(env_var_name)
+                if resolved is None:
+                    resolved = self._resolve(env_var_name)
+                    self._resolved[env_var_name] = resolved
+                    if resolved[0]:
+                        logger.info(f"已从{resolved[1]}加载 {provider} API密钥")
+                    else:
+                        logger.debug(f"未找到 {provider} API密钥")
+        return resolved[0]
+    
+    def get_config(self) -> Dict[str, Any]:
+        """config.json内容的副本"""
+        with self._lock:
+            return dict(self._load_config())
+
+
+# 进程内共享的来源链
+_sources = ApiKeySources()
+
+
+def refresh_api_sources():
+    """重新加载.env、Streamlit secrets和config.json（文件修改后调用）"""
+    _sources.refresh()
+
 
 def get_api_key(provider: str = "deepseek") -> Optional[str]:
     """
@@ -41,49 +153,7 @@ def get_api_key(provider: str = "deepseek") -> Optional[str]:
     Returns:
         API密钥字符串或None（如果找不到）
     """
-    env_var_name = f"{provider.upper()}_API_KEY"
-    
-    # 1. 首先检查环境变量
-    api_key = os.environ.get(env_var_name)
-    if api_key:
-        print(f"✓ 已从环境变量加载 {provider} API密钥")
-        return api_key
-    
-    # 2. 尝试从.env文件加载
-    if DOTENV_AVAILABLE:
-        env_path = Path(".env")
-        if env_path.exists():
-            load_dotenv()
-            api_key = os.getenv(env_var_name)
-            if api_key:
-                print(f"✓ 已从.env文件加载 {provider} API密钥")
-                return api_key
-    
-    # 3. 尝试从Streamlit secrets加载
-    if STREAMLIT_AVAILABLE:
-        try:
-            api_key = st.secrets.get(env_var_name)
-            if api_key:
-                print(f"✓ 已从Streamlit secrets加载 {provider} API密钥")
-                return api_key
-        except:
-            pass  # Streamlit secrets不可用或未配置
-    
-    # 4. 尝试从config.json加载
-    config_path = Path("config.json")
-    if config_path.exists():
-        try:
-            with open(config_path, "r", encoding="utf-8") as f:
-                config = json.load(f)
-                api_key = config.get("api_key")
-                if api_key:
-                    print(f"✓ 已从config.json加载API密钥")
-                    return api_key
-        except Exception as e:
-            print(f"无法从config.json加载: {e}")
-    
-    # 没有找到API密钥
-    return None
+    return _sources.get_api_key(provider)
 
 
 def save_api_key(api_key: str, provider: str = "deepseek", method: str = "env") -> bool:
@@ -126,6 +196,7 @@ def save_api_key(api_key: str, provider: str = "deepseek", method: str = "env")
         # 添加新的环境变量
         with open(env_path, "w", encoding="utf-8") as f:
             f.write(f"{env_content}\n{env_var_name}=\"{api_key}\"\n")
+        refresh_api_sources()
             
         print(f"✓ API密钥已保存到 .env 文件")
         return True
@@ -150,6 +221,7 @@ def save_api_key(api_key: str, provider: str = "deepseek", method: str = "env")
         # 写入文件
         with open(config_path, "w", encoding="utf-8") as f:
             json.dump(config, f, indent=2, ensure_ascii=False)
+        refresh_api_sources()
             
         print(f"✓ API密钥已保存到 config.json 文件")
         return True
@@ -172,6 +244,7 @@ def save_api_key(api_key: str, provider: str = "deepseek", method: str = "env")
         # 添加新的密钥
         with open(secrets_path, "w", encoding="utf-8") as f:
             f.write(f"{secrets_content}\n{env_var_name} = \"{api_key}\"\n")
+        refresh_api_sources()
             
         print(f"✓ API密钥已保存到 .streamlit/secrets.toml 文件")
         return True
@@ -258,15 +331,8 @@ def get_api_config() -> Dict[str, Any]:
         "model": "deepseek-chat"
     }
     
-    # 尝试从config.json加载完整配置
-    config_path = Path("config.json")
-    if config_path.exists():
-        try:
-            with open(config_path, "r", encoding="utf-8") as f:
-                loaded_config = json.load(f)
-                config.update(loaded_config)
-        except Exception as e:
-            print(f"无法从config.json加载配置: {e}")
+    # 从config.json加载完整配置（与密钥查询共用同一次解析结果）
+    config.update(_sources.get_config())
     
     # 确保API密钥是最新的
     config["api_key"] = get_api_key(config["api_provider"])
@@ -1,30 +1,58 @@
 import logging
-from typing import List, Dict, Tuple, Optional, Any
+from typing import List, Dict, Tuple, Optional, Any, Sequence, Iterator
 import argparse
+import json
+import os
 import random
+import re
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from batch_metrics import normalize_text
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+CHECKPOINT_VERSION = 2
+# Search settings written once as the first checkpoint line; progress is appended after it
+_CHECKPOINT_HEADER_KEYS = ("eval_inputs", "eval_references", "demo_pairs", "iterations", "variations_per_iter")
+# Variations whose character n-gram Jaccard similarity to a known prompt reaches this are dropped
+NEAR_DUPLICATE_THRESHOLD = 0.8
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_json_decoder = json.JSONDecoder()
+
 class AutoPromptEngineer:
     """
     Automatic Prompt Engineer (APE) system that generates optimal prompts
     based on user requirements and example input-output pairs.
     """
     
-    def __init__(self, inference_model: Any, scoring_model: Any, resampling_model: Optional[Any] = None):
+    def __init__(self, inference_model: Any, scoring_model: Any, resampling_model: Optional[Any] = None,
+                 inference_batch_size: int = 32, seed: Optional[int] = None):
         """
         Initialize the APE system with the required models.
         
         Args:
-            inference_model: Model used to execute tasks based on prompts
+            inference_model: Model used to execute tasks based on prompts; may implement
+                             ``generate_batch(prompts)`` in addition to ``generate(prompt)``
             scoring_model: Model used to evaluate prompt effectiveness
             resampling_model: Optional model for generating prompt variations
+            inference_batch_size: Maximum number of prompts per ``generate_batch`` call
+            seed: Seed for the random number generator used by ``evolve_prompts``
         """
+        if inference_batch_size < 1:
+            raise ValueError("inference_batch_size must be at least 1")
         self.inference_model = inference_model
+        self.inference_batch_size = inference_batch_size
         self.scoring_model = scoring_model
         self.resampling_model = resampling_model
+        self.rng = random.Random(seed)
+        self.model_calls = 0
+        self._calls_lock = threading.Lock()
+        self.generation_stats: List[Dict[str, Any]] = []
         self.demo_pairs = []
         self.best_prompt = None
         self.best_score = float('-inf')
@@ -66,38 +94,114 @@ class AutoPromptEngineer:
         Returns:
             The average score across all test cases
         """
+        return self.evaluate_prompts([candidate_prompt], eval_inputs, eval_references)[0]
+    
+    def evaluate_prompts(self, candidate_prompts: List[str], eval_inputs: List[str],
+                         eval_references: List[str]) -> List[float]:
+        """
+        Evaluate several candidate prompts, sending the whole candidate x input grid
+        to the inference model in batches.
+        
+        Returns:
+            The average score of each candidate, in order
+        """
+        return [sum(scores) / len(scores)
+                for scores in self.score_candidates(candidate_prompts, eval_inputs, eval_references)]
+    
+    def score_candidates(self, candidate_prompts: List[str], eval_inputs: List[str],
+                         eval_references: List[str]) -> List[List[float]]:
+        """
+        Run and score every candidate on every input.
+        
+        Returns:
+            Per-input scores for each candidate
+        """
         if len(eval_inputs) != len(eval_references):
             raise ValueError("Number of eval_inputs must match eval_references")
+        if not eval_inputs:
+            raise ValueError("At least one evaluation input is required")
         
-        total_score = 0.0
+        # Build the complete prompts for the whole grid and generate outputs in batches
+        prompt_texts = [self.build_prompt(candidate, test_input)
+                        for candidate in candidate_prompts for test_input in eval_inputs]
+        generated_outputs = self.generate_outputs(prompt_texts)
         
-        for i, test_input in enumerate(eval_inputs):
-            # Build the complete prompt
-            prompt_text = self.build_prompt(candidate_prompt, test_input)
+        all_scores = []
+        for index, candidate_prompt in enumerate(candidate_prompts):
+            outputs = generated_outputs[index * len(eval_inputs):(index + 1) * len(eval_inputs)]
+            # Score all outputs of the candidate against the expected results
+            scores = self.score_outputs(outputs, eval_references)
+            all_scores.append(scores)
             
-            # Generate output using the inference model
-            generated_output = self.inference_model.generate(prompt_text)
-            
-            # Score the output against the expected result
-            score = self.scoring_model.score(generated_output, reference=eval_references[i])
-            total_score += score
-            
-            logger.debug(f"Prompt: {candidate_prompt}")
-            logger.debug(f"Input: {test_input}")
-            logger.debug(f"Generated: {generated_output}")
-            logger.debug(f"Expected: {eval_references[i]}")
-            logger.debug(f"Score: {score}")
-        
-        avg_score = total_score / len(eval_inputs)
-        return avg_score
+            if logger.isEnabledFor(logging.DEBUG):
+                for test_input, generated_output, reference, score in zip(eval_inputs, outputs,
+                                                                          eval_references, scores):
+                    logger.debug(f"Prompt: {candidate_prompt}")
+                    logger.debug(f"Input: {test_input}")
+                    logger.debug(f"Generated: {generated_output}")
+                    logger.debug(f"Expected: {reference}")
+                    logger.debug(f"Score: {score}")
+        return all_scores
+    
+    def generate_outputs(self, prompt_texts: List[str]) -> List[str]:
+        """
+        Run the inference model on a list of prompts.
+        
+        Models implementing ``generate_batch(prompts)`` receive batches of at most
+        ``inference_batch_size`` prompts; other models are called once per prompt.
+        """
+        self._record_calls(len(prompt_texts))
+        generate_batch = getattr(self.inference_model, "generate_batch", None)
+        if generate_batch is None:
+            return [self.inference_model.generate(prompt_text) for prompt_text in prompt_texts]
+        
+        outputs: List[str] = []
+        for start in range(0, len(prompt_texts), self.inference_batch_size):
+            batch = prompt_texts[start:start + self.inference_batch_size]
+            results = list(generate_batch(batch))
+            if len(results) != len(batch):
+                raise ValueError(f"generate_batch returned {len(results)} outputs for {len(batch)} prompts")
+            outputs.extend(results)
+        return outputs
     
-    def generate_prompt_variations(self, base_prompt: str, num_variations: int = 5) -> List[str]:
+    def _record_calls(self, count: int):
+        """Count model calls (one per inference prompt or resampling request)."""
+        with self._calls_lock:
+            self.model_calls += count
+    
+    def score_outputs(self, generated_outputs: List[str], references: List[str]) -> List[float]:
+        """
+        Score generated outputs against references.
+        
+        Uses the scoring model's ``score_batch(generated_list, references)`` when it
+        provides one (see batch_metrics), otherwise calls ``score`` once per pair.
+        
+        Returns:
+            One score per output
+        """
+        score_batch = getattr(self.scoring_model, "score_batch", None)
+        if score_batch is None:
+            return [self.scoring_model.score(generated, reference=reference)
+                    for generated, reference in zip(generated_outputs, references)]
+        
+        scores = [float(score) for score in score_batch(generated_outputs, references)]
+        if len(scores) != len(generated_outputs):
+            raise ValueError(f"score_batch returned {len(scores)} scores for {len(generated_outputs)} outputs")
+        return scores
+    
+    def generate_prompt_variations(self, base_prompt: str, num_variations: int = 5,
+                                   exclude: Sequence[str] = ()) -> List[str]:
         """
         Generate variations of a prompt using the resampling model.
         
+        The model is asked for a JSON array; empty entries and variations that
+        nearly duplicate the base prompt, an excluded prompt or each other are
+        dropped, so fewer than ``num_variations`` may be returned.
+        
         Args:
             base_prompt: The base prompt to create variations from
             num_variations: Number of variations to generate
+            exclude: Prompts already evaluated
             
         Returns:
             List of prompt variations
@@ -107,20 +211,39 @@ class AutoPromptEngineer:
         
         variation_instruction = (
             f"Create {num_variations} variations of the following prompt that maintain "
-            f"the same semantic meaning but use different wording:\n\n{base_prompt}"
+            f"the same semantic meaning but use different wording. Reply with a JSON array of "
+            f"{num_variations} strings, one complete prompt per string, and nothing else.\n\n{base_prompt}"
         )
         
+        self._record_calls(1)
         variations_text = self.resampling_model.generate(variation_instruction)
         
-        # 简单分行解析，过滤空行，仅返回指定数量
-        raw_lines = [line.strip() for line in variations_text.split("\n")]
-        variations = [v for v in raw_lines if v]  # 去掉空字符串
-        
+        variations = deduplicate_prompts(parse_variations(variations_text), known=[base_prompt, *exclude])
         return variations[:num_variations]
     
+    def crossover_prompts(self, first_prompt: str, second_prompt: str) -> str:
+        """
+        Combine two parent prompts into a new prompt using the resampling model.
+        
+        Returns:
+            The combined prompt, or an empty string if the model returned nothing
+        """
+        if not self.resampling_model:
+            raise ValueError("Resampling model not set.")
+        
+        crossover_instruction = (
+            "Combine the strengths of the following two prompts into a single new prompt "
+            "with the same purpose. Reply with the new prompt only.\n\n"
+            f"Prompt 1:\n{first_prompt}\n\nPrompt 2:\n{second_prompt}"
+        )
+        
+        self._record_calls(1)
+        return self.resampling_model.generate(crossover_instruction).strip()
+    
     def find_optimal_prompt(self, candidate_prompts: List[str], eval_inputs: List[str], 
                            eval_references: List[str], iterations: int = 3, 
-                           variations_per_iter: int = 3) -> Tuple[str, float]:
+                           variations_per_iter: int = 3,
+                           checkpoint_path: Optional[str] = None) -> Tuple[str, float]:
         """
         Find the optimal prompt through evaluation and resampling.
         
@@ -130,50 +253,250 @@ class AutoPromptEngineer:
             eval_references: Expected outputs for test inputs
             iterations: Number of optimization iterations
             variations_per_iter: Number of variations to generate per iteration
+            checkpoint_path: Optional file the search progress is appended to after every
+                             evaluated candidate; pass it to ``resume`` to continue an interrupted run
             
         Returns:
             The best prompt and its score
         """
-        best_prompt = None
-        best_score = float('-inf')
-        
-        # Evaluate initial candidates
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "eval_inputs": list(eval_inputs),
+            "eval_references": list(eval_references),
+            "demo_pairs": [list(pair) for pair in self.demo_pairs],
+            "iterations": iterations,
+            "variations_per_iter": variations_per_iter,
+            "iteration": 0,
+            "pending": list(candidate_prompts),
+            "evaluated": [],
+            "history": [],
+            "best_prompt": None,
+            "best_score": None,
+        }
+        if checkpoint_path:
+            header = {key: state[key] for key in _CHECKPOINT_HEADER_KEYS}
+            start_checkpoint(checkpoint_path, {"version": CHECKPOINT_VERSION, "candidates": state["pending"], **header})
         logger.info("Evaluating initial candidates...")
-        for prompt in candidate_prompts:
-            score = self.evaluate_prompt(prompt, eval_inputs, eval_references)
-            logger.info(f"Prompt: '{prompt}' - Score: {score:.4f}")
+        return self._run_search(state, checkpoint_path)
+    
+    def resume(self, checkpoint_path: str) -> Tuple[str, float]:
+        """
+        Continue a ``find_optimal_prompt`` run from its checkpoint.
+        
+        Candidates already evaluated and variations already generated are not
+        requested again; the demonstration pairs and the model call count are restored.
+        
+        Returns:
+            The best prompt and its score
+        """
+        state = load_checkpoint(checkpoint_path)
+        self.demo_pairs = [tuple(pair) for pair in state["demo_pairs"]]
+        self.model_calls = state["model_calls"]
+        logger.info(f"Resuming from {checkpoint_path}: iteration {state['iteration']}/{state['iterations']}, "
+                    f"{len(state['evaluated'])} candidates evaluated, {len(state['pending'])} pending")
+        return self._run_search(state, checkpoint_path)
+    
+    def _run_search(self, state: Dict[str, Any], checkpoint_path: Optional[str]) -> Tuple[str, float]:
+        """Evaluate pending candidates, then resample the best prompt until the iterations are used up."""
+        try:
+            # Initial candidates are evaluated unguarded, as before; errors during iterations end the search
+            if state["iteration"] == 0:
+                self._evaluate_pending(state, checkpoint_path)
             
-            if score > best_score:
-                best_prompt = prompt
-                best_score = score
-        
-        # Iterative improvement through resampling
-        if self.resampling_model:
-            for i in range(iterations):
-                logger.info(f"Optimization Iteration {i+1}/{iterations}")
-                
-                # Generate variations of the best prompt
+            # Iterative improvement through resampling
+            while self.resampling_model:
                 try:
-                    variations = self.generate_prompt_variations(best_prompt, variations_per_iter)
-                    logger.info(f"Generated {len(variations)} variations")
+                    self._evaluate_pending(state, checkpoint_path)
+                    if state["iteration"] >= state["iterations"]:
+                        break
+                    
+                    i = state["iteration"] + 1
+                    logger.info(f"Optimization Iteration {i}/{state['iterations']}")
                     
-                    # Evaluate variations
-                    for var_prompt in variations:
-                        score = self.evaluate_prompt(var_prompt, eval_inputs, eval_references)
-                        logger.info(f"Variation: '{var_prompt}' - Score: {score:.4f}")
-                        
-                        if score > best_score:
-                            best_prompt = var_prompt
-                            best_score = score
-                            logger.info(f"New best prompt found: '{best_prompt}' - Score: {best_score:.4f}")
+                    # Generate variations of the best prompt
+                    variations = self.generate_prompt_variations(
+                        state["best_prompt"], state["variations_per_iter"],
+                        exclude=[entry["prompt"] for entry in state["evaluated"]])
+                    logger.info(f"Generated {len(variations)} variations")
+                    state["history"].append({"iteration": i, "base_prompt": state["best_prompt"],
+                                             "variations": variations})
+                    state["iteration"] = i
+                    state["pending"] = variations
+                    if checkpoint_path:
+                        append_checkpoint(checkpoint_path, {"iteration": i, "base_prompt": state["best_prompt"],
+                                                            "variations": variations,
+                                                            "model_calls": self.model_calls})
                 
                 except Exception as e:
                     logger.error(f"Error in resampling: {e}")
                     break
+        except KeyboardInterrupt:
+            if checkpoint_path:
+                logger.info(f"Interrupted; resume with the checkpoint at {checkpoint_path}")
+            raise
+        
+        self.best_prompt = state["best_prompt"]
+        self.best_score = state["best_score"] if state["best_score"] is not None else float('-inf')
+        return self.best_prompt, self.best_score
+    
+    def _evaluate_pending(self, state: Dict[str, Any], checkpoint_path: Optional[str]):
+        """
+        Evaluate the pending candidates and record their scores.
+        
+        With a checkpoint, each candidate's scores are appended to it as soon as they
+        are known. Models without ``generate_batch`` are then run one candidate at a
+        time; batch models get groups filling one inference batch, since the
+        candidates of a batch finish together anyway.
+        """
+        eval_inputs, eval_references = state["eval_inputs"], state["eval_references"]
+        group_size = len(state["pending"])
+        if checkpoint_path:
+            group_size = 1
+            if hasattr(self.inference_model, "generate_batch"):
+                group_size = max(1, self.inference_batch_size // max(len(eval_inputs), 1))
+        
+        while state["pending"]:
+            group = state["pending"][:group_size]
+            for prompt, scores in zip(group, self.score_candidates(group, eval_inputs, eval_references)):
+                entry = {"prompt": prompt, "iteration": state["iteration"],
+                         "score": sum(scores) / len(scores), "scores": scores}
+                if state["iteration"] == 0:
+                    logger.info(f"Prompt: '{prompt}' - Score: {entry['score']:.4f}")
+                else:
+                    logger.info(f"Variation: '{prompt}' - Score: {entry['score']:.4f}")
+                if _record_evaluation(state, entry) and state["iteration"] > 0:
+                    logger.info(f"New best prompt found: '{prompt}' - Score: {entry['score']:.4f}")
+                if checkpoint_path:
+                    append_checkpoint(checkpoint_path, {"evaluated": entry, "model_calls": self.model_calls})
+    
+    def evolve_prompts(self, candidate_prompts: List[str], eval_inputs: List[str],
+                       eval_references: List[str], population_size: int = 4, generations: int = 5,
+                       offspring_per_generation: int = 4, tournament_size: int = 2,
+                       crossover_rate: float = 0.3, max_model_calls: Optional[int] = None,
+                       max_workers: int = 4) -> Tuple[str, float]:
+        """
+        Find the optimal prompt with a population-based evolutionary search.
         
-        self.best_prompt = best_prompt
-        self.best_score = best_score
-        return best_prompt, best_score
+        Each generation picks parents by tournament selection, creates offspring by
+        mutation (one resampled variation) or crossover of two parents, requesting
+        them from the resampling model in parallel, evaluates the offspring in one
+        batched grid and keeps the top ``population_size`` prompts. Statistics for
+        every generation are logged and stored in ``generation_stats``.
+        
+        Args:
+            candidate_prompts: Initial population
+            eval_inputs: Test inputs for evaluation
+            eval_references: Expected outputs for test inputs
+            population_size: Number of prompts kept after each generation
+            generations: Maximum number of generations
+            offspring_per_generation: Offspring created per generation
+            tournament_size: Number of population members competing for each parent slot
+            crossover_rate: Probability that an offspring is a crossover rather than a mutation
+            max_model_calls: Optional budget of model calls (each inference prompt and each
+                             resampling request counts as one), including the initial evaluation;
+                             only the leading initial candidates that fit the budget are evaluated
+            max_workers: Maximum number of parallel resampling requests
+            
+        Returns:
+            The best prompt and its score
+        """
+        if not self.resampling_model:
+            raise ValueError("Resampling model not set.")
+        if population_size < 1 or tournament_size < 1:
+            raise ValueError("population_size and tournament_size must be at least 1")
+        if not candidate_prompts:
+            raise ValueError("At least one candidate prompt is required")
+        
+        start_calls = self.model_calls
+        self.generation_stats = []
+        seen: Dict[str, float] = {}
+        
+        logger.info("Evaluating initial population...")
+        initial = list(dict.fromkeys(candidate_prompts))
+        if max_model_calls is not None:
+            affordable = max_model_calls // len(eval_inputs) if eval_inputs else len(initial)
+            if affordable < 1:
+                raise ValueError("max_model_calls is too small to evaluate a single initial candidate")
+            if affordable < len(initial):
+                logger.warning(f"Model call budget covers only {affordable} of {len(initial)} initial candidates")
+                initial = initial[:affordable]
+        seen.update(zip(initial, self.evaluate_prompts(initial, eval_inputs, eval_references)))
+        # Stable sort keeps the earlier prompt first on equal scores
+        population = sorted(seen.items(), key=lambda member: -member[1])[:population_size]
+        self._record_generation(0, population, len(initial), start_calls)
+        
+        # Each offspring costs one resampling request plus one inference call per input
+        offspring_cost = 1 + len(eval_inputs)
+        for generation in range(1, generations + 1):
+            count = offspring_per_generation
+            if max_model_calls is not None:
+                remaining = max_model_calls - (self.model_calls - start_calls)
+                count = min(count, remaining // offspring_cost)
+            if count <= 0:
+                logger.info("Model call budget exhausted")
+                break
+            
+            # Near-duplicates of evaluated prompts or of each other are not evaluated
+            offspring = deduplicate_prompts(self._breed(population, count, tournament_size, crossover_rate,
+                                                        max_workers), known=list(seen))
+            if offspring:
+                seen.update(zip(offspring, self.evaluate_prompts(offspring, eval_inputs, eval_references)))
+            population = sorted(population + [(child, seen[child]) for child in offspring],
+                                key=lambda member: -member[1])[:population_size]
+            self._record_generation(generation, population, len(offspring), start_calls)
+        
+        self.best_prompt, self.best_score = population[0]
+        return self.best_prompt, self.best_score
+    
+    def _tournament(self, population: List[Tuple[str, float]], tournament_size: int) -> Tuple[str, float]:
+        """Return the best of ``tournament_size`` randomly drawn population members."""
+        contestants = self.rng.sample(population, min(tournament_size, len(population)))
+        return max(contestants, key=lambda member: member[1])
+    
+    def _breed(self, population: List[Tuple[str, float]], count: int, tournament_size: int,
+               crossover_rate: float, max_workers: int) -> List[str]:
+        """Create offspring; parents are chosen up front so the RNG sequence does not depend on thread timing."""
+        tasks = []
+        for _ in range(count):
+            first = self._tournament(population, tournament_size)
+            if len(population) > 1 and self.rng.random() < crossover_rate:
+                rest = [member for member in population if member is not first]
+                second = self._tournament(rest, tournament_size)
+                tasks.append((self.crossover_prompts, first[0], second[0]))
+            else:
+                tasks.append((self._mutate, first[0]))
+        
+        offspring = []
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, count))) as executor:
+            futures = [executor.submit(task, *parents) for task, *parents in tasks]
+            for future in futures:
+                try:
+                    child = future.result()
+                except Exception as e:
+                    logger.error(f"Error in resampling: {e}")
+                    continue
+                if child:
+                    offspring.append(child)
+        return offspring
+    
+    def _mutate(self, prompt: str) -> str:
+        variations = self.generate_prompt_variations(prompt, 1)
+        return variations[0] if variations else ""
+    
+    def _record_generation(self, generation: int, population: List[Tuple[str, float]], evaluated: int,
+                           start_calls: int):
+        scores = [score for _, score in population]
+        stats = {
+            "generation": generation,
+            "model_calls": self.model_calls - start_calls,
+            "evaluated": evaluated,
+            "best_score": scores[0],
+            "mean_score": sum(scores) / len(scores),
+            "best_prompt": population[0][0],
+        }
+        self.generation_stats.append(stats)
+        logger.info(f"Generation {generation}: best {stats['best_score']:.4f}, mean {stats['mean_score']:.4f}, "
+                    f"{evaluated} evaluated, {stats['model_calls']} model calls")
     
     def generate_formatted_prompt(self, requirement: str) -> str:
         """
@@ -198,6 +521,181 @@ class AutoPromptEngineer:
         return self.best_prompt.replace("{requirement}", requirement)
 
 
+def _iter_json_array(text: str, start: int) -> Iterator[Any]:
+    """
+    Yield the elements of the JSON array opening at ``text[start]`` one by one.
+    
+    Raises ValueError once the array turns out to be malformed or truncated, so
+    callers keep whatever elements were complete before that point.
+    """
+    pos = start + 1
+    first = True
+    while True:
+        pos = _JSON_WHITESPACE.match(text, pos).end()
+        if pos >= len(text):
+            raise ValueError("Unterminated JSON array")
+        if text[pos] == "]":
+            return
+        if not first:
+            if text[pos] != ",":
+                raise ValueError(f"Expected ',' between JSON array elements at position {pos}")
+            pos = _JSON_WHITESPACE.match(text, pos + 1).end()
+        value, pos = _json_decoder.raw_decode(text, pos)
+        yield value
+        first = False
+
+
+def _is_json_line(line: str) -> bool:
+    """Whether a line is a bare non-string JSON value such as ``[1, 2]`` or ``null``."""
+    try:
+        return not isinstance(json.loads(line), str)
+    except ValueError:
+        return False
+
+
+def parse_variations(text: str) -> List[str]:
+    """
+    Extract prompts from a resampling model reply.
+    
+    The first JSON array whose elements are all strings or objects with a string
+    ``prompt`` field is used, so a preamble, code fences or a truncated tail do not
+    matter; an array of usable type with only blank prompts yields no variations.
+    Replies without such an array (``"Here are [3] variations:"``) fall back to one
+    prompt per line, with list markers, bare JSON values and an unnumbered
+    preamble line ending in ``:`` removed.
+    """
+    start = text.find("[")
+    while start != -1:
+        prompts = []
+        usable = True
+        complete = False
+        try:
+            for item in _iter_json_array(text, start):
+                if isinstance(item, dict):
+                    item = item.get("prompt")
+                if not isinstance(item, str):
+                    usable = False
+                    break
+                if item.strip():
+                    prompts.append(item.strip())
+            complete = usable
+        except ValueError:
+            # Keep the elements parsed before a truncated or malformed entry
+            pass
+        if usable and (complete or prompts):
+            if not prompts:
+                logger.warning("Resampling model returned no usable variations")
+            return prompts
+        start = text.find("[", start + 1)
+    
+    logger.warning("Resampling model did not return a JSON array of prompts; parsing variations line by line")
+    prompts = []
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if not stripped or stripped.startswith("```") or _is_json_line(stripped):
+            continue
+        marker = _LIST_MARKER.match(line)
+        if not prompts and not marker and stripped.endswith(":"):
+            # Preamble introducing the list, e.g. "Here are the variations:"
+            continue
+        prompt = line[marker.end():].strip() if marker else stripped
+        if prompt:
+            prompts.append(prompt)
+    return prompts
+
+
+def _ngram_hashes(normalized: str, n: int = 3) -> frozenset:
+    if len(normalized) <= n:
+        return frozenset([zlib.crc32(normalized.encode())])
+    return frozenset(zlib.crc32(normalized[i:i + n].encode()) for i in range(len(normalized) - n + 1))
+
+
+def deduplicate_prompts(prompts: Sequence[str], known: Sequence[str] = (),
+                        threshold: float = NEAR_DUPLICATE_THRESHOLD) -> List[str]:
+    """
+    Drop empty prompts and near-duplicates.
+    
+    Prompts are compared after normalization (case, punctuation and whitespace)
+    by the Jaccard similarity of their hashed character 3-grams; a prompt is kept
+    only if it is below ``threshold`` against every known and every earlier kept prompt.
+    """
+    signatures = [_ngram_hashes(normalize_text(prompt)) for prompt in known]
+    kept = []
+    for prompt in prompts:
+        normalized = normalize_text(prompt)
+        if not normalized:
+            continue
+        signature = _ngram_hashes(normalized)
+        if any(len(signature & other) >= threshold * len(signature | other) for other in signatures):
+            continue
+        signatures.append(signature)
+        kept.append(prompt)
+    return kept
+
+
+def _record_evaluation(state: Dict[str, Any], entry: Dict[str, Any]) -> bool:
+    """Move an evaluated candidate from pending to evaluated; return whether it is the new best."""
+    state["evaluated"].append(entry)
+    state["pending"].remove(entry["prompt"])
+    if state["best_score"] is None or entry["score"] > state["best_score"]:
+        state["best_prompt"] = entry["prompt"]
+        state["best_score"] = entry["score"]
+        return True
+    return False
+
+
+def start_checkpoint(path: str, header: Dict[str, Any]):
+    """
+    Start a checkpoint with the search settings and evaluation data.
+    
+    The checkpoint is a JSON Lines file: this header is written once (to a
+    temporary file renamed over any old checkpoint) and progress records are
+    appended after it by ``append_checkpoint``.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(header, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
+
+
+def append_checkpoint(path: str, record: Dict[str, Any]):
+    """Append one progress record (an evaluated candidate or a new iteration) to a checkpoint."""
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    """Rebuild the search state by replaying a checkpoint written by ``start_checkpoint``."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.read().split("\n")
+    header = json.loads(lines[0])
+    if header.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version: {header.get('version')}")
+    
+    state = {key: header[key] for key in _CHECKPOINT_HEADER_KEYS}
+    state.update(iteration=0, pending=list(header["candidates"]), evaluated=[], history=[],
+                 best_prompt=None, best_score=None, model_calls=0)
+    for number, line in enumerate(lines[1:], 2):
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            if number == len(lines):
+                # The process stopped while appending the last record
+                logger.warning(f"Ignoring incomplete last record in {path}")
+                break
+            raise ValueError(f"Corrupt checkpoint record on line {number} of {path}")
+        if "evaluated" in record:
+            _record_evaluation(state, record["evaluated"])
+        else:
+            state["iteration"] = record["iteration"]
+            state["pending"] = list(record["variations"])
+            state["history"].append({key: record[key] for key in ("iteration", "base_prompt", "variations")})
+        state["model_calls"] = record["model_calls"]
+    return state
+
+
 class DummyModel:
     """A dummy model implementation for demonstration purposes."""
     
@@ -222,11 +720,22 @@ def main():
     """Main function to demonstrate the APE system."""
     parser = argparse.ArgumentParser(description='Automatic Prompt Engineer')
     parser.add_argument('requirement', type=str, nargs='?', help='User requirement for generating a prompt')
+    parser.add_argument('--metric', type=str, choices=['exact_match', 'token_f1', 'rouge_l', 'char_ngram'],
+                        help='Score outputs with a built-in batch metric instead of the dummy scorer')
+    parser.add_argument('--checkpoint', type=str, help='Append optimization progress to this file after every evaluated candidate')
+    parser.add_argument('--resume', type=str, metavar='CHECKPOINT', help='Continue an optimization run from a checkpoint')
+    parser.add_argument('--search', type=str, choices=['greedy', 'evolve'], default='greedy',
+                        help='Resample the single best prompt (greedy) or evolve a population of prompts')
+    parser.add_argument('--budget', type=int, help='Maximum number of model calls for the evolutionary search')
     args = parser.parse_args()
     
     # Initialize models (in a real implementation, these would be actual LLMs)
     inference_model = DummyModel()
-    scoring_model = DummyModel()
+    if args.metric:
+        from batch_metrics import BatchMetricScorer
+        scoring_model = BatchMetricScorer(args.metric)
+    else:
+        scoring_model = DummyModel()
     resampling_model = DummyModel()
     
     # Initialize the APE system
@@ -258,13 +767,24 @@ def main():
             "The ethical implications of AI include concerns about privacy..."
         ]
         
-        best_prompt, best_score = ape.find_optimal_prompt(
-            candidate_prompts, eval_inputs, eval_references
-        )
+        if args.resume:
+            best_prompt, best_score = ape.resume(args.resume)
+        elif args.search == 'evolve':
+            best_prompt, best_score = ape.evolve_prompts(
+                candidate_prompts, eval_inputs, eval_references, max_model_calls=args.budget
+            )
+        else:
+            best_prompt, best_score = ape.find_optimal_prompt(
+                candidate_prompts, eval_inputs, eval_references, checkpoint_path=args.checkpoint
+            )
         
         print("\n=== Optimization Results ===\n")
         print(f"Best Prompt: {best_prompt}")
         print(f"Score: {best_score:.4f}")
+        print(f"Model calls: {ape.model_calls}")
+        for stats in ape.generation_stats:
+            print(f"Generation {stats['generation']}: best {stats['best_score']:.4f}, "
+                  f"mean {stats['mean_score']:.4f}, model calls {stats['model_calls']}")
         
         # Example of generating a prompt with the optimized template
         example_req = "Explain how neural networks work"
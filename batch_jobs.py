@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+离线批处理任务
+把大量提示生成请求打包成OpenAI格式的批处理JSONL文件提交给提供商，
+轮询任务状态，完成后按请求ID取回结果；适合不要求交互延迟的夜间数据集生成
+
+用法:
+    python batch_jobs.py run --input requests.jsonl --output results.jsonl --provider openai --model gpt-4o-mini
+    python batch_jobs.py submit --input requests.jsonl
+    python batch_jobs.py status <batch_id>
+    python batch_jobs.py collect <batch_id> --output results.jsonl
+
+输入文件每行一个请求: {"id": "req-1", "requirement": "...", "format": "coding", ...生成参数}
+"""
+
+import io
+import sys
+import copy
+import json
+import time
+import logging
+import argparse
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Callable
+
+from prompt_engineer import PromptEngineer, GENERATE_METHODS, get_http_session, get_api_key
+
+logger = logging.getLogger(__name__)
+
+CHAT_COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+DEFAULT_POLL_INTERVAL = 30.0
+MAX_POLL_INTERVAL = 300.0
+
+
+def build_chat_request(engineer: PromptEngineer, item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    用PromptEngineer的generate_*方法构造单个请求的chat completion请求体（不发起调用）
+
+    Raises:
+        ValueError: 缺少需求、格式不支持或请求超出token预算
+    """
+    requirement = item.get("requirement")
+    if not requirement:
+        raise ValueError(f"请求 {item.get('id')} 缺少requirement")
+    format_name = item.get("format", "standard")
+    if format_name not in GENERATE_METHODS:
+        raise ValueError(f"请求 {item.get('id')} 的格式不支持: {format_name}")
+
+    method_name, option_names = GENERATE_METHODS[format_name]
+    kwargs = {name: item[name] for name in option_names if name in item}
+    for name in ("temperature", "max_tokens"):
+        if name in item:
+            kwargs[name] = item[name]
+    if format_name == "examples":
+        kwargs.setdefault("examples", [])
+
+    captured: Dict[str, Any] = {}
+
+    def capture(messages, temperature=0.7, max_tokens=1000):
+        captured["body"] = {
+            "model": engineer.model_name,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": engineer.token_budget.fit_max_tokens(messages, max_tokens),
+        }
+        return ""
+
+    # 在副本上替换_call_api，只记录请求体
+    recorder = copy.copy(engineer)
+    recorder._call_api = capture
+    getattr(recorder, method_name)(requirement, **kwargs)
+    return captured["body"]
+
+
+def build_batch_lines(engineer: PromptEngineer, items: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """逐行生成批处理输入文件（custom_id即请求ID，必须唯一）"""
+    seen = set()
+    for line_number, item in enumerate(items, 1):
+        custom_id = str(item.get("id") or f"request-{line_number}")
+        if custom_id in seen:
+            raise ValueError(f"请求ID重复: {custom_id}")
+        seen.add(custom_id)
+        yield json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": CHAT_COMPLETIONS_ENDPOINT,
+            "body": build_chat_request(engineer, item),
+        }, ensure_ascii=False) + "\n"
+
+
+def _error_message(error: Any) -> str:
+    """提供商返回的错误可能是 {"message": ...} 对象，也可能直接是字符串"""
+    if isinstance(error, dict):
+        return str(error.get("message") or error)
+    return str(error)
+
+
+def parse_batch_results(output_text: str, error_text: str = "") -> Dict[str, Dict[str, Any]]:
+    """把批处理输出文件和错误文件映射为 {请求ID: {"prompt", "error"}}"""
+    results: Dict[str, Dict[str, Any]] = {}
+    for line in (output_text + "\n" + error_text).splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        custom_id = record.get("custom_id")
+        response = record.get("response") or {}
+        if record.get("error"):
+            results[custom_id] = {"prompt": None, "error": _error_message(record["error"])}
+        elif response.get("status_code") != 200:
+            body = response.get("body") or {}
+            message = _error_message(body["error"]) if body.get("error") else f"HTTP {response.get('status_code')}"
+            results[custom_id] = {"prompt": None, "error": message}
+        else:
+            results[custom_id] = {"prompt": response["body"]["choices"][0]["message"]["content"], "error": None}
+    return results
+
+
+class BatchAPIClient:
+    """OpenAI风格批处理接口客户端（共享PromptEngineer的HTTP连接池）"""
+
+    def __init__(self, api_key: str, api_base: str = "https://api.openai.com/v1", timeout: float = 60.0):
+        if not api_key:
+            raise ValueError("批处理模式需要API密钥")
+        self.api_base = api_base.rstrip("/")
+        self.timeout = timeout
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.session = get_http_session()
+
+    def _request(self, method: str, path: str, **kwargs):
+        response = self.session.request(method, self.api_base + path, headers=self.headers,
+                                        timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def upload_batch_file(self, content: bytes, filename: str = "batch_input.jsonl") -> str:
+        """上传批处理输入文件，返回文件ID"""
+        response = self._request("POST", "/files", data={"purpose": "batch"},
+                                 files={"file": (filename, io.BytesIO(content), "application/jsonl")})
+        return response.json()["id"]
+
+    def create_batch(self, input_file_id: str, completion_window: str = "24h",
+                     metadata: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """创建批处理任务"""
+        payload = {"input_file_id": input_file_id, "endpoint": CHAT_COMPLETIONS_ENDPOINT,
+                   "completion_window": completion_window}
+        if metadata:
+            payload["metadata"] = metadata
+        return self._request("POST", "/batches", json=payload).json()
+
+    def get_batch(self, batch_id: str) -> Dict[str, Any]:
+        """查询批处理任务"""
+        return self._request("GET", f"/batches/{batch_id}").json()
+
+    def download_file(self, file_id: str) -> str:
+        """下载输出或错误文件内容"""
+        return self._request("GET", f"/files/{file_id}/content").content.decode("utf-8")
+
+    def wait_for_batch(self, batch_id: str, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                       timeout: Optional[float] = None,
+                       on_status: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        轮询直到任务结束（轮询间隔逐步放宽到 MAX_POLL_INTERVAL）
+
+        Raises:
+            TimeoutError: 超过timeout秒仍未结束
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        interval = poll_interval
+        while True:
+            batch = self.get_batch(batch_id)
+            if on_status:
+                on_status(batch)
+            if batch["status"] in TERMINAL_STATUSES:
+                return batch
+            if deadline is not None and time.monotonic() + interval > deadline:
+                raise TimeoutError(f"批处理任务 {batch_id} 在 {timeout} 秒内未完成（状态: {batch['status']}）")
+            time.sleep(interval)
+            interval = min(interval * 1.5, max(poll_interval, MAX_POLL_INTERVAL))
+
+
+class OfflineBatchJob:
+    """把PromptEngineer的生成请求作为提供商批处理任务提交和取回"""
+
+    def __init__(self, engineer: PromptEngineer, client: Optional[BatchAPIClient] = None):
+        self.engineer = engineer
+        self.client = client or BatchAPIClient(
+            engineer.api_key, engineer.base_url.rsplit("/chat/completions", 1)[0]
+        )
+
+    def submit(self, items: Iterable[Dict[str, Any]], metadata: Optional[Dict[str, str]] = None,
+               completion_window: str = "24h") -> Dict[str, Any]:
+        """构造并上传批处理文件，创建任务并返回任务信息"""
+        content = "".join(build_batch_lines(self.engineer, items)).encode("utf-8")
+        if not content:
+            raise ValueError("没有可提交的请求")
+        file_id = self.client.upload_batch_file(content)
+        batch = self.client.create_batch(file_id, completion_window, metadata)
+        logger.info(f"已提交批处理任务 {batch['id']}（输入文件 {file_id}）")
+        return batch
+
+    def collect(self, batch: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """下载已结束任务的结果"""
+        if batch["status"] != "completed":
+            raise RuntimeError(f"批处理任务 {batch['id']} 未成功完成（状态: {batch['status']}）")
+        output_text = self.client.download_file(batch["output_file_id"]) if batch.get("output_file_id") else ""
+        error_text = self.client.download_file(batch["error_file_id"]) if batch.get("error_file_id") else ""
+        return parse_batch_results(output_text, error_text)
+
+    def run(self, items: Iterable[Dict[str, Any]], poll_interval: float = DEFAULT_POLL_INTERVAL,
+            timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """提交、等待并按输入顺序返回每个请求的结果"""
+        items = list(items)
+        batch = self.submit(items)
+        batch = self.client.wait_for_batch(batch["id"], poll_interval, timeout)
+        results = self.collect(batch)
+        ordered = []
+        for line_number, item in enumerate(items, 1):
+            custom_id = str(item.get("id") or f"request-{line_number}")
+            result = results.get(custom_id, {"prompt": None, "error": "批处理结果中缺少该请求"})
+            ordered.append({"id": custom_id, **result})
+        return ordered
+
+
+def _read_items(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _write_results(results: Iterable[Dict[str, Any]], path: Optional[str]):
+    output = open(path, "w", encoding="utf-8") if path else sys.stdout
+    try:
+        for result in results:
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+    finally:
+        if path:
+            output.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="提示生成离线批处理任务")
+    parser.add_argument("command", choices=["run", "submit", "status", "collect"], help="操作")
+    parser.add_argument("batch_id", nargs="?", help="批处理任务ID（status/collect）")
+    parser.add_argument("--input", help="请求JSONL文件（run/submit）")
+    parser.add_argument("--output", help="结果JSONL文件，默认输出到标准输出")
+    parser.add_argument("--provider", default="openai", choices=["openai", "deepseek"], help="API提供商")
+    parser.add_argument("--model", default="gpt-4o-mini", help="模型名称")
+    parser.add_argument("--api-key", help="API密钥，默认自动获取")
+    parser.add_argument("--api-base", help="覆盖API根地址（如本地模拟服务器 http://127.0.0.1:8001/v1）")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL, help="轮询间隔（秒）")
+    parser.add_argument("--timeout", type=float, help="等待任务完成的超时（秒）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    api_key = args.api_key or get_api_key(args.provider)
+    engineer = PromptEngineer(api_key=api_key, model_name=args.model, api_provider=args.provider)
+    client = BatchAPIClient(api_key, args.api_base or engineer.base_url.rsplit("/chat/completions", 1)[0])
+    job = OfflineBatchJob(engineer, client)
+
+    if args.command in ("run", "submit"):
+        if not args.input:
+            parser.error(f"{args.command} 需要 --input")
+        items = _read_items(args.input)
+        if args.command == "submit":
+            batch = job.submit(items)
+            print(f"已提交批处理任务: {batch['id']}（{len(items)} 个请求）")
+        else:
+            _write_results(job.run(items, args.poll_interval, args.timeout), args.output)
+    else:
+        if not args.batch_id:
+            parser.error(f"{args.command} 需要批处理任务ID")
+        batch = client.get_batch(args.batch_id)
+        if args.command == "status":
+            counts = batch.get("request_counts", {})
+            print(f"{batch['id']}: {batch['status']}（完成 {counts.get('completed', 0)}/{counts.get('total', 0)}，"
+                  f"失败 {counts.get('failed', 0)}）")
+        else:
+            results = job.collect(batch)
+            _write_results(({"id": custom_id, **result} for custom_id, result in results.items()), args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Batch scoring metrics for AutoPromptEngineer.
+
+Each metric scores every (generated, reference) pair of a candidate in one
+call using NumPy over the whole batch instead of building Python sets per pair.
+Scorers implement both ``score`` and ``score_batch`` so they can be passed as
+the ``scoring_model`` of an AutoPromptEngineer.
+"""
+
+import re
+import unicodedata
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+_CJK = "぀-ヿ㐀-䶿一-鿿가-힯"
+# Single characters for CJK, otherwise runs of anything but whitespace (letters of any
+# script together with their combining marks, digits and underscores)
+_TOKEN = re.compile(rf"[{_CJK}]|[^\s{_CJK}]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class _PunctuationTable(dict):
+    """str.translate table mapping Unicode punctuation and symbols (except "_") to spaces, filled lazily."""
+
+    def __missing__(self, code: int) -> int:
+        value = 32 if code != 95 and unicodedata.category(chr(code))[0] in "PS" else code
+        self[code] = value
+        return value
+
+
+_PUNCTUATION = _PunctuationTable()
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, NFKC-normalize, drop punctuation and symbols and collapse whitespace."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    return _WHITESPACE.sub(" ", text.translate(_PUNCTUATION)).strip()
+
+
+def tokenize(text: str) -> List[str]:
+    """Words for alphabetic scripts, single characters for CJK."""
+    return _TOKEN.findall(normalize_text(text))
+
+
+def _check_lengths(generated: Sequence[str], references: Sequence[str]):
+    if len(generated) != len(references):
+        raise ValueError("Number of generated outputs must match references")
+
+
+def _encode_batch(sequences: List[List]) -> Tuple[np.ndarray, np.ndarray]:
+    """Map items to dense integer ids shared across the batch; returns (ids, owning sequence index)."""
+    vocabulary: Dict = {}
+    ids = [vocabulary.setdefault(item, len(vocabulary)) for sequence in sequences for item in sequence]
+    owners = np.repeat(np.arange(len(sequences)), [len(sequence) for sequence in sequences])
+    return np.asarray(ids, dtype=np.int64), owners
+
+
+def _overlap_f1(generated: List[List], references: List[List]) -> np.ndarray:
+    """Multiset-overlap F1 for every pair, computed with one sort over the whole batch."""
+    count = len(generated)
+    ids, owners = _encode_batch(generated + references)
+    vocab_size = int(ids.max()) + 1 if len(ids) else 1
+    split = sum(len(sequence) for sequence in generated)
+
+    # Key each item by (pair, item id); counts per key come from a single np.unique per side
+    generated_keys, generated_counts = np.unique(owners[:split] * vocab_size + ids[:split], return_counts=True)
+    reference_keys, reference_counts = np.unique((owners[split:] - count) * vocab_size + ids[split:],
+                                                 return_counts=True)
+    shared, generated_index, reference_index = np.intersect1d(generated_keys, reference_keys,
+                                                              assume_unique=True, return_indices=True)
+    overlap = np.bincount(shared // vocab_size,
+                          weights=np.minimum(generated_counts[generated_index], reference_counts[reference_index]),
+                          minlength=count)
+
+    generated_lengths = np.array([len(sequence) for sequence in generated], dtype=np.float64)
+    reference_lengths = np.array([len(sequence) for sequence in references], dtype=np.float64)
+    return _f1(overlap, generated_lengths, reference_lengths)
+
+
+def _f1(overlap: np.ndarray, generated_lengths: np.ndarray, reference_lengths: np.ndarray) -> np.ndarray:
+    """F1 from overlap counts; two empty sequences match perfectly, one empty sequence scores 0."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(generated_lengths > 0, overlap / generated_lengths, 0.0)
+        recall = np.where(reference_lengths > 0, overlap / reference_lengths, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return np.where((generated_lengths == 0) & (reference_lengths == 0), 1.0, f1)
+
+
+def exact_match(generated: Sequence[str], references: Sequence[str]) -> np.ndarray:
+    """1.0 where the normalized texts are identical."""
+    _check_lengths(generated, references)
+    if not generated:
+        return np.zeros(0)
+    left = np.array([normalize_text(text) for text in generated], dtype=object)
+    right = np.array([normalize_text(text) for text in references], dtype=object)
+    return (left == right).astype(np.float64)
+
+
+def token_f1(generated: Sequence[str], references: Sequence[str]) -> np.ndarray:
+    """SQuAD-style bag-of-tokens F1."""
+    _check_lengths(generated, references)
+    if not generated:
+        return np.zeros(0)
+    return _overlap_f1([tokenize(text) for text in generated], [tokenize(text) for text in references])
+
+
+def char_ngram_similarity(generated: Sequence[str], references: Sequence[str], n: int = 3) -> np.ndarray:
+    """F1 over character n-gram multisets of the normalized texts (texts shorter than n use the whole text)."""
+    _check_lengths(generated, references)
+    if not generated:
+        return np.zeros(0)
+
+    def ngrams(text: str) -> List[str]:
+        text = normalize_text(text)
+        if len(text) <= n:
+            return [text] if text else []
+        return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+    return _overlap_f1([ngrams(text) for text in generated], [ngrams(text) for text in references])
+
+
+def rouge_l(generated: Sequence[str], references: Sequence[str]) -> np.ndarray:
+    """
+    ROUGE-L F1 (longest common token subsequence).
+
+    The LCS dynamic program runs for all pairs at once: each step advances one
+    generated token across a (pairs x reference length) matrix, and the
+    row-wise recurrence is resolved with a cumulative maximum.
+    """
+    _check_lengths(generated, references)
+    count = len(generated)
+    if not count:
+        return np.zeros(0)
+    generated_tokens = [tokenize(text) for text in generated]
+    reference_tokens = [tokenize(text) for text in references]
+    ids, owners = _encode_batch(generated_tokens + reference_tokens)
+
+    generated_lengths = np.array([len(tokens) for tokens in generated_tokens])
+    reference_lengths = np.array([len(tokens) for tokens in reference_tokens])
+    # Padding values never match each other or real tokens
+    generated_matrix = np.full((count, max(generated_lengths.max(), 1)), -1, dtype=np.int64)
+    reference_matrix = np.full((count, max(reference_lengths.max(), 1)), -2, dtype=np.int64)
+    split = int(generated_lengths.sum())
+    generated_matrix[owners[:split], _positions(generated_lengths)] = ids[:split]
+    reference_matrix[owners[split:] - count, _positions(reference_lengths)] = ids[split:]
+
+    previous = np.zeros((count, reference_matrix.shape[1] + 1), dtype=np.int32)
+    for column in range(generated_matrix.shape[1]):
+        match = generated_matrix[:, column, None] == reference_matrix
+        candidate = np.maximum(previous[:, 1:], np.where(match, previous[:, :-1] + 1, 0))
+        previous[:, 1:] = np.maximum.accumulate(candidate, axis=1)
+    lcs = previous[:, -1].astype(np.float64)
+    return _f1(lcs, generated_lengths.astype(np.float64), reference_lengths.astype(np.float64))
+
+
+def _positions(lengths: np.ndarray) -> np.ndarray:
+    """Position of every item within its own sequence, for sequences laid out back to back."""
+    starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.arange(int(lengths.sum())) - starts
+
+
+BATCH_METRICS: Dict[str, Callable[[Sequence[str], Sequence[str]], np.ndarray]] = {
+    "exact_match": exact_match,
+    "token_f1": token_f1,
+    "rouge_l": rouge_l,
+    "char_ngram": char_ngram_similarity,
+}
+
+
+class BatchMetricScorer:
+    """Scoring model backed by one of the built-in batch metrics."""
+
+    def __init__(self, metric: str = "token_f1"):
+        if metric not in BATCH_METRICS:
+            raise ValueError(f"Unknown metric: {metric}. Available: {', '.join(BATCH_METRICS)}")
+        self.metric = metric
+        self._metric_fn = BATCH_METRICS[metric]
+
+    def score(self, generated: str, reference: str) -> float:
+        return float(self._metric_fn([generated], [reference])[0])
+
+    def score_batch(self, generated_list: Sequence[str], references: Sequence[str]) -> List[float]:
+        return self._metric_fn(generated_list, references).tolist()
@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""
+提示生成全链路基准测试
+在本机启动OpenAI兼容模拟服务器（可配置首字延迟、生成速度、输出长度和错误率），
+以不同并发度驱动 PromptEngineer（同步/异步/批处理）、流式接口、
+AutoPromptEngineer.find_optimal_prompt 和 HTTP 服务，报告吞吐、延迟分位数和内存
+
+用法:
+    python benchmarks/bench_generation_stack.py
+    python benchmarks/bench_generation_stack.py --requests 500 --concurrency 1,16,64 --latency 0.05 \\
+        --token-rate 200 --output-tokens 100 --scenarios sync,async,service --json results.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import resource
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Callable, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_openai_server import MockOpenAIServer
+from prompt_engineer import PromptEngineer, get_http_session
+from auto_prompt_engineer import AutoPromptEngineer
+from batch_jobs import OfflineBatchJob, BatchAPIClient, build_chat_request
+from prompt_service import create_server
+
+SCENARIOS = ("sync", "async", "stream", "batch", "ape", "service")
+MODEL = "gpt-4o-mini"
+API_KEY = "sk-bench"
+
+
+def percentile(sorted_values: List[float], percent: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100))]
+
+
+def peak_rss_mb() -> float:
+    """进程峰值常驻内存（MB，含同进程内的模拟服务器）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(scenario: str, concurrency: int, latencies: List[float], wall: float, errors: int,
+              extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    to_ms = lambda value: round(value * 1000, 2) if value is not None else None
+    result = {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / wall, 1) if wall > 0 else None,
+        "p50_ms": to_ms(percentile(latencies, 50)),
+        "p95_ms": to_ms(percentile(latencies, 95)),
+        "p99_ms": to_ms(percentile(latencies, 99)),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    result.update(extra or {})
+    return result
+
+
+def run_threaded(call: Callable[[int], bool], total: int, concurrency: int):
+    """用concurrency个线程执行total次调用，返回 (各次延迟, 总耗时, 失败次数)"""
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def timed_call(index: int):
+        nonlocal errors
+        start = time.perf_counter()
+        ok = call(index)
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            errors += not ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(timed_call, range(total)))
+    return latencies, time.perf_counter() - start, errors
+
+
+def is_live_completion(text: str) -> bool:
+    """模拟服务器的回复以 [模型名] 开头；请求失败时PromptEngineer回退为本地模拟回复"""
+    return text.startswith(f"[{MODEL}]")
+
+
+def requirement(run_id: str, index: int) -> str:
+    # 每个请求的需求都不同，避免并发请求合并影响结果
+    return f"创建一个排序函数（{run_id}-{index}）"
+
+
+def bench_sync(engineer: PromptEngineer, total: int, concurrency: int) -> Dict[str, Any]:
+    run_id = f"sync{concurrency}"
+    call = lambda index: is_live_completion(engineer.generate_coding_prompt(requirement(run_id, index)))
+    return summarize("sync", concurrency, *run_threaded(call, total, concurrency))
+
+
+def bench_async(engineer: PromptEngineer, total: int, concurrency: int) -> Dict[str, Any]:
+    run_id = f"async{concurrency}"
+    bodies = [build_chat_request(engineer, {"requirement": requirement(run_id, index), "format": "coding"})
+              for index in range(total)]
+
+    async def run():
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies: List[float] = []
+        errors = 0
+
+        async def one(body):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                text = await engineer._call_api_async(body["messages"], body["temperature"], body["max_tokens"])
+                latencies.append(time.perf_counter() - start)
+                errors += not is_live_completion(text)
+
+        loop = asyncio.get_running_loop()
+        # 阻塞请求在默认线程池中执行，线程数需要覆盖并发度
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency))
+        start = time.perf_counter()
+        await asyncio.gather(*(one(body) for body in bodies))
+        return latencies, time.perf_counter() - start, errors
+
+    return summarize("async", concurrency, *asyncio.run(run()))
+
+
+def bench_stream(api_base: str, total: int, concurrency: int) -> Dict[str, Any]:
+    """直接请求流式接口，额外统计首个token的延迟（TTFT）"""
+    session = get_http_session()
+    first_token: List[float] = []
+    lock = threading.Lock()
+
+    def call(index: int) -> bool:
+        start = time.perf_counter()
+        response = session.post(
+            api_base + "/chat/completions", timeout=60, stream=True,
+            headers={"Authorization": f"Bearer {API_KEY}"},
+            json={"model": MODEL, "stream": True,
+                  "messages": [{"role": "user", "content": requirement("stream", index)}]},
+        )
+        if response.status_code != 200:
+            response.close()
+            return False
+        seen_first = False
+        for line in response.iter_lines():
+            if not line.startswith(b"data: ") or line == b"data: [DONE]":
+                continue
+            delta = json.loads(line[6:])["choices"][0]["delta"]
+            if delta.get("content") and not seen_first:
+                seen_first = True
+                with lock:
+                    first_token.append(time.perf_counter() - start)
+        return seen_first
+
+    latencies, wall, errors = run_threaded(call, total, concurrency)
+    first_token.sort()
+    ttft = lambda percent: round(percentile(first_token, percent) * 1000, 2) if first_token else None
+    return summarize("stream", concurrency, latencies, wall, errors,
+                     {"ttft_p50_ms": ttft(50), "ttft_p95_ms": ttft(95)})
+
+
+def bench_batch(engineer: PromptEngineer, api_base: str, total: int) -> Dict[str, Any]:
+    """整批提交到批处理接口；延迟即整批从提交到取回结果的耗时"""
+    job = OfflineBatchJob(engineer, BatchAPIClient(API_KEY, api_base))
+    items = [{"id": f"req-{index}", "requirement": requirement("batch", index), "format": "coding"}
+             for index in range(total)]
+    start = time.perf_counter()
+    results = job.run(items, poll_interval=0.05, timeout=600)
+    wall = time.perf_counter() - start
+    errors = sum(1 for result in results if result["error"] or not is_live_completion(result["prompt"]))
+    result = summarize("batch", 1, [wall], wall, errors)
+    result.update(requests=total, rps=round(total / wall, 1))
+    return result
+
+
+class ChatModel:
+    """把PromptEngineer的API调用适配为AutoPromptEngineer需要的 generate/score 接口"""
+
+    def __init__(self, engineer: PromptEngineer):
+        self.engineer = engineer
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt: str) -> str:
+        with self._lock:
+            self.calls += 1
+        return self.engineer._call_api([{"role": "user", "content": prompt}], temperature=0.7, max_tokens=256)
+
+    def score(self, generated: str, reference: str) -> float:
+        """本地词重叠率，不额外调用模型"""
+        generated_words, reference_words = set(generated.lower().split()), set(reference.lower().split())
+        return len(generated_words & reference_words) / max(len(reference_words), 1)
+
+
+class BatchChatModel(ChatModel):
+    """实现generate_batch：一批提示并发请求"""
+
+    def __init__(self, engineer: PromptEngineer, concurrency: int):
+        super().__init__(engineer)
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+    def generate_batch(self, prompts: List[str]) -> List[str]:
+        return list(self.executor.map(self.generate, prompts))
+
+
+def bench_ape(engineer: PromptEngineer, iterations: int, concurrency: int = 1) -> Dict[str, Any]:
+    """一次完整的find_optimal_prompt搜索；并发度大于1时推理模型以generate_batch并发执行，吞吐按模型调用次数计算"""
+    model = BatchChatModel(engineer, concurrency) if concurrency > 1 else ChatModel(engineer)
+    ape = AutoPromptEngineer(model, model, model, inference_batch_size=max(concurrency, 1))
+    ape.set_demonstration_pairs([("Create a poem about stars", "Stars shine bright in the night sky...")])
+    candidates = [f"Candidate {index}: answer the following carefully: {{requirement}}" for index in range(5)]
+    eval_inputs = [f"Question {index} about sorting algorithms" for index in range(5)]
+    references = [f"Mock completion for sorting answer {index}" for index in range(5)]
+
+    start = time.perf_counter()
+    ape.find_optimal_prompt(candidates, eval_inputs, references, iterations=iterations, variations_per_iter=3)
+    wall = time.perf_counter() - start
+    if isinstance(model, BatchChatModel):
+        model.executor.shutdown()
+    result = summarize("ape", concurrency, [wall], wall, 0)
+    result.update(requests=model.calls, rps=round(model.calls / wall, 1))
+    return result
+
+
+def bench_service(service_url: str, total: int, concurrency: int) -> Dict[str, Any]:
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_maxsize=concurrency))
+    run_id = f"service{concurrency}"
+
+    def call(index: int) -> bool:
+        response = session.post(service_url + "/generate", timeout=60, json={
+            "requirement": requirement(run_id, index), "format": "coding", "provider": "openai", "model": MODEL,
+        })
+        return response.status_code == 200 and is_live_completion(response.json()["prompt"])
+
+    try:
+        return summarize("service", concurrency, *run_threaded(call, total, concurrency))
+    finally:
+        session.close()
+
+
+def print_table(results: List[Dict[str, Any]]):
+    columns = ["scenario", "concurrency", "requests", "errors", "rps", "p50_ms", "p95_ms", "p99_ms",
+               "ttft_p50_ms", "peak_rss_mb"]
+    widths = [max(len(column), *(len(str(result.get(column, ""))) for result in results)) for column in columns]
+    print("  ".join(column.rjust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result.get(column) if result.get(column) is not None else "-").rjust(width)
+                        for column, width in zip(columns, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="提示生成全链路基准测试")
+    parser.add_argument("--requests", type=int, default=200, help="每个场景每个并发度的请求数")
+    parser.add_argument("--concurrency", default="1,8,32", help="逗号分隔的并发度")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"逗号分隔的场景: {','.join(SCENARIOS)}")
+    parser.add_argument("--latency", type=float, default=0.02, help="模拟服务器首字延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=2000.0, help="模拟服务器每秒生成的token数")
+    parser.add_argument("--output-tokens", type=int, default=64, help="模拟回复的token数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务器返回500的比例")
+    parser.add_argument("--ape-iterations", type=int, default=2, help="find_optimal_prompt的优化轮数")
+    parser.add_argument("--seed", type=int, default=0, help="错误注入的随机种子")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+    concurrency_levels = [int(value) for value in args.concurrency.split(",")]
+
+    random.seed(args.seed)
+    for name in ("prompt_engineer", "auto_prompt_engineer", "batch_jobs", "prompt_service"):
+        logging.getLogger(name).setLevel(logging.CRITICAL)
+    # HTTP服务通过常规的密钥查找获取密钥
+    os.environ["OPENAI_API_KEY"] = API_KEY
+
+    results: List[Dict[str, Any]] = []
+    with MockOpenAIServer(latency=args.latency, token_rate=args.token_rate, output_tokens=args.output_tokens,
+                          error_rate=args.error_rate, batch_delay=0.05) as mock:
+        engineer = PromptEngineer(api_key=API_KEY, model_name=MODEL, base_url=mock.api_base + "/chat/completions")
+        engineer.generate_coding_prompt("预热")
+
+        service = None
+        if "service" in scenarios:
+            service = create_server(port=0, workers=max(concurrency_levels), max_queue=args.requests,
+                                    base_url=mock.api_base + "/chat/completions")
+            threading.Thread(target=service.serve_forever, daemon=True).start()
+        try:
+            for scenario in scenarios:
+                if scenario == "batch":
+                    results.append(bench_batch(engineer, mock.api_base, args.requests))
+                elif scenario == "ape":
+                    for concurrency in sorted({1, max(concurrency_levels)}):
+                        results.append(bench_ape(engineer, args.ape_iterations, concurrency))
+                else:
+                    for concurrency in concurrency_levels:
+                        if scenario == "sync":
+                            results.append(bench_sync(engineer, args.requests, concurrency))
+                        elif scenario == "async":
+                            results.append(bench_async(engineer, args.requests, concurrency))
+                        elif scenario == "stream":
+                            results.append(bench_stream(mock.api_base, args.requests, concurrency))
+                        else:
+                            host, port = service.server_address[:2]
+                            results.append(bench_service(f"http://{host}:{port}", args.requests, concurrency))
+                print(f"完成: {scenario}", file=sys.stderr)
+        finally:
+            if service is not None:
+                service.shutdown()
+                service.server_close()
+                service.service.shutdown()
+
+    print(f"模拟服务器: 首字延迟 {args.latency}s，{args.token_rate:g} token/s，"
+          f"回复 {args.output_tokens} token，错误率 {args.error_rate:.0%}")
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+PromptEngineer 构造开销基准测试
+对比每次新建SecureAPIManager解析密钥与使用进程内密钥缓存的耗时
+
+用法: python benchmarks/bench_prompt_engineer_init.py [--iterations 2000]
+"""
+
+import os
+import sys
+import timeit
+import argparse
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import secure_api_manager
+from secure_api_manager import SecureAPIManager
+import prompt_engineer
+from prompt_engineer import PromptEngineer
+
+def uncached_get_api_key(provider: str):
+    """旧实现：每次调用都新建管理器并重新读取配置文件"""
+    return SecureAPIManager().get_api_key(provider)
+
+def measure(iterations: int, repeat: int = 5) -> float:
+    """返回单次构造的最佳耗时（微秒）"""
+    timer = timeit.Timer(lambda: PromptEngineer(api_provider="deepseek", model_name="deepseek-chat"))
+    return min(timer.repeat(repeat=repeat, number=iterations)) / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description="PromptEngineer构造开销基准测试")
+    parser.add_argument("--iterations", type=int, default=2000, help="每轮构造次数")
+    args = parser.parse_args()
+    
+    # 构造时的"未找到密钥"警告会淹没输出
+    logging.getLogger("prompt_engineer").setLevel(logging.ERROR)
+    
+    original = prompt_engineer.get_api_key
+    try:
+        prompt_engineer.get_api_key = uncached_get_api_key
+        uncached = measure(args.iterations)
+        prompt_engineer.get_api_key = secure_api_manager.get_api_key
+        secure_api_manager.clear_api_key_cache()
+        cached = measure(args.iterations)
+    finally:
+        prompt_engineer.get_api_key = original
+    
+    print(f"PromptEngineer() 构造耗时（{args.iterations} 次取最优）")
+    print(f"  每次新建管理器: {uncached:8.1f} µs")
+    print(f"  进程内密钥缓存: {cached:8.1f} µs")
+    print(f"  加速比:         {uncached / cached:8.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Few-shot示例检索索引
+对示例输入做本地向量化（哈希词袋 + 中文字符二元组），按需求检索最相关的top-k个示例，
+索引持久化到磁盘（只保存示例序号，不复制示例内容），示例文件未变化时不重新读取，
+追加新示例时只对新增部分建索引
+"""
+
+import os
+import re
+import json
+import zlib
+import hashlib
+import logging
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+import numpy as np
+
+from examples_loader import iter_examples
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+DEFAULT_FEATURES = 1 << 18
+DEFAULT_TOP_K = 5
+
+_CJK_RUN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]+")
+_WORD = re.compile(r"[a-z0-9_]+")
+
+
+def _tokenize(text: str) -> List[str]:
+    """英文按单词切分，中日韩文本取单字和相邻二元组"""
+    text = text.lower()
+    tokens = _WORD.findall(text)
+    for run in _CJK_RUN.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _example_digest(example: Dict[str, Any]) -> bytes:
+    """示例内容摘要，用于判断示例文件是否只是追加了新示例"""
+    payload = json.dumps([example.get("input", ""), example.get("output", "")], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).digest()[:8]
+
+
+class ExampleIndex:
+    """
+    示例检索索引
+
+    文档向量为L2归一化的对数词频，IDF在查询时按当前文档频率计算，
+    因此追加示例不需要重算已有向量。特征以 (特征ID, 文档ID, 权重) 三元组存储，
+    查询时按特征排序后二分定位倒排区间。文档ID即示例在示例文件中的序号，
+    从磁盘加载的索引在返回结果时才从示例文件读取对应的示例
+    """
+
+    def __init__(self, n_features: int = DEFAULT_FEATURES):
+        self.n_features = n_features
+        # 内存中的示例；为None时按序号从source指向的示例文件读取
+        self._examples: Optional[List[Dict[str, Any]]] = []
+        self.source: Optional[str] = None
+        self.source_stamp: Tuple[int, int] = (-1, -1)
+        self.digests: List[bytes] = []
+        self.doc_freq = np.zeros(n_features, dtype=np.int32)
+        self._features = np.zeros(0, dtype=np.int32)
+        self._doc_ids = np.zeros(0, dtype=np.int32)
+        self._weights = np.zeros(0, dtype=np.float32)
+        self._sorted = True
+
+    def __len__(self) -> int:
+        return len(self.digests)
+
+    @property
+    def examples(self) -> List[Dict[str, Any]]:
+        """全部示例（从磁盘加载的索引会读取整个示例文件）"""
+        return self._get_examples(range(len(self)))
+
+    def _get_examples(self, ids: Sequence[int]) -> List[Dict[str, Any]]:
+        """按序号获取示例；示例不在内存中时只读取示例文件到最大序号为止"""
+        if self._examples is not None:
+            return [self._examples[i] for i in ids]
+        if not len(ids):
+            return []
+        wanted = set(int(i) for i in ids)
+        found = {}
+        for position, example in enumerate(iter_examples(self.source, limit=max(wanted) + 1)):
+            if position in wanted:
+                found[position] = example
+        return [found[int(i)] for i in ids]
+
+    def _vectorize(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """返回 (特征ID数组, 归一化权重数组)"""
+        tokens = _tokenize(text)
+        if not tokens:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.float32)
+        hashed = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in tokens),
+                             dtype=np.int64, count=len(tokens)) & (self.n_features - 1)
+        features, counts = np.unique(hashed.astype(np.int32), return_counts=True)
+        weights = (1.0 + np.log(counts)).astype(np.float32)
+        weights /= np.linalg.norm(weights)
+        return features, weights
+
+    def add(self, examples: Sequence[Dict[str, Any]]):
+        """追加示例（只对新示例做向量化）"""
+        if not examples:
+            return
+        if self._examples is None:
+            self._examples = self._get_examples(range(len(self)))
+        start = len(self)
+        new_features, new_doc_ids, new_weights = [], [], []
+        for offset, example in enumerate(examples):
+            features, weights = self._vectorize(str(example.get("input", "")))
+            new_features.append(features)
+            new_doc_ids.append(np.full(len(features), start + offset, dtype=np.int32))
+            new_weights.append(weights)
+            self.doc_freq[features] += 1
+            self._examples.append(example)
+            self.digests.append(_example_digest(example))
+
+        self._features = np.concatenate([self._features] + new_features)
+        self._doc_ids = np.concatenate([self._doc_ids] + new_doc_ids)
+        self._weights = np.concatenate([self._weights] + new_weights)
+        self._sorted = False
+
+    def _ensure_sorted(self):
+        if not self._sorted:
+            order = np.argsort(self._features, kind="stable")
+            self._features = self._features[order]
+            self._doc_ids = self._doc_ids[order]
+            self._weights = self._weights[order]
+            self._sorted = True
+
+    def search(self, query: str, top_k: int = DEFAULT_TOP_K) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        检索与需求最相关的示例
+
+        Returns:
+            按相关度降序排列的 (分数, 示例) 列表；没有任何共同特征时返回空列表
+        """
+        if not len(self) or top_k <= 0:
+            return []
+        self._ensure_sorted()
+
+        features, weights = self._vectorize(query)
+        idf = np.log((1 + len(self)) / (1 + self.doc_freq[features])) + 1.0
+        starts = np.searchsorted(self._features, features, side="left")
+        ends = np.searchsorted(self._features, features, side="right")
+
+        scores = np.zeros(len(self), dtype=np.float32)
+        for start, end, weight in zip(starts, ends, weights * idf):
+            if start != end:
+                np.add.at(scores, self._doc_ids[start:end], self._weights[start:end] * weight)
+
+        top_k = min(top_k, len(scores))
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        ranked = [i for i in ranked if scores[i] > 0]
+        return [(float(scores[i]), example) for i, example in zip(ranked, self._get_examples(ranked))]
+
+    def head(self, n: int) -> List[Dict[str, Any]]:
+        """前n个示例（从磁盘加载的索引只读取示例文件开头）"""
+        return self._get_examples(range(min(n, len(self))))
+
+    def top_k(self, query: str, k: int = DEFAULT_TOP_K) -> List[Dict[str, Any]]:
+        """检索最相关的至多k个示例（只返回有共同特征的示例）；完全不相关时退回前k个示例"""
+        results = [example for _, example in self.search(query, k)]
+        return results or self.head(k)
+
+    def save(self, path: str):
+        """保存索引（先写临时文件再替换）；只保存示例序号和摘要，示例本身留在示例文件中"""
+        self._ensure_sorted()
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            version=np.array([INDEX_VERSION, self.n_features], dtype=np.int64),
+            features=self._features, doc_ids=self._doc_ids, weights=self._weights,
+            doc_freq=self.doc_freq,
+            digests=np.frombuffer(b"".join(self.digests), dtype=np.uint64),
+            source=np.array([self.source or ""]),
+            source_stamp=np.array(self.source_stamp, dtype=np.int64),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "ExampleIndex":
+        """从磁盘加载索引"""
+        with np.load(path, allow_pickle=False) as data:
+            version, n_features = (int(value) for value in data["version"])
+            if version != INDEX_VERSION:
+                raise ValueError(f"索引版本不匹配: {version}")
+            index = cls(n_features)
+            index._features = data["features"]
+            index._doc_ids = data["doc_ids"]
+            index._weights = data["weights"]
+            index.doc_freq = data["doc_freq"].copy()
+            index.digests = [digest.tobytes() for digest in data["digests"]]
+            index.source = str(data["source"][0]) or None
+            index.source_stamp = tuple(int(value) for value in data["source_stamp"])
+            index._examples = None
+        return index
+
+    @classmethod
+    def from_file(cls, examples_path: str, index_path: Optional[str] = None) -> "ExampleIndex":
+        """
+        为示例文件（JSON数组或JSONL）加载或更新索引
+
+        示例文件的大小和修改时间与索引记录的一致时直接使用索引，不读取示例文件；
+        否则已有索引与文件开头的示例一致时只对追加的示例建索引，不一致时重建；
+        有变化时写回索引文件（默认为 <示例文件>.index.npz）
+        """
+        index_path = index_path or f"{examples_path}.index.npz"
+        stat = os.stat(examples_path)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+
+        index = None
+        if os.path.exists(index_path):
+            try:
+                index = cls.load(index_path)
+            except Exception as e:
+                logger.warning(f"示例索引读取失败，将重建: {e}")
+
+        if index is not None:
+            index.source = examples_path
+            if index.source_stamp == stamp:
+                return index
+
+        examples = list(iter_examples(examples_path))
+        if index is not None:
+            known = len(index)
+            if known > len(examples) or \
+                    [_example_digest(example) for example in examples[:known]] != index.digests:
+                index = None
+            else:
+                index._examples = examples[:known]
+
+        if index is None:
+            index = cls()
+        index.source = examples_path
+        index.source_stamp = stamp
+        if len(examples) > len(index):
+            index.add(examples[len(index):])
+        try:
+            index.save(index_path)
+        except OSError as e:
+            logger.warning(f"无法写入示例索引: {e}")
+        return index
+
+
+def select_relevant_examples(query: str, examples: Sequence[Dict[str, Any]],
+                             top_k: int = DEFAULT_TOP_K) -> List[Dict[str, Any]]:
+    """从内存中的示例列表选出最相关的top_k个（示例不超过top_k时原样返回）"""
+    if len(examples) <= top_k:
+        return list(examples)
+    index = ExampleIndex()
+    index.add(examples)
+    return index.top_k(query, top_k)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+示例文件流式读取
+支持JSON数组和JSONL（每行一个示例）两种格式，逐个产出示例而不必一次性解析整个文件；
+按文件修改时间缓存解析结果，Streamlit重跑和重复调用时不会重新读取
+"""
+
+import os
+import json
+import random
+import itertools
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, Iterator, Optional, TextIO, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+JSONL_EXTENSIONS = (".jsonl", ".ndjson")
+MAX_CACHED_FILES = 8
+# 生成带示例的提示时最多读取的示例数（提示中实际使用的数量还受token预算限制）
+MAX_PROMPT_EXAMPLES = 100
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class _ArrayReader:
+    """从文本流中增量解析JSON数组的元素"""
+
+    def __init__(self, stream: TextIO, buffer: str = ""):
+        self.stream = stream
+        self.buffer = buffer
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        """读入下一块，已读部分从缓冲区丢弃；没有更多数据时返回False"""
+        if self.eof:
+            return False
+        chunk = self.stream.read(CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _next_char(self) -> str:
+        """跳过空白，返回下一个字符（不消费）；到达末尾时返回空字符串"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def _decode_value(self) -> Any:
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # 元素跨越了缓冲区边界，读入更多数据后重试
+                if self._fill():
+                    continue
+                raise
+            # 数字等标量在缓冲区末尾可能被截断，确认后面还有分隔符
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def __iter__(self) -> Iterator[Any]:
+        if self._next_char() != "[":
+            raise ValueError("示例文件必须是JSON数组或JSONL")
+        self.pos += 1
+        first = True
+        while True:
+            char = self._next_char()
+            if char == "]":
+                return
+            if not char:
+                raise ValueError("JSON数组没有正常结束")
+            if not first:
+                if char != ",":
+                    raise ValueError(f"JSON数组元素之间缺少逗号（位置附近: {self.buffer[self.pos:self.pos + 20]!r}）")
+                self.pos += 1
+                self._next_char()
+            yield self._decode_value()
+            first = False
+
+
+def _iter_jsonl(stream: TextIO, first_line: str = "") -> Iterator[Any]:
+    for line_number, line in enumerate(_chain_first(first_line, stream), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"第{line_number}行不是有效的JSON: {e}") from e
+
+
+def _chain_first(first: str, stream: TextIO) -> Iterator[str]:
+    if first:
+        yield first + stream.readline()
+    yield from stream
+
+
+def iter_examples(source: Union[str, TextIO], limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    逐个产出示例
+
+    Args:
+        source: 文件路径或文本流；扩展名为 .jsonl/.ndjson 或内容不以 [ 开头时按JSONL解析
+        limit: 最多产出的示例数，达到后不再继续读取
+
+    Raises:
+        ValueError: 文件格式错误
+    """
+    if limit is not None:
+        yield from itertools.islice(iter_examples(source), max(limit, 0))
+        return
+
+    if isinstance(source, str):
+        with open(source, "r", encoding="utf-8") as f:
+            if source.lower().endswith(JSONL_EXTENSIONS):
+                yield from _iter_jsonl(f)
+            else:
+                yield from iter_examples(f)
+        return
+
+    # 根据第一个非空白字符判断格式
+    head = ""
+    while True:
+        chunk = source.read(1)
+        if not chunk:
+            return
+        if chunk not in _WHITESPACE:
+            head = chunk
+            break
+    if head == "[":
+        yield from _ArrayReader(source, head)
+    else:
+        yield from _iter_jsonl(source, head)
+
+
+def sample_examples(source: Union[str, TextIO], k: int, seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """蓄水池抽样：单次遍历等概率选出k个示例，内存只保留k个"""
+    rng = random.Random(seed)
+    reservoir: List[Dict[str, Any]] = []
+    for index, example in enumerate(iter_examples(source)):
+        if index < k:
+            reservoir.append(example)
+        else:
+            slot = rng.randint(0, index)
+            if slot < k:
+                reservoir[slot] = example
+    return reservoir
+
+
+def _file_stamp(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+_cache: "OrderedDict[Tuple[str, Optional[int]], Tuple[Tuple[int, int], List[Dict[str, Any]]]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def load_examples(path: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    读取示例文件（limit不为None时只读取前limit个），按修改时间和大小缓存
+
+    返回的列表在调用之间共享，调用方不应修改
+
+    Raises:
+        OSError: 文件无法读取
+        ValueError: 文件格式错误
+    """
+    key = (os.path.abspath(path), limit)
+    stamp = _file_stamp(path)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            _cache.move_to_end(key)
+            return cached[1]
+
+    examples = list(iter_examples(path, limit))
+    logger.debug(f"已读取 {len(examples)} 个示例: {path}")
+
+    with _cache_lock:
+        _cache[key] = (stamp, examples)
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_CACHED_FILES:
+            _cache.popitem(last=False)
+    return examples
+
+
+def clear_examples_cache():
+    """清空示例文件缓存"""
+    with _cache_lock:
+        _cache.clear()
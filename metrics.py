@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+热路径指标
+低开销的直方图和计数器，可导出为Prometheus文本格式，或通过监听器转换为OpenTelemetry span。
+默认关闭（关闭时计时器是空操作），设置环境变量 PROMPT_METRICS=1 或调用 enable() 开启
+"""
+
+import os
+import time
+import bisect
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 延迟直方图的桶上界（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+SpanListener = Callable[[str, int, int, Dict[str, str]], None]
+
+_enabled = os.environ.get("PROMPT_METRICS", "").lower() not in ("", "0", "false", "no")
+_span_listeners: List[SpanListener] = []
+
+
+def enable(flag: bool = True):
+    """开启或关闭指标采集"""
+    global _enabled
+    _enabled = flag
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class Histogram:
+    """固定桶直方图"""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶估算分位数（返回所在桶的上界）"""
+        if not self.count:
+            return None
+        target = q * self.count
+        running = 0
+        for index, count in enumerate(self.counts):
+            running += count
+            if running >= target:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class MetricsRegistry:
+    """按 (指标名, 标签) 保存直方图和计数器"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+
+    def histogram(self, name: str, labels: LabelKey = ()) -> Histogram:
+        series = self.histograms.get(name)
+        histogram = series.get(labels) if series is not None else None
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, {}).setdefault(labels, Histogram())
+        return histogram
+
+    def observe(self, name: str, value: float, labels: LabelKey = ()):
+        self.histogram(name, labels).observe(value)
+
+    def inc(self, name: str, amount: float = 1.0, labels: LabelKey = ()):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0.0) + amount
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def snapshot(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """汇总视图: {指标名: {标签字符串: {count, sum, p50, p95}}}，计数器只有value"""
+        result: Dict[str, Dict[str, Dict[str, float]]] = {}
+        with self._lock:
+            histograms = {name: dict(series) for name, series in self.histograms.items()}
+            counters = {name: dict(series) for name, series in self.counters.items()}
+        for name, series in histograms.items():
+            result[name] = {
+                _format_labels(labels): {"count": h.count, "sum": h.sum, "p50": h.quantile(0.5), "p95": h.quantile(0.95)}
+                for labels, h in series.items()
+            }
+        for name, series in counters.items():
+            result[name] = {_format_labels(labels): {"value": value} for labels, value in series.items()}
+        return result
+
+    def export_prometheus(self) -> str:
+        """导出为Prometheus文本格式"""
+        lines = []
+        with self._lock:
+            histograms = {name: dict(series) for name, series in self.histograms.items()}
+            counters = {name: dict(series) for name, series in self.counters.items()}
+
+        for name in sorted(histograms):
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in histograms[name].items():
+                with histogram._lock:
+                    counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+                running = 0
+                for bound, bucket_count in zip(histogram.buckets, counts):
+                    running += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} {running}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        for name in sorted(counters):
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in counters[name].items():
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: LabelKey) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+# 进程内共享的指标注册表
+REGISTRY = MetricsRegistry()
+
+
+def observe(name: str, seconds: float, **labels: str):
+    """记录一次耗时（指标关闭时直接返回）"""
+    if _enabled:
+        REGISTRY.observe(name, seconds, tuple(sorted(labels.items())))
+
+
+def inc(name: str, amount: float = 1.0, **labels: str):
+    """计数器加一（指标关闭时直接返回）"""
+    if _enabled:
+        REGISTRY.inc(name, amount, tuple(sorted(labels.items())))
+
+
+class _Timer:
+    """记录代码块耗时，并通知span监听器"""
+
+    __slots__ = ("name", "labels", "start", "start_ns")
+
+    def __init__(self, name: str, labels: Dict[str, str]):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        labels = self.labels
+        if exc_type is not None:
+            labels = dict(labels, error=exc_type.__name__)
+        REGISTRY.observe(self.name, elapsed, tuple(sorted(labels.items())))
+        if _span_listeners:
+            end_ns = self.start_ns + int(elapsed * 1e9)
+            for listener in _span_listeners:
+                listener(self.name, self.start_ns, end_ns, labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(name: str, **labels: str):
+    """计时上下文管理器；指标关闭时返回共享的空操作对象"""
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def add_span_listener(listener: SpanListener):
+    """注册span监听器，每个计时区块结束时以 (名称, 开始ns, 结束ns, 标签) 调用"""
+    _span_listeners.append(listener)
+
+
+def remove_span_listener(listener: SpanListener):
+    if listener in _span_listeners:
+        _span_listeners.remove(listener)
+
+
+def enable_opentelemetry(tracer=None) -> SpanListener:
+    """
+    把计时区块导出为OpenTelemetry span（需要安装opentelemetry-api并配置SDK导出器）
+
+    Returns:
+        注册的监听器，可传给 remove_span_listener 取消导出
+    """
+    if tracer is None:
+        try:
+            from opentelemetry import trace as otel_trace  # 可选依赖，只在开启导出时导入
+        except ImportError:
+            raise ImportError("未安装opentelemetry，无法导出span（pip install opentelemetry-api）")
+        tracer = otel_trace.get_tracer("prompt_engineer")
+
+    def export_span(name: str, start_ns: int, end_ns: int, labels: Dict[str, str]):
+        span = tracer.start_span(name, start_time=start_ns, attributes=labels)
+        span.end(end_time=end_ns)
+
+    add_span_listener(export_span)
+    enable()
+    return export_span
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+本地OpenAI兼容模拟服务器
+在本机提供 /v1/chat/completions（支持 stream=true 的SSE流式输出）和批处理接口（/v1/files、/v1/batches），
+可配置首字延迟、生成速度、输出长度和错误率，用于测试和基准测试，不需要网络和真实API密钥
+
+用法: python mock_openai_server.py --port 8001 --latency 0.2 --token-rate 50 --output-tokens 200
+"""
+
+import re
+import json
+import time
+import uuid
+import random
+import email
+import email.policy
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def mock_completion_text(messages: List[Dict[str, str]], model: str) -> str:
+    """根据最后一条消息生成确定性的回复内容"""
+    content = messages[-1]["content"] if messages else ""
+    return f"[{model}] Mock completion for: {content}"
+
+
+def split_tokens(text: str) -> List[str]:
+    """把回复切成模拟的token（单词连同前导空白），拼接后等于原文"""
+    return re.findall(r"\s*\S+", text) or [text]
+
+
+def build_completion(body: Dict[str, Any], text: Optional[str] = None) -> Dict[str, Any]:
+    """构造与OpenAI格式一致的chat completion响应"""
+    model = body.get("model", "mock-model")
+    messages = body.get("messages", [])
+    if text is None:
+        text = mock_completion_text(messages, model)
+    prompt_tokens = sum(len(message.get("content", "")) for message in messages) // 4
+    completion_tokens = len(split_tokens(text))
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def build_chunk(completion_id: str, model: str, delta: Dict[str, str],
+                finish_reason: Optional[str] = None) -> Dict[str, Any]:
+    """构造流式响应中的一个chat.completion.chunk"""
+    return {
+        "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+class MockOpenAIState:
+    """
+    模拟服务器的配置以及文件和批处理任务状态
+
+    Args:
+        latency: 首个token之前的延迟（秒）
+        batch_delay: 批处理任务开始执行前的延迟（秒）
+        error_rate: chat completion请求返回500的比例
+        token_rate: 每秒生成的token数，0表示瞬间生成
+        output_tokens: 回复补齐到的token数（不超过请求的max_tokens），0表示不补齐
+    """
+
+    def __init__(self, latency: float = 0.0, batch_delay: float = 0.1, error_rate: float = 0.0,
+                 token_rate: float = 0.0, output_tokens: int = 0):
+        self.latency = latency
+        self.batch_delay = batch_delay
+        self.error_rate = error_rate
+        self.token_rate = token_rate
+        self.output_tokens = output_tokens
+        self.lock = threading.Lock()
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, Dict[str, Any]] = {}
+        self.request_count = 0
+
+    def completion_text(self, body: Dict[str, Any]) -> str:
+        """请求对应的回复内容，按output_tokens用填充词补齐"""
+        text = mock_completion_text(body.get("messages", []), body.get("model", "mock-model"))
+        target = self.output_tokens
+        if body.get("max_tokens"):
+            target = min(target, int(body["max_tokens"]))
+        missing = target - len(split_tokens(text))
+        if missing > 0:
+            text += " lorem" * missing
+        return text
+
+    def generation_time(self, tokens: int) -> float:
+        """按生成速度计算生成tokens个token所需的时间"""
+        return tokens / self.token_rate if self.token_rate > 0 else 0.0
+
+    def add_file(self, content: bytes) -> str:
+        file_id = f"file-{uuid.uuid4().hex[:16]}"
+        with self.lock:
+            self.files[file_id] = content
+        return file_id
+
+    def create_batch(self, input_file_id: str, endpoint: str, completion_window: str,
+                     metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if input_file_id not in self.files:
+            raise KeyError(f"文件不存在: {input_file_id}")
+        batch_id = f"batch_{uuid.uuid4().hex[:16]}"
+        batch = {
+            "id": batch_id, "object": "batch", "endpoint": endpoint,
+            "input_file_id": input_file_id, "completion_window": completion_window,
+            "status": "validating", "output_file_id": None, "error_file_id": None,
+            "created_at": int(time.time()), "metadata": metadata or {},
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        with self.lock:
+            self.batches[batch_id] = batch
+        timer = threading.Timer(self.batch_delay, self._process_batch, args=(batch_id,))
+        timer.daemon = True
+        timer.start()
+        return dict(batch)
+
+    def _process_batch(self, batch_id: str):
+        """在后台执行批处理：逐行生成结果，失败的行写入错误文件"""
+        with self.lock:
+            batch = self.batches[batch_id]
+            batch["status"] = "in_progress"
+            lines = self.files[batch["input_file_id"]].decode("utf-8").splitlines()
+
+        outputs, errors = [], []
+        for line in lines:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            body = request.get("body", {})
+            if not body.get("messages"):
+                errors.append({"id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": request.get("custom_id"),
+                               "response": None,
+                               "error": {"code": "invalid_request", "message": "messages不能为空"}})
+                continue
+            completion = build_completion(body, self.completion_text(body))
+            outputs.append({
+                "id": f"batch_req_{uuid.uuid4().hex[:12]}", "custom_id": request.get("custom_id"),
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": completion},
+                "error": None,
+            })
+
+        output_file_id = self.add_file("".join(json.dumps(item) + "\n" for item in outputs).encode("utf-8"))
+        error_file_id = self.add_file("".join(json.dumps(item) + "\n" for item in errors).encode("utf-8")) \
+            if errors else None
+        with self.lock:
+            batch.update({
+                "status": "completed", "output_file_id": output_file_id, "error_file_id": error_file_id,
+                "completed_at": int(time.time()),
+                "request_counts": {"total": len(outputs) + len(errors), "completed": len(outputs),
+                                   "failed": len(errors)},
+            })
+
+
+def _parse_multipart(content_type: str, body: bytes) -> Tuple[Dict[str, str], Dict[str, bytes]]:
+    """解析multipart/form-data，返回 (普通字段, 文件字段)"""
+    message = email.message_from_bytes(
+        f"Content-Type: {content_type}\r\nMIME-Version: 1.0\r\n\r\n".encode("utf-8") + body,
+        policy=email.policy.HTTP
+    )
+    fields, files = {}, {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        payload = part.get_payload(decode=True) or b""
+        if part.get_filename():
+            files[name] = payload
+        else:
+            fields[name] = payload.decode("utf-8")
+    return fields, files
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    """OpenAI兼容接口的请求处理器"""
+
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出，开启Nagle时会与客户端的延迟ACK叠加出约40ms的停顿
+    disable_nagle_algorithm = True
+
+    @property
+    def state(self) -> MockOpenAIState:
+        return self.server.state
+
+    def _send_json(self, status: int, body: Any):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_bytes(self, data: bytes):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, body: Dict[str, Any], text: str):
+        """以SSE分块输出回复，token之间按生成速度间隔"""
+        model = body.get("model", "mock-model")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_event(payload: str):
+            data = f"data: {payload}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+
+        write_event(json.dumps(build_chunk(completion_id, model, {"role": "assistant", "content": ""})))
+        start_time = time.monotonic()
+        for index, token in enumerate(split_tokens(text)):
+            # 按计划时间而不是逐个sleep固定间隔，避免误差累积
+            delay = start_time + self.state.generation_time(index + 1) - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            write_event(json.dumps(build_chunk(completion_id, model, {"content": token}), ensure_ascii=False))
+        write_event(json.dumps(build_chunk(completion_id, model, {}, "stop")))
+        write_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _authorized(self) -> bool:
+        if not self.headers.get("Authorization", "").startswith("Bearer "):
+            self._send_json(401, {"error": {"message": "缺少API密钥"}})
+            return False
+        return True
+
+    def do_POST(self):
+        body = self._read_body()
+        if not self._authorized():
+            return
+        with self.state.lock:
+            self.state.request_count += 1
+
+        if self.path == "/v1/chat/completions":
+            request = json.loads(body)
+            if self.state.latency:
+                time.sleep(self.state.latency)
+            if self.state.error_rate and random.random() < self.state.error_rate:
+                self._send_json(500, {"error": {"message": "模拟的服务端错误"}})
+                return
+            text = self.state.completion_text(request)
+            if request.get("stream"):
+                self._send_stream(request, text)
+                return
+            generation_time = self.state.generation_time(len(split_tokens(text)))
+            if generation_time:
+                time.sleep(generation_time)
+            self._send_json(200, build_completion(request, text))
+        elif self.path == "/v1/files":
+            fields, files = _parse_multipart(self.headers.get("Content-Type", ""), body)
+            if "file" not in files or fields.get("purpose") != "batch":
+                self._send_json(400, {"error": {"message": "需要purpose=batch的file字段"}})
+                return
+            file_id = self.state.add_file(files["file"])
+            self._send_json(200, {"id": file_id, "object": "file", "purpose": "batch",
+                                  "bytes": len(files["file"])})
+        elif self.path == "/v1/batches":
+            request = json.loads(body)
+            try:
+                batch = self.state.create_batch(request["input_file_id"], request.get("endpoint", ""),
+                                                request.get("completion_window", "24h"), request.get("metadata"))
+            except KeyError as e:
+                self._send_json(404, {"error": {"message": str(e)}})
+                return
+            self._send_json(200, batch)
+        else:
+            self._send_json(404, {"error": {"message": f"未知接口: {self.path}"}})
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        parts = self.path.strip("/").split("/")
+        if len(parts) == 3 and parts[:2] == ["v1", "batches"]:
+            with self.state.lock:
+                batch = self.state.batches.get(parts[2])
+                batch = dict(batch) if batch else None
+            if batch is None:
+                self._send_json(404, {"error": {"message": "批处理任务不存在"}})
+            else:
+                self._send_json(200, batch)
+        elif len(parts) == 4 and parts[:2] == ["v1", "files"] and parts[3] == "content":
+            content = self.state.files.get(parts[2])
+            if content is None:
+                self._send_json(404, {"error": {"message": "文件不存在"}})
+            else:
+                self._send_bytes(content)
+        else:
+            self._send_json(404, {"error": {"message": f"未知接口: {self.path}"}})
+
+    def log_message(self, format: str, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    """模拟服务器（port为0时自动分配端口）"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, **state_options):
+        super().__init__((host, port), MockOpenAIHandler)
+        self.state = MockOpenAIState(**state_options)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def api_base(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockOpenAIServer":
+        """在后台线程中运行"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self) -> "MockOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地OpenAI兼容模拟服务器")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8001, help="监听端口")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个chat completion请求的延迟（秒）")
+    parser.add_argument("--batch-delay", type=float, default=1.0, help="批处理任务开始执行前的延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="chat completion请求返回500的比例")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="每秒生成的token数，0表示瞬间生成")
+    parser.add_argument("--output-tokens", type=int, default=0, help="回复补齐到的token数")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(args.host, args.port, latency=args.latency, batch_delay=args.batch_delay,
+                              error_rate=args.error_rate, token_rate=args.token_rate,
+                              output_tokens=args.output_tokens)
+    print(f"🧪 模拟OpenAI服务器已启动: {server.api_base}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,10 +4,21 @@
 为AI编程提供常见场景的预设模板和最佳实践指导
 """
 
-from typing import Dict, List, Any
+import os
+import sys
+import csv
+import json
+import time
+import string
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Mapping, Optional, Iterator, Iterable, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
+from template_store import TemplateStore, get_template_dirs_from_env, placeholder_root
+
 class ProgrammingTaskType(Enum):
     """编程任务类型"""
     CODE_GENERATION = "code_generation"          # 代码生成
@@ -33,23 +44,171 @@ class AITool(Enum):
     CLAUDE = "claude"
     GENERAL = "general"
 
-@dataclass
+@dataclass(frozen=True)
 class PromptTemplate:
-    """Prompt模板"""
+    """Prompt模板（构建后不可修改，可在线程/会话间共享）"""
     name: str
     description: str
     task_type: ProgrammingTaskType
     ai_tool: AITool
     template: str
-    variables: List[str]  # 需要用户填充的变量
-    tips: List[str]       # 使用技巧
-    examples: List[str]   # 示例
+    variables: Tuple[str, ...]  # 需要用户填充的变量
+    tips: Tuple[str, ...]       # 使用技巧
+    examples: Tuple[str, ...]   # 示例
+    
+    def __post_init__(self):
+        # 以列表传入的字段转成元组，冻结后内容也不能被修改
+        for field in ("variables", "tips", "examples"):
+            object.__setattr__(self, field, tuple(getattr(self, field)))
+
+class MissingVariablesError(ValueError):
+    """渲染模板时缺少必需变量"""
+    
+    def __init__(self, missing: List[str], row_index: Optional[int] = None):
+        self.missing = missing
+        self.row_index = row_index
+        location = f"第{row_index + 1}行" if row_index is not None else ""
+        super().__init__(f"{location}缺少必需的变量: {', '.join(missing)}")
+    
+    def __reduce__(self):
+        # 多进程渲染时异常要在进程间传递，按构造参数重建
+        return MissingVariablesError, (self.missing, self.row_index)
+
+class CompiledTemplate:
+    """
+    预编译模板
+    
+    模板文本只解析一次，拆成字面量片段和占位符位置；渲染时只需把变量值
+    填入对应位置再拼接，不再重复解析格式字符串。变量按名称传入，
+    模板中出现 {} 或 {0} 这样的位置占位符时抛出ValueError
+    """
+    
+    __slots__ = ("text", "parts", "slots", "required", "_simple")
+    
+    def __init__(self, text: str, variables: List[str]):
+        self.text = text
+        self.parts: List[Optional[str]] = []
+        self.slots: List[Tuple[int, str]] = []
+        self._simple = True
+        
+        placeholder_names = []
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(text):
+            if literal:
+                self.parts.append(literal)
+            if field_name is None:
+                continue
+            name = placeholder_root(field_name)
+            if not name.isidentifier():
+                raise ValueError(f"模板中不支持位置占位符 {{{field_name}}}，请使用具名变量")
+            placeholder_names.append(name)
+            if format_spec or conversion or not field_name.isidentifier():
+                # 带格式说明或属性访问的占位符交给str.format处理
+                self._simple = False
+            self.slots.append((len(self.parts), field_name))
+            self.parts.append(None)
+        
+        # 声明的变量加上模板中实际出现但未声明的变量
+        self.required: Tuple[str, ...] = tuple(dict.fromkeys(list(variables) + placeholder_names))
+    
+    def missing_variables(self, values: Mapping[str, Any]) -> List[str]:
+        """返回所有缺失的变量"""
+        return [name for name in self.required if name not in values]
+    
+    def render(self, values: Mapping[str, Any]) -> str:
+        """渲染模板（调用前应确保变量齐全）"""
+        if not self._simple:
+            return self.text.format_map(values)
+        parts = self.parts[:]
+        for index, name in self.slots:
+            value = values[name]
+            parts[index] = value if type(value) is str else format(value)
+        return "".join(parts)
+
+class TemplateRegistry(Mapping):
+    """
+    只读模板表
+    
+    内置模板直接保存；外部模板目录中的模板只在首次访问时才构建PromptTemplate，
+    同ID的外部模板会覆盖内置模板
+    """
+    
+    def __init__(self, builtin: Dict[str, PromptTemplate], stores: List[TemplateStore]):
+        self._builtin = builtin
+        self._stores: Dict[str, TemplateStore] = {}
+        for store in stores:
+            for template_id in store.index:
+                self._stores[template_id] = store
+        self._keys = list(dict.fromkeys(list(builtin) + list(self._stores)))
+        self._loaded: Dict[str, PromptTemplate] = {}
+        self._template_ids: Dict[int, str] = {}
+        self._lock = threading.Lock()
+    
+    def __getitem__(self, template_id: str) -> PromptTemplate:
+        template = self._loaded.get(template_id)
+        if template is not None:
+            return template
+        
+        store = self._stores.get(template_id)
+        if store is None:
+            template = self._builtin[template_id]
+        else:
+            meta = store.index[template_id]
+            template = PromptTemplate(
+                name=meta.name,
+                description=meta.description,
+                task_type=ProgrammingTaskType(meta.task_type),
+                ai_tool=AITool(meta.ai_tool),
+                template=store.get_body(template_id),
+                variables=meta.variables,
+                tips=meta.tips,
+                examples=meta.examples
+            )
+        
+        with self._lock:
+            template = self._loaded.setdefault(template_id, template)
+            self._template_ids[id(template)] = template_id
+        return template
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+    
+    def __len__(self) -> int:
+        return len(self._keys)
+    
+    def __contains__(self, template_id: object) -> bool:
+        return template_id in self._builtin or template_id in self._stores
+    
+    def iter_types(self) -> Iterator[Tuple[str, ProgrammingTaskType, AITool]]:
+        """遍历 (模板ID, 任务类型, AI工具)，外部模板只读取元数据"""
+        for template_id in self._keys:
+            store = self._stores.get(template_id)
+            if store is None:
+                template = self._builtin[template_id]
+                yield template_id, template.task_type, template.ai_tool
+            else:
+                meta = store.index[template_id]
+                yield template_id, ProgrammingTaskType(meta.task_type), AITool(meta.ai_tool)
+    
+    def get_template_id(self, template: PromptTemplate) -> Optional[str]:
+        """根据已加载的模板对象反查模板ID"""
+        return self._template_ids.get(id(template))
 
 class ProgrammingPromptTemplates:
     """编程Prompt模板管理器"""
     
-    def __init__(self):
-        self.templates = self._load_templates()
+    def __init__(self, template_dirs: Optional[List[str]] = None):
+        """
+        Args:
+            template_dirs: 外部模板目录列表（YAML/JSON文件），默认不加载外部模板
+        """
+        # 外部模板的task_type/ai_tool在加载时校验，无效条目会被跳过
+        task_types = {task_type.value for task_type in ProgrammingTaskType}
+        ai_tools = {ai_tool.value for ai_tool in AITool}
+        stores = [TemplateStore(path, task_types=task_types, ai_tools=ai_tools)
+                  for path in (template_dirs or [])]
+        # 模板表构建后只读，多个会话/线程共享同一实例时不会互相影响
+        self.templates: TemplateRegistry = TemplateRegistry(self._load_templates(), stores)
+        self._compiled: Dict[str, CompiledTemplate] = {}
     
     def _load_templates(self) -> Dict[str, PromptTemplate]:
         """加载所有模板"""
@@ -405,31 +564,70 @@ class ProgrammingPromptTemplates:
         """获取指定模板"""
         return self.templates.get(template_id)
     
+    def get_template_id(self, template: PromptTemplate) -> Optional[str]:
+        """根据模板对象反查模板ID"""
+        return self.templates.get_template_id(template)
+    
     def get_templates_by_task_type(self, task_type: ProgrammingTaskType) -> List[PromptTemplate]:
         """根据任务类型获取模板"""
-        return [template for template in self.templates.values() 
-                if template.task_type == task_type]
+        return [self.templates[template_id] for template_id, template_task_type, _ in self.templates.iter_types()
+                if template_task_type == task_type]
     
     def get_templates_by_ai_tool(self, ai_tool: AITool) -> List[PromptTemplate]:
         """根据AI工具获取模板"""
-        return [template for template in self.templates.values() 
-                if template.ai_tool == ai_tool or template.ai_tool == AITool.GENERAL]
+        return [self.templates[template_id] for template_id, _, template_ai_tool in self.templates.iter_types()
+                if template_ai_tool == ai_tool or template_ai_tool == AITool.GENERAL]
     
     def list_all_templates(self) -> List[PromptTemplate]:
         """获取所有模板"""
         return list(self.templates.values())
     
+    def compile_template(self, template_id: str) -> CompiledTemplate:
+        """获取预编译模板（每个模板只编译一次）"""
+        compiled = self._compiled.get(template_id)
+        if compiled is None:
+            template = self.get_template(template_id)
+            if not template:
+                raise ValueError(f"模板 {template_id} 不存在")
+            compiled = self._compiled.setdefault(
+                template_id, CompiledTemplate(template.template, template.variables)
+            )
+        return compiled
+    
     def generate_prompt(self, template_id: str, **kwargs) -> str:
         """基于模板生成prompt"""
-        template = self.get_template(template_id)
-        if not template:
-            raise ValueError(f"模板 {template_id} 不存在")
+        compiled = self.compile_template(template_id)
+        missing = compiled.missing_variables(kwargs)
+        if missing:
+            raise MissingVariablesError(missing)
+        return compiled.render(kwargs)
+    
+    def iter_render(self, template_id: str, rows: Iterable[Mapping[str, Any]]) -> Iterator[str]:
+        """逐行渲染多组变量，适合流式处理大批量数据"""
+        compiled = self.compile_template(template_id)
+        required = compiled.required
+        render = compiled.render
+        for row_index, row in enumerate(rows):
+            for name in required:
+                if name not in row:
+                    raise MissingVariablesError(compiled.missing_variables(row), row_index)
+            yield render(row)
+    
+    def render_many(self, template_id: str, rows: Iterable[Mapping[str, Any]]) -> List[str]:
+        """
+        一次调用渲染多组变量
         
-        try:
-            return template.template.format(**kwargs)
-        except KeyError as e:
-            missing_var = str(e).strip("'")
-            raise ValueError(f"缺少必需的变量: {missing_var}")
+        Args:
+            template_id: 模板ID
+            rows: 变量字典序列，每个字典渲染出一个prompt
+        
+        Returns:
+            与rows顺序一致的prompt列表
+        
+        Raises:
+            MissingVariablesError: 某一行缺少变量时抛出，包含该行全部缺失变量和行号
+        """
+        return list(self.iter_render(template_id, rows))
     
     def get_template_info(self, template_id: str) -> Dict[str, Any]:
         """获取模板信息"""
@@ -442,15 +640,28 @@ class ProgrammingPromptTemplates:
             "description": template.description,
             "task_type": template.task_type.value,
             "ai_tool": template.ai_tool.value,
-            "variables": template.variables,
-            "tips": template.tips,
-            "examples": template.examples
+            "variables": list(template.variables),
+            "tips": list(template.tips),
+            "examples": list(template.examples)
         }
 
+# 进程内共享的模板管理器（首次使用时构建）
+_templates_instance: Optional[ProgrammingPromptTemplates] = None
+_templates_lock = threading.Lock()
+
 # 便捷函数
 def get_programming_templates() -> ProgrammingPromptTemplates:
-    """获取编程模板管理器实例"""
-    return ProgrammingPromptTemplates()
+    """
+    获取进程内共享的编程模板管理器实例（线程安全，首次调用时才构建）
+    
+    外部模板目录通过环境变量 PROMPT_TEMPLATE_DIRS 配置
+    """
+    global _templates_instance
+    if _templates_instance is None:
+        with _templates_lock:
+            if _templates_instance is None:
+                _templates_instance = ProgrammingPromptTemplates(get_template_dirs_from_env())
+    return _templates_instance
 
 def list_task_types() -> List[str]:
     """列出所有任务类型"""
@@ -460,7 +671,149 @@ def list_ai_tools() -> List[str]:
     """列出所有AI工具"""
     return [tool.value for tool in AITool]
 
-def main():
+# 批量渲染
+def iter_rows(path: str, input_format: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    流式读取变量行
+    
+    Args:
+        path: CSV或JSONL文件路径，"-" 表示标准输入
+        input_format: "csv" 或 "jsonl"，默认根据扩展名判断
+    """
+    if input_format is None:
+        input_format = "csv" if path.lower().endswith(".csv") else "jsonl"
+    
+    f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8", newline="")
+    try:
+        if input_format == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def _chunked(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    """按固定大小分块"""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _render_chunk(template_id: str, start_index: int, rows: List[Dict[str, Any]],
+                  output_format: str, skip_invalid: bool) -> Tuple[str, int, List[str]]:
+    """
+    渲染并编码一个数据块（也在子进程中执行，编码在子进程完成以减少主进程负担）
+    
+    Returns:
+        (编码后的输出文本, 渲染行数, 跳过行的错误信息列表)
+    """
+    compiled = get_programming_templates().compile_template(template_id)
+    lines = []
+    errors = []
+    for offset, row in enumerate(rows):
+        missing = compiled.missing_variables(row)
+        if missing:
+            error = MissingVariablesError(missing, start_index + offset)
+            if not skip_invalid:
+                raise error
+            errors.append(str(error))
+            continue
+        prompt = compiled.render(row)
+        if output_format == "jsonl":
+            lines.append(json.dumps({"row": start_index + offset, "prompt": prompt}, ensure_ascii=False))
+            lines.append("\n")
+        else:
+            lines.append(prompt)
+            lines.append("\n\n---\n\n")
+    return "".join(lines), len(rows) - len(errors), errors
+
+def _iter_rendered_chunks(template_id: str, rows: Iterable[Dict[str, Any]], workers: int,
+                          chunk_size: int, output_format: str, skip_invalid: bool):
+    """按输入顺序产出渲染结果块；多进程时最多保留 workers*2 个未完成的块，内存占用恒定"""
+    chunks = _chunked(rows, chunk_size)
+    if workers <= 1:
+        start_index = 0
+        for chunk in chunks:
+            yield _render_chunk(template_id, start_index, chunk, output_format, skip_invalid)
+            start_index += len(chunk)
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        start_index = 0
+        for chunk in chunks:
+            pending.append(executor.submit(
+                _render_chunk, template_id, start_index, chunk, output_format, skip_invalid
+            ))
+            start_index += len(chunk)
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def render_file(template_id: str, input_path: str, output_path: str = "-",
+                input_format: Optional[str] = None, output_format: str = "jsonl",
+                workers: int = 1, chunk_size: int = 1000, skip_invalid: bool = False,
+                progress_interval: float = 5.0) -> Dict[str, Any]:
+    """
+    流式渲染整个数据文件
+    
+    Args:
+        template_id: 模板ID
+        input_path: CSV/JSONL输入文件，"-" 表示标准输入
+        output_path: 输出文件，"-" 表示标准输出
+        input_format: 输入格式，默认根据扩展名判断
+        output_format: "jsonl"（每行 {"row": 行号, "prompt": ...}）或 "text"（prompt之间用分隔行隔开）
+        workers: 渲染进程数，大于1时启用多进程
+        chunk_size: 每个任务块的行数
+        skip_invalid: 跳过缺少变量的行而不是中止
+        progress_interval: 进度输出间隔（秒），0表示不输出中间进度
+    
+    Returns:
+        渲染统计信息
+    """
+    # 在主进程中提前校验模板ID，避免子进程中才报错
+    get_programming_templates().compile_template(template_id)
+    
+    out = sys.stdout if output_path == "-" else open(output_path, "w", encoding="utf-8")
+    rendered = skipped = 0
+    start_time = last_report = time.perf_counter()
+    try:
+        rows = iter_rows(input_path, input_format)
+        for text, count, errors in _iter_rendered_chunks(
+            template_id, rows, workers, chunk_size, output_format, skip_invalid
+        ):
+            out.write(text)
+            rendered += count
+            skipped += len(errors)
+            for error in errors:
+                print(f"⚠️ 跳过: {error}", file=sys.stderr)
+            
+            now = time.perf_counter()
+            if progress_interval and now - last_report >= progress_interval:
+                print(f"已渲染 {rendered} 行，{rendered / (now - start_time):.0f} 行/秒", file=sys.stderr)
+                last_report = now
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    
+    elapsed = time.perf_counter() - start_time
+    return {
+        "rendered": rendered,
+        "skipped": skipped,
+        "seconds": elapsed,
+        "rows_per_second": rendered / elapsed if elapsed > 0 else 0.0
+    }
+
+def demo():
     """演示功能"""
     templates = get_programming_templates()
     
@@ -500,5 +853,45 @@ def main():
     except ValueError as e:
         print(f"生成示例失败: {e}")
 
+def main():
+    """命令行入口：不带参数时运行演示，--render 时批量渲染数据文件"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="编程Prompt模板库")
+    parser.add_argument("--render", metavar="TEMPLATE_ID", help="使用指定模板批量渲染数据文件")
+    parser.add_argument("--input", default="-", help="CSV/JSONL输入文件，默认读取标准输入")
+    parser.add_argument("--input-format", choices=["csv", "jsonl"], help="输入格式，默认根据扩展名判断")
+    parser.add_argument("--output", default="-", help="输出文件，默认写到标准输出")
+    parser.add_argument("--output-format", choices=["jsonl", "text"], default="jsonl", help="输出格式")
+    parser.add_argument("--workers", type=int, default=1, help="渲染进程数")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="每个任务块的行数")
+    parser.add_argument("--skip-invalid", action="store_true", help="跳过缺少变量的行")
+    parser.add_argument("--list", action="store_true", help="列出所有模板ID及其变量")
+    
+    args = parser.parse_args()
+    
+    if args.list:
+        templates = get_programming_templates()
+        for template_id in templates.templates:
+            template = templates.get_template(template_id)
+            print(f"{template_id}: {', '.join(template.variables)}")
+    elif args.render:
+        try:
+            stats = render_file(
+                args.render, args.input, args.output,
+                input_format=args.input_format,
+                output_format=args.output_format,
+                workers=args.workers,
+                chunk_size=args.chunk_size,
+                skip_invalid=args.skip_invalid
+            )
+        except ValueError as e:
+            print(f"❌ 渲染失败: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"✅ 已渲染 {stats['rendered']} 行（跳过 {stats['skipped']} 行），"
+              f"耗时 {stats['seconds']:.2f}s，{stats['rows_per_second']:.0f} 行/秒", file=sys.stderr)
+    else:
+        demo()
+
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -6,6 +6,7 @@
 
 import re
 import json
+import threading
 from typing import Dict, List, Tuple, Optional, Any
 from dataclasses import dataclass
 from programming_prompt_templates import (
@@ -277,9 +278,7 @@ class PromptAdvisor:
             example_prompt = self._generate_example_prompt(template, analysis)
             
             recommendation = PromptRecommendation(
-                template_id=list(self.templates.templates.keys())[
-                    list(self.templates.templates.values()).index(template)
-                ],
+                template_id=self.templates.get_template_id(template),
                 template_name=template.name,
                 relevance_score=score,
                 reasons=reasons,
@@ -369,7 +368,8 @@ class PromptAdvisor:
                     example_vars[var] = f"示例{var}"
             
             # 尝试生成示例
-            example = template.template.format(**example_vars)
+            compiled = self.templates.compile_template(self.templates.get_template_id(template))
+            example = compiled.render(example_vars)
             return example[:300] + "..."  # 截取前300字符
         except:
             return template.template[:300] + "..."
@@ -424,9 +424,22 @@ class PromptAdvisor:
         
         return tips
 
+# 进程内共享的建议器实例（关键词表只读，分析过程无实例状态，可跨线程复用）
+_advisor_instance: Optional[PromptAdvisor] = None
+_advisor_lock = threading.Lock()
+
+def get_prompt_advisor() -> PromptAdvisor:
+    """获取进程内共享的智能建议器实例（线程安全，首次调用时才构建）"""
+    global _advisor_instance
+    if _advisor_instance is None:
+        with _advisor_lock:
+            if _advisor_instance is None:
+                _advisor_instance = PromptAdvisor()
+    return _advisor_instance
+
 def main():
     """演示功能"""
-    advisor = PromptAdvisor()
+    advisor = get_prompt_advisor()
     
     print("🤖 智能Prompt建议器")
     print("=" * 50)
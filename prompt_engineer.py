@@ -1,23 +1,201 @@
 import argparse
+import functools
+import hashlib
 import json
 import os
-import requests
-from typing import Dict, Any, List, Optional
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, Hashable, List, Optional
 import logging
 import sys
+import threading
+import time
 
-# 导入API密钥管理模块
-try:
-    from secure_api_manager import get_api_key
-    SECURE_API_AVAILABLE = True
-except ImportError:
+import metrics
+from token_budget import TokenBudget, TokenBudgetExceeded
+
+# API密钥管理模块（会引入cryptography等较重的依赖）在首次需要密钥时才导入，
+# 这样 --help 和模拟模式不必承担这部分启动开销
+SECURE_API_AVAILABLE: Optional[bool] = None
+_key_resolver: Optional[Callable[[str], Optional[str]]] = None
+
+def _load_key_resolver() -> Callable[[str], Optional[str]]:
+    """Import the best available key management module."""
+    global SECURE_API_AVAILABLE
     try:
-        from api_secrets import get_api_key
-        SECURE_API_AVAILABLE = False
+        from secure_api_manager import get_api_key as resolver
+        SECURE_API_AVAILABLE = True
     except ImportError:
-        print("警告: 未找到API密钥管理模块，将使用基本方法获取API密钥")
-        get_api_key = lambda provider: os.environ.get(f"{provider.upper()}_API_KEY")
         SECURE_API_AVAILABLE = False
+        try:
+            from api_secrets import get_api_key as resolver
+        except ImportError:
+            print("警告: 未找到API密钥管理模块，将使用基本方法获取API密钥")
+            resolver = lambda provider: os.environ.get(f"{provider.upper()}_API_KEY")
+    return resolver
+
+def get_api_key(provider: str) -> Optional[str]:
+    """Resolve the API key for a provider, loading key management on first use."""
+    global _key_resolver
+    if _key_resolver is None:
+        _key_resolver = _load_key_resolver()
+    with metrics.timed("prompt_engineer_key_lookup_seconds", provider=provider):
+        return _key_resolver(provider)
+
+# 进程内共享的HTTP会话：复用keep-alive连接，避免每次调用都重新建立TLS连接
+HTTP_POOL_SIZE = 32
+REQUEST_TIMEOUT = 120
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    """Return the process-wide requests session, creating its connection pool on first use."""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                import requests  # deferred: only real API calls need it
+                from requests.adapters import HTTPAdapter
+                
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+                adapter.poolmanager.pool_classes_by_scheme = _timed_pool_classes()
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _http_session = session
+    return _http_session
+
+def _timed_pool_classes() -> Dict[str, type]:
+    """urllib3 connection pools whose new connections record TCP/TLS connect time."""
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+    
+    class TimedHTTPConnection(HTTPConnection):
+        def connect(self):
+            with metrics.timed("prompt_engineer_http_connect_seconds", scheme="http"):
+                super().connect()
+    
+    class TimedHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            with metrics.timed("prompt_engineer_http_connect_seconds", scheme="https"):
+                super().connect()
+    
+    class TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = TimedHTTPConnection
+    
+    class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = TimedHTTPSConnection
+    
+    return {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for and share its result (or exception). Threaded callers
+    block on the shared future, asyncio callers await it without blocking the
+    event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def _join(self, key: Hashable):
+        """Return (future, is_leader) for the key."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is None:
+                future = Future()
+                self._calls[key] = future
+                self.executed += 1
+                is_leader = True
+            else:
+                self.coalesced += 1
+                is_leader = False
+        metrics.inc("prompt_engineer_inflight_lookups_total", result="leader" if is_leader else "coalesced")
+        return future, is_leader
+
+    def _finish(self, key: Hashable, future: Future, fn: Callable[[], Any]):
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn once for all concurrent threaded callers with the same key."""
+        future, is_leader = self._join(key)
+        if is_leader:
+            self._finish(key, future, fn)
+        return future.result()
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Asyncio variant of do(); the blocking fn runs in the default executor."""
+        import asyncio  # deferred: keeps CLI startup light
+        
+        future, is_leader = self._join(key)
+        if is_leader:
+            await asyncio.to_thread(self._finish, key, future, fn)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+# Shared across PromptEngineer instances so identical requests from different
+# sessions are coalesced too
+_inflight_requests = SingleFlight()
+
+def get_coalescing_stats() -> Dict[str, int]:
+    """Counters for API calls that were executed vs. coalesced onto an in-flight call."""
+    return _inflight_requests.stats()
+
+# Output format name -> (generate_* method, format-specific keyword arguments)
+GENERATE_METHODS: Dict[str, tuple] = {
+    "standard": ("generate_formatted_prompt", ()),
+    "expert-panel": ("generate_expert_panel_prompt", ("num_experts",)),
+    "examples": ("generate_prompt_with_examples", ("examples",)),
+    "coding": ("generate_coding_prompt", ("programming_language", "coding_task_type")),
+    "cursor": ("generate_cursor_optimized_prompt", ("context", "file_types")),
+    "architecture": ("generate_architecture_prompt", ("system_type", "technologies")),
+}
+
+# Start time of the generate_* call running on this thread, used to attribute
+# the time spent before the API call to prompt construction
+_generate_state = threading.local()
+
+def _timed_generate(format_name: str):
+    """Record generate_* latency and the prompt construction share of it when metrics are enabled."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not metrics.is_enabled():
+                return method(self, *args, **kwargs)
+            _generate_state.start = time.perf_counter()
+            _generate_state.format = format_name
+            try:
+                with metrics.timed("prompt_engineer_generate_seconds", format=format_name):
+                    return method(self, *args, **kwargs)
+            finally:
+                _generate_state.start = None
+        return wrapper
+    return decorator
+
+def _observe_prompt_build():
+    """Close the prompt construction interval opened by _timed_generate, if any."""
+    start = getattr(_generate_state, "start", None)
+    if start is not None:
+        metrics.observe("prompt_engineer_prompt_build_seconds", time.perf_counter() - start,
+                        format=_generate_state.format)
+        _generate_state.start = None
 
 # Configure logging
 logging.basicConfig(
@@ -34,7 +212,8 @@ class PromptEngineer:
     """
     
     def __init__(self, api_key: Optional[str] = None, model_name: str = "gpt-3.5-turbo", 
-                 api_provider: str = "openai", use_mock: bool = False):
+                 api_provider: str = "openai", use_mock: bool = False, base_url: Optional[str] = None,
+                 router=None):
         """
         Initialize the Prompt Engineer.
         
@@ -43,18 +222,22 @@ class PromptEngineer:
             model_name: Name of the model to use
             api_provider: Provider of the API service ('openai' or 'deepseek')
             use_mock: Force use mock responses (for testing/demo)
+            base_url: Override the chat completions URL (e.g. a local OpenAI-compatible server)
+            router: Optional provider_router.ProviderRouter that picks among several endpoints;
+                    its endpoints carry their own URLs, models and keys
         """
         self.model_name = model_name
         self.api_provider = api_provider.lower()
         self.use_mock = use_mock
+        self.router = None if use_mock else router
         
         # 如果强制使用模拟模式，直接跳过API密钥获取
         if use_mock:
             self.api_key = None
             logger.info("Using mock mode for demonstration")
         else:
-            # 如果未传入API密钥，尝试自动获取
-            if not api_key:
+            # 如果未传入API密钥，尝试自动获取（使用路由时由各端点自带密钥）
+            if not api_key and self.router is None:
                 try:
                     api_key = get_api_key(api_provider)
                 except Exception as e:
@@ -70,9 +253,34 @@ class PromptEngineer:
             self.base_url = "https://api.deepseek.com/v1/chat/completions"
         else:
             raise ValueError(f"Unsupported API provider: {api_provider}. Use 'openai' or 'deepseek'.")
+        if base_url:
+            self.base_url = base_url
         
-        if not self.api_key:
+        if not self.has_live_backend:
             logger.warning("No API key provided. Using mock responses for demonstration.")
+        
+        self.token_budget = TokenBudget(self.model_name)
+        self._endpoint_budgets: Dict[str, TokenBudget] = {}
+    
+    @property
+    def has_live_backend(self) -> bool:
+        """Whether requests go to a real API (an API key or a router) instead of mock responses."""
+        return bool(self.api_key) or self.router is not None
+    
+    def _request_budget(self) -> TokenBudget:
+        """
+        Token budget for the model that will serve the request.
+        
+        With a router this is the model of the endpoint it tries first, which may
+        differ from ``model_name``.
+        """
+        if self.router is None:
+            return self.token_budget
+        model_name = self.router.ranked_endpoints()[0].model
+        budget = self._endpoint_budgets.get(model_name)
+        if budget is None:
+            budget = self._endpoint_budgets[model_name] = TokenBudget(model_name)
+        return budget
     
     def _call_api(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 1000) -> str:
         """
@@ -86,10 +294,58 @@ class PromptEngineer:
         Returns:
             Generated text response
         """
-        if not self.api_key:
+        _observe_prompt_build()
+        if not self.has_live_backend:
             # Mock response for demonstration when no API key is available
             return self._generate_mock_response(messages[-1]["content"])
         
+        # Raises TokenBudgetExceeded before any network call if the request cannot fit
+        max_tokens = self._request_budget().fit_max_tokens(messages, max_tokens)
+        return _inflight_requests.do(
+            self._request_key(messages, temperature, max_tokens),
+            lambda: self._request_completion(messages, temperature, max_tokens)
+        )
+    
+    async def _call_api_async(self, messages: List[Dict[str, str]], temperature: float = 0.7,
+                              max_tokens: int = 1000) -> str:
+        """
+        Asyncio counterpart of _call_api.
+        
+        Identical concurrent requests (from coroutines or threads) share a single
+        in-flight API call.
+        """
+        _observe_prompt_build()
+        if not self.has_live_backend:
+            return self._generate_mock_response(messages[-1]["content"])
+        
+        max_tokens = self._request_budget().fit_max_tokens(messages, max_tokens)
+        return await _inflight_requests.do_async(
+            self._request_key(messages, temperature, max_tokens),
+            lambda: self._request_completion(messages, temperature, max_tokens)
+        )
+    
+    def _request_key(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> tuple:
+        """
+        Key identifying requests whose completions can be shared.
+        
+        Only requests that would go to the same endpoint (or router) with the same
+        API key are shared; the key is included as a digest, not in plain text.
+        """
+        key_digest = hashlib.sha256((self.api_key or "").encode("utf-8")).hexdigest()
+        router_id = id(self.router) if self.router is not None else None
+        return (self.api_provider, self.base_url, router_id, key_digest, self.model_name,
+                json.dumps(messages, ensure_ascii=False, sort_keys=True), temperature, max_tokens)
+    
+    def _request_completion(self, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+        """Send one chat completion request, falling back to a mock response on failure."""
+        if self.router is not None:
+            try:
+                return self.router.complete(messages, temperature, max_tokens)
+            except Exception as e:
+                logger.error(f"API call failed on all routed endpoints: {e}")
+                metrics.inc("prompt_engineer_fallbacks_total", reason="router")
+                return self._generate_mock_response(messages[-1]["content"])
+        
         headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
@@ -104,9 +360,17 @@ class PromptEngineer:
         }
         
         try:
-            response = requests.post(self.base_url, headers=headers, json=data)
+            with metrics.timed("prompt_engineer_http_total_seconds", provider=self.api_provider):
+                start_time = time.perf_counter()
+                # stream=True returns once the headers arrive, which separates TTFB from the body download
+                response = get_http_session().post(self.base_url, headers=headers, json=data,
+                                                   timeout=REQUEST_TIMEOUT, stream=True)
+                metrics.observe("prompt_engineer_http_ttfb_seconds", time.perf_counter() - start_time,
+                                provider=self.api_provider)
+                response.content  # read the body so the connection returns to the pool
             response.raise_for_status()
-            result = response.json()
+            with metrics.timed("prompt_engineer_json_decode_seconds"):
+                result = response.json()
             
             # Extract content based on API provider's response format
             if self.api_provider == "openai":
@@ -116,6 +380,7 @@ class PromptEngineer:
             
         except Exception as e:
             logger.error(f"API call failed: {e}")
+            metrics.inc("prompt_engineer_fallbacks_total", reason=type(e).__name__)
             # Fall back to mock response in case of error
             return self._generate_mock_response(messages[-1]["content"])
     
@@ -143,6 +408,7 @@ The response should be:
 ## Additional Context
 This content will be used for educational purposes, so accuracy and clarity are essential."""
     
+    @_timed_generate("standard")
     def generate_formatted_prompt(self, requirement: str, temperature: float = 0.7, max_tokens: int = 1000) -> str:
         """
         Generate a well-formatted prompt based on user requirements.
@@ -184,6 +450,7 @@ including format, style, depth, and any other relevant details."""
         # Call the API and return the response
         return self._call_api(messages, temperature, max_tokens)
     
+    @_timed_generate("expert-panel")
     def generate_expert_panel_prompt(self, requirement: str, num_experts: int = 3, 
                                      temperature: float = 0.7, max_tokens: int = 1000) -> str:
         """
@@ -230,6 +497,7 @@ Make sure each expert has a distinct perspective and expertise relevant to the t
         # Call the API and return the response
         return self._call_api(messages, temperature, max_tokens)
     
+    @_timed_generate("examples")
     def generate_prompt_with_examples(self, requirement: str, examples: List[Dict[str, str]], 
                                      temperature: float = 0.7, max_tokens: int = 1000) -> str:
         """
@@ -245,16 +513,19 @@ Make sure each expert has a distinct perspective and expertise relevant to the t
             A detailed prompt with examples
         """
         # Format the examples
-        examples_text = "# Examples for reference:\n"
-        for i, example in enumerate(examples):
-            examples_text += f"\nExample {i+1}:\nInput: {example['input']}\nOutput: {example['output']}\n"
+        example_texts = [
+            f"\nExample {i+1}:\nInput: {example['input']}\nOutput: {example['output']}\n"
+            for i, example in enumerate(examples)
+        ]
         
         # Define the system prompt
         system_prompt = """You are an expert prompt engineer specializing in few-shot learning prompts.
 Your task is to create prompts that include examples to help language models understand patterns."""
         
         # Define the user prompt that includes the requirement and examples
-        user_prompt = f"""Please create a detailed prompt based on the following requirement and examples:
+        def build_user_prompt(kept_examples: List[str]) -> str:
+            examples_text = "# Examples for reference:\n" + "".join(kept_examples)
+            return f"""Please create a detailed prompt based on the following requirement and examples:
 
 USER REQUIREMENT: {requirement}
 
@@ -268,12 +539,22 @@ The prompt should:
         # Create the messages list
         messages = [
             {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
+            {"role": "user", "content": build_user_prompt(example_texts)}
         ]
         
+        # Drop trailing examples that would not fit in the model's context window
+        if self.has_live_backend and example_texts:
+            budget = self._request_budget()
+            base_messages = [messages[0], {"role": "user", "content": build_user_prompt([])}]
+            kept = budget.select_examples(example_texts, budget.count_messages(base_messages), max_tokens)
+            if kept < len(example_texts):
+                logger.info(f"Token budget: keeping {kept} of {len(example_texts)} examples")
+                messages[1]["content"] = build_user_prompt(example_texts[:kept])
+        
         # Call the API and return the response
         return self._call_api(messages, temperature, max_tokens)
 
+    @_timed_generate("coding")
     def generate_coding_prompt(self, requirement: str, programming_language: str = "Python", 
                               coding_task_type: str = "general", temperature: float = 0.3, 
                               max_tokens: int = 1500) -> str:
@@ -336,6 +617,7 @@ Make the prompt actionable and specific enough for an AI to generate production-
         
         return self._call_api(messages, temperature, max_tokens)
 
+    @_timed_generate("cursor")
     def generate_cursor_optimized_prompt(self, requirement: str, context: str = "", 
                                        file_types: List[str] = None, temperature: float = 0.3, 
                                        max_tokens: int = 1500) -> str:
@@ -391,6 +673,7 @@ Format the prompt to be clear and actionable for Cursor's AI capabilities."""
         
         return self._call_api(messages, temperature, max_tokens)
 
+    @_timed_generate("architecture")
     def generate_architecture_prompt(self, requirement: str, system_type: str = "web_application",
                                    technologies: List[str] = None, temperature: float = 0.5,
                                    max_tokens: int = 2000) -> str:
@@ -456,13 +739,22 @@ def main():
     parser.add_argument('--format', type=str, 
                         choices=['standard', 'expert-panel', 'examples', 'coding', 'cursor', 'architecture'], 
                         default='standard', help='Format of the prompt to generate')
-    parser.add_argument('--examples', type=str, help='Path to JSON file with examples for few-shot learning')
+    parser.add_argument('--examples', type=str,
+                        help='Path to a JSON array or JSONL file with examples for few-shot learning')
+    parser.add_argument('--examples-top-k', type=int, default=5,
+                        help='Number of most relevant examples to include (0 includes the first examples '
+                             'of the file, as many as the token budget allows)')
+    parser.add_argument('--examples-sample', type=int, default=0,
+                        help='With --examples-top-k 0, include this many examples sampled uniformly from the file '
+                             'in a single streaming pass')
     parser.add_argument('--api-key', type=str, help='API key for the language model service')
     parser.add_argument('--model', type=str, default='deepseek-chat', help='Model name to use')
     parser.add_argument('--api-provider', type=str, choices=['openai', 'deepseek'], 
                        default='deepseek', help='API provider to use (openai or deepseek)')
     parser.add_argument('--temperature', type=float, default=0.7, help='Temperature (0.0-1.0) for generation')
     parser.add_argument('--max-tokens', type=int, default=1000, help='Maximum tokens to generate')
+    parser.add_argument('--router-config', type=str,
+                        help='JSON file listing several endpoints to route between (latency-based, with failover)')
     
     # 新增编程相关参数
     parser.add_argument('--programming-language', type=str, default='Python', 
@@ -483,11 +775,17 @@ def main():
     
     args = parser.parse_args()
     
+    router = None
+    if args.router_config:
+        from provider_router import ProviderRouter
+        router = ProviderRouter.from_file(args.router_config)
+    
     # Initialize the Prompt Engineer
     prompt_engineer = PromptEngineer(
         api_key=args.api_key, 
         model_name=args.model,
-        api_provider=args.api_provider
+        api_provider=args.api_provider,
+        router=router
     )
     
     if args.requirement:
@@ -509,8 +807,17 @@ def main():
             examples = []
             if args.examples:
                 try:
-                    with open(args.examples, 'r', encoding="utf-8") as f:
-                        examples = json.load(f)
+                    if args.examples_top_k > 0:
+                        # Retrieve only the most relevant examples via the persisted index
+                        from example_index import ExampleIndex
+                        examples = ExampleIndex.from_file(args.examples).top_k(args.requirement, args.examples_top_k)
+                    elif args.examples_sample > 0:
+                        from examples_loader import sample_examples
+                        examples = sample_examples(args.examples, args.examples_sample)
+                    else:
+                        # Only a prefix of the file fits in the prompt, so stop reading there
+                        from examples_loader import MAX_PROMPT_EXAMPLES, load_examples
+                        examples = load_examples(args.examples, limit=MAX_PROMPT_EXAMPLES)
                 except Exception as e:
                     logger.error(f"Failed to load examples: {e}")
                     examples = [
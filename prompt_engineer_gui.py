@@ -5,6 +5,7 @@ import os
 import sys
 import threading
 from prompt_engineer import PromptEngineer
+from examples_loader import MAX_PROMPT_EXAMPLES, load_examples as load_examples_file
 
 class PromptEngineerGUI:
     def __init__(self, root):
@@ -286,15 +287,15 @@ class PromptEngineerGUI:
         """Load examples from a JSON file"""
         file_path = filedialog.askopenfilename(
             title="选择示例文件",
-            filetypes=[("JSON文件", "*.json"), ("所有文件", "*.*")]
+            filetypes=[("JSON文件", "*.json"), ("JSONL文件", "*.jsonl"), ("所有文件", "*.*")]
         )
         
         if not file_path:
             return
         
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                self.examples = json.load(f)
+            # 只读取提示中可能用到的前若干个示例
+            self.examples = list(load_examples_file(file_path, limit=MAX_PROMPT_EXAMPLES))
             
             self.examples_label["text"] = f"已加载 {len(self.examples)} 个示例"
         except Exception as e:
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+提示生成历史存储
+基于SQLite持久化保存生成历史，支持全文检索、按格式/模型筛选和分页查询；
+每条记录带有所属者标识（如用户名），共享同一数据库的用户只能看到和清空自己的记录；
+每个所属者保留的记录数和保存时间有上限，超出的旧记录在写入时清理
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_PATH = os.path.join(os.path.expanduser("~/.ai_prompt_engineer"), "history.db")
+
+# 本地安装默认所有会话共用一个所属者，多人共享部署时通过环境变量区分
+HISTORY_OWNER_ENV = "PROMPT_HISTORY_OWNER"
+DEFAULT_HISTORY_OWNER = ""
+
+# 每个所属者最多保留的记录数
+DEFAULT_MAX_ROWS = 1000
+
+# 三元组分词器支持中文子串检索，查询词少于3个字符时退回LIKE
+FTS_MIN_QUERY_LENGTH = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp REAL NOT NULL,
+    requirement TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    format TEXT NOT NULL,
+    model TEXT NOT NULL,
+    owner TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_history_timestamp ON history(timestamp);
+CREATE INDEX IF NOT EXISTS idx_history_format_timestamp ON history(format, timestamp);
+CREATE INDEX IF NOT EXISTS idx_history_model_timestamp ON history(model, timestamp);
+"""
+
+# 旧版数据库没有owner列，补齐列之后再建索引
+OWNER_INDEX = "CREATE INDEX IF NOT EXISTS idx_history_owner_timestamp ON history(owner, timestamp)"
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+    requirement, prompt, content='history', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS history_fts_insert AFTER INSERT ON history BEGIN
+    INSERT INTO history_fts(rowid, requirement, prompt) VALUES (new.id, new.requirement, new.prompt);
+END;
+CREATE TRIGGER IF NOT EXISTS history_fts_delete AFTER DELETE ON history BEGIN
+    INSERT INTO history_fts(history_fts, rowid, requirement, prompt)
+    VALUES ('delete', old.id, old.requirement, old.prompt);
+END;
+"""
+
+
+def get_history_owner() -> str:
+    """获取当前历史记录所属者（环境变量 PROMPT_HISTORY_OWNER，未设置时为本地默认所属者）"""
+    return os.environ.get(HISTORY_OWNER_ENV, DEFAULT_HISTORY_OWNER)
+
+
+class PromptHistoryStore:
+    """SQLite历史记录存储（线程安全，可在多个Streamlit会话间共享）"""
+
+    def __init__(self, db_path: str = DEFAULT_HISTORY_PATH, max_rows: Optional[int] = DEFAULT_MAX_ROWS,
+                 max_age_days: Optional[float] = None):
+        """
+        Args:
+            db_path: 数据库文件路径
+            max_rows: 每个所属者最多保留的记录数，为None时不限
+            max_age_days: 记录最长保留天数，为None时不限
+        """
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self.max_age_days = max_age_days
+        if db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if db_path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(history)")]
+        if "owner" not in columns:
+            self._conn.execute("ALTER TABLE history ADD COLUMN owner TEXT NOT NULL DEFAULT ''")
+        self._conn.execute(OWNER_INDEX)
+
+        self.fts_available = True
+        try:
+            self._conn.executescript(FTS_SCHEMA)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite不支持FTS5三元组分词，全文检索将使用LIKE: {e}")
+            self.fts_available = False
+        self._conn.commit()
+
+    def add(self, requirement: str, prompt: str, format_name: str, model_name: str,
+            timestamp: Optional[float] = None, owner: str = "") -> int:
+        """追加一条历史记录并清理该所属者超出保留上限的旧记录，返回记录ID"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO history (timestamp, requirement, prompt, format, model, owner) VALUES (?, ?, ?, ?, ?, ?)",
+                (timestamp if timestamp is not None else time.time(), requirement, prompt, format_name, model_name,
+                 owner)
+            )
+            self._prune(owner)
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def _prune(self, owner: str):
+        """删除该所属者超出条数上限或保存时间上限的记录（调用方持有锁）"""
+        if self.max_age_days is not None:
+            self._conn.execute("DELETE FROM history WHERE owner = ? AND timestamp < ?",
+                               (owner, time.time() - self.max_age_days * 86400))
+        if self.max_rows is not None:
+            self._conn.execute(
+                "DELETE FROM history WHERE owner = ? AND id NOT IN "
+                "(SELECT id FROM history WHERE owner = ? ORDER BY timestamp DESC, id DESC LIMIT ?)",
+                (owner, owner, self.max_rows)
+            )
+
+    def _build_filters(self, formats: Optional[Sequence[str]], models: Optional[Sequence[str]],
+                       search: Optional[str], owner: Optional[str] = None) -> Tuple[str, List[Any]]:
+        """构建WHERE子句和参数"""
+        clauses = []
+        params: List[Any] = []
+
+        if owner is not None:
+            clauses.append("h.owner = ?")
+            params.append(owner)
+
+        if formats:
+            clauses.append(f"h.format IN ({', '.join('?' * len(formats))})")
+            params.extend(formats)
+        if models:
+            clauses.append(f"h.model IN ({', '.join('?' * len(models))})")
+            params.extend(models)
+
+        search = (search or "").strip()
+        if search:
+            if self.fts_available and len(search) >= FTS_MIN_QUERY_LENGTH:
+                clauses.append("h.id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)")
+                # 作为短语检索，避免用户输入被解析成FTS查询语法
+                params.append('"' + search.replace('"', '""') + '"')
+            else:
+                escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                clauses.append("(h.requirement LIKE ? ESCAPE '\\' OR h.prompt LIKE ? ESCAPE '\\')")
+                params.extend([f"%{escaped}%", f"%{escaped}%"])
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def query(self, page: int = 0, page_size: int = 20, formats: Optional[Sequence[str]] = None,
+              models: Optional[Sequence[str]] = None, search: Optional[str] = None,
+              newest_first: bool = True, owner: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        分页查询历史记录
+
+        Args:
+            page: 页码（从0开始）
+            page_size: 每页条数
+            formats: 只返回这些格式
+            models: 只返回这些模型
+            search: 在需求和提示内容中全文检索
+            newest_first: 是否最新优先
+            owner: 只返回该所属者的记录，为None时不限
+
+        Returns:
+            历史记录字典列表
+        """
+        where, params = self._build_filters(formats, models, search, owner)
+        order = "DESC" if newest_first else "ASC"
+        sql = (f"SELECT h.id, h.timestamp, h.requirement, h.prompt, h.format, h.model FROM history h "
+               f"{where} ORDER BY h.timestamp {order}, h.id {order} LIMIT ? OFFSET ?")
+        with self._lock:
+            rows = self._conn.execute(sql, params + [page_size, page * page_size]).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self, formats: Optional[Sequence[str]] = None, models: Optional[Sequence[str]] = None,
+              search: Optional[str] = None, owner: Optional[str] = None) -> int:
+        """统计满足筛选条件的记录数"""
+        where, params = self._build_filters(formats, models, search, owner)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM history h {where}", params).fetchone()[0]
+
+    def recent(self, limit: int = 20, owner: Optional[str] = None) -> List[Dict[str, Any]]:
+        """获取最近的若干条记录"""
+        return self.query(page=0, page_size=limit, owner=owner)
+
+    def _distinct(self, column: str, owner: Optional[str]) -> List[str]:
+        where, params = self._build_filters(None, None, None, owner)
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                f"SELECT DISTINCT h.{column} FROM history h {where} ORDER BY h.{column}", params)]
+
+    def distinct_formats(self, owner: Optional[str] = None) -> List[str]:
+        """列出所有出现过的格式（走索引）"""
+        return self._distinct("format", owner)
+
+    def distinct_models(self, owner: Optional[str] = None) -> List[str]:
+        """列出所有出现过的模型（走索引）"""
+        return self._distinct("model", owner)
+
+    def delete(self, item_id: int, owner: Optional[str] = None) -> bool:
+        """删除指定记录（指定owner时只删除该所属者的记录）"""
+        sql, params = "DELETE FROM history WHERE id = ?", [item_id]
+        if owner is not None:
+            sql, params = sql + " AND owner = ?", params + [owner]
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def clear(self, owner: Optional[str] = None):
+        """清空历史记录（指定owner时只清空该所属者的记录）"""
+        with self._lock:
+            if owner is None:
+                self._conn.execute("DELETE FROM history")
+            else:
+                self._conn.execute("DELETE FROM history WHERE owner = ?", (owner,))
+            self._conn.commit()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
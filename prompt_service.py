@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+Prompt生成HTTP服务
+常驻进程，通过JSON接口提供提示生成、质量评估、智能建议和模板渲染，
+请求在固定大小的工作线程池中执行，超出排队上限时立即返回503
+
+用法: python prompt_service.py --port 8000 --workers 8 --max-queue 64
+"""
+
+import json
+import time
+import logging
+import argparse
+import threading
+from collections import OrderedDict
+from dataclasses import asdict
+from enum import Enum
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Callable, Optional, Tuple
+from urllib.parse import urlparse
+
+import metrics
+from prompt_engineer import PromptEngineer, GENERATE_METHODS, get_coalescing_stats
+from prompt_quality_evaluator import PromptQualityEvaluator
+from prompt_advisor import get_prompt_advisor
+from programming_prompt_templates import get_programming_templates
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 1024 * 1024
+# 按 (提供商, 模型, 是否模拟) 缓存的PromptEngineer上限，键来自客户端请求
+MAX_CACHED_ENGINEERS = 32
+DEFAULT_EXAMPLES = [
+    {"input": "Write a poem about nature", "output": "The trees sway gently..."},
+    {"input": "Explain quantum physics", "output": "Quantum physics studies..."}
+]
+
+# 各格式对应的生成方法及其可选参数
+GENERATORS = GENERATE_METHODS
+
+
+class ServiceError(Exception):
+    """带HTTP状态码的服务错误"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class WorkerPool:
+    """固定大小的工作线程池，执行中和排队中的请求总数超过上限时拒绝新请求"""
+
+    def __init__(self, workers: int = 8, max_queue: int = 64):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prompt-worker")
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(self, fn: Callable, *args):
+        """提交任务，没有空闲名额时抛出503"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ServiceError(503, "服务繁忙，请稍后重试")
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except RuntimeError:
+            self._release(None)
+            raise ServiceError(503, "服务正在关闭")
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "pending": self.pending,
+                "completed": self.completed,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def _to_jsonable(value: Any) -> Any:
+    """把dataclass/枚举结果转换为可序列化的结构"""
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, dict):
+        return {key: _to_jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_jsonable(item) for item in value]
+    return value
+
+
+class PromptService:
+    """
+    服务核心：持有预热的共享组件，并把请求分派到工作线程池
+
+    PromptEngineer按 (提供商, 模型, 是否模拟) 复用（最多保留MAX_CACHED_ENGINEERS个，
+    最久未用的先淘汰），HTTP连接池在所有实例间共享
+    """
+
+    def __init__(self, workers: int = 8, max_queue: int = 64, request_timeout: float = 120.0,
+                 use_mock: bool = False, collect_metrics: bool = True, base_url: Optional[str] = None):
+        if collect_metrics:
+            metrics.enable()
+        self.pool = WorkerPool(workers, max_queue)
+        self.request_timeout = request_timeout
+        self.use_mock = use_mock
+        self.base_url = base_url
+        self.started_at = time.time()
+        self.evaluator = PromptQualityEvaluator()
+        self.advisor = get_prompt_advisor()
+        self.templates = get_programming_templates()
+        self._engineers: "OrderedDict[Tuple[str, str, bool], PromptEngineer]" = OrderedDict()
+        self._engineers_lock = threading.Lock()
+        self.routes: Dict[Tuple[str, str], Callable[[Dict[str, Any]], Any]] = {
+            ("GET", "/health"): self.health,
+            ("GET", "/formats"): self.list_formats,
+            ("GET", "/templates"): self.list_templates,
+            ("GET", "/metrics"): self.export_metrics,
+            ("POST", "/generate"): self.generate,
+            ("POST", "/evaluate"): self.evaluate,
+            ("POST", "/advise"): self.advise,
+            ("POST", "/render"): self.render,
+        }
+        # 健康检查和列表接口不占用工作线程，过载时仍能响应负载均衡器
+        self.inline_routes = {("GET", "/health"), ("GET", "/formats"), ("GET", "/templates"), ("GET", "/metrics")}
+
+    def get_engineer(self, provider: str, model: str, use_mock: bool) -> PromptEngineer:
+        """获取共享的PromptEngineer实例"""
+        key = (provider, model, use_mock)
+        with self._engineers_lock:
+            engineer = self._engineers.get(key)
+            if engineer is not None:
+                self._engineers.move_to_end(key)
+                return engineer
+        
+        # 在锁外创建（可能需要查找API密钥），并发创建时保留先写入的实例
+        engineer = PromptEngineer(model_name=model, api_provider=provider, use_mock=use_mock,
+                                  base_url=self.base_url)
+        with self._engineers_lock:
+            engineer = self._engineers.setdefault(key, engineer)
+            self._engineers.move_to_end(key)
+            while len(self._engineers) > MAX_CACHED_ENGINEERS:
+                self._engineers.popitem(last=False)
+        return engineer
+
+    def dispatch(self, method: str, path: str, payload: Dict[str, Any]) -> Tuple[int, Any]:
+        """处理一个请求，返回 (状态码, 响应体)"""
+        handler = self.routes.get((method, path))
+        if handler is None:
+            return 404, {"error": f"未知接口: {method} {path}"}
+
+        try:
+            if (method, path) in self.inline_routes:
+                return 200, handler(payload)
+            future = self.pool.submit(handler, payload)
+            try:
+                return 200, future.result(timeout=self.request_timeout)
+            except FutureTimeoutError:
+                raise ServiceError(504, "请求处理超时")
+        except ServiceError as e:
+            return e.status, {"error": str(e)}
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            logger.exception(f"处理请求失败: {method} {path}")
+            return 500, {"error": f"内部错误: {e}"}
+
+    @staticmethod
+    def _require(payload: Dict[str, Any], field: str) -> str:
+        value = payload.get(field)
+        if not isinstance(value, str) or not value.strip():
+            raise ValueError(f"缺少必填字段: {field}")
+        return value
+
+    def health(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "status": "ok",
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "pool": self.pool.stats(),
+            "coalescing": get_coalescing_stats(),
+        }
+
+    def export_metrics(self, payload: Dict[str, Any]) -> str:
+        """Prometheus文本格式的热路径指标"""
+        return metrics.REGISTRY.export_prometheus()
+
+    def list_formats(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return {"formats": list(GENERATORS)}
+
+    def list_templates(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "templates": [
+                dict(self.templates.get_template_info(template_id), template_id=template_id)
+                for template_id in self.templates.templates
+            ]
+        }
+
+    def generate(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        requirement = self._require(payload, "requirement")
+        format_name = payload.get("format", "standard")
+        if format_name not in GENERATORS:
+            raise ValueError(f"不支持的格式: {format_name}")
+
+        engineer = self.get_engineer(
+            payload.get("provider", "deepseek"),
+            payload.get("model", "deepseek-chat"),
+            bool(payload.get("mock", self.use_mock)),
+        )
+        method_name, option_names = GENERATORS[format_name]
+        kwargs = {name: payload[name] for name in option_names if name in payload}
+        for name in ("temperature", "max_tokens"):
+            if name in payload:
+                kwargs[name] = payload[name]
+        if format_name == "examples":
+            kwargs.setdefault("examples", DEFAULT_EXAMPLES)
+
+        start_time = time.perf_counter()
+        prompt = getattr(engineer, method_name)(requirement, **kwargs)
+        return {
+            "prompt": prompt,
+            "format": format_name,
+            "elapsed_ms": round((time.perf_counter() - start_time) * 1000, 3),
+        }
+
+    def evaluate(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        report = self.evaluator.evaluate_prompt(self._require(payload, "prompt"),
+                                                payload.get("requirement", ""))
+        return _to_jsonable(asdict(report))
+
+    def advise(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return self.advisor.analyze_and_recommend(self._require(payload, "requirement"))
+
+    def render(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        template_id = self._require(payload, "template_id")
+        if template_id not in self.templates.templates:
+            raise ServiceError(404, f"模板不存在: {template_id}")
+        if "rows" in payload:
+            return {"prompts": self.templates.render_many(template_id, payload["rows"])}
+        return {"prompt": self.templates.generate_prompt(template_id, **payload.get("variables", {}))}
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+class PromptRequestHandler(BaseHTTPRequestHandler):
+    """JSON请求处理器（HTTP/1.1 keep-alive）"""
+
+    protocol_version = "HTTP/1.1"
+    server_version = "PromptService/1.0"
+    # 响应头和响应体分两次写出，开启Nagle时会与客户端的延迟ACK叠加出约40ms的停顿
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status: int, body: Any):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        if status == 503:
+            self.send_header("Retry-After", "1")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_text(self, status: int, text: str):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method: str):
+        payload: Dict[str, Any] = {}
+        if method == "POST":
+            header = self.headers.get("Content-Length")
+            if header is None:
+                self.close_connection = True
+                self._send_json(411, {"error": "缺少Content-Length"})
+                return
+            try:
+                length = int(header)
+            except ValueError:
+                length = -1
+            if length < 0:
+                self.close_connection = True
+                self._send_json(400, {"error": f"无效的Content-Length: {header!r}"})
+                return
+            if length > MAX_BODY_BYTES:
+                self.close_connection = True
+                self._send_json(413, {"error": "请求体过大"})
+                return
+            try:
+                payload = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError as e:
+                self._send_json(400, {"error": f"无效的JSON: {e}"})
+                return
+            if not isinstance(payload, dict):
+                self._send_json(400, {"error": "请求体必须是JSON对象"})
+                return
+
+        status, body = self.server.service.dispatch(method, urlparse(self.path).path, payload)
+        if isinstance(body, str):
+            self._send_text(status, body)
+        else:
+            self._send_json(status, body)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def log_message(self, format: str, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class PromptHTTPServer(ThreadingHTTPServer):
+    """每个连接一个线程负责收发，实际计算交给服务的工作线程池"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address: Tuple[str, int], service: PromptService):
+        super().__init__(address, PromptRequestHandler)
+        self.service = service
+
+
+def create_server(host: str = "127.0.0.1", port: int = 8000,
+                  service: Optional[PromptService] = None, **service_options) -> PromptHTTPServer:
+    """创建HTTP服务器（port为0时自动分配端口）"""
+    return PromptHTTPServer((host, port), service or PromptService(**service_options))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt生成HTTP服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口")
+    parser.add_argument("--workers", type=int, default=8, help="工作线程数")
+    parser.add_argument("--max-queue", type=int, default=64, help="排队请求上限，超出时返回503")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求的处理超时（秒）")
+    parser.add_argument("--mock", action="store_true", help="默认使用模拟响应")
+    parser.add_argument("--base-url", help="覆盖chat completions地址（如本地模拟服务器）")
+    parser.add_argument("--no-metrics", action="store_true", help="关闭 /metrics 指标采集")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = create_server(args.host, args.port, workers=args.workers, max_queue=args.max_queue,
+                           request_timeout=args.timeout, use_mock=args.mock,
+                           collect_metrics=not args.no_metrics, base_url=args.base_url)
+    host, port = server.server_address[:2]
+    print(f"🚀 Prompt服务已启动: http://{host}:{port}（工作线程 {args.workers}，排队上限 {args.max_queue}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.shutdown()
+        print("服务已停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+多提供商路由
+为同一类请求维护多个提供商/端点，按滚动窗口内的延迟(p50/p95)和错误率选择最快的健康端点，
+慢请求超过阈值后向下一个端点发出对冲请求，失败时依次切换到其他端点
+"""
+
+import json
+import time
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Any, Optional, Sequence
+
+from prompt_engineer import get_http_session, get_api_key, REQUEST_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_URLS = {
+    "openai": "https://api.openai.com/v1/chat/completions",
+    "deepseek": "https://api.deepseek.com/v1/chat/completions",
+}
+
+
+class RouterError(RuntimeError):
+    """所有端点都失败"""
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    """一个OpenAI兼容的chat completions端点"""
+    name: str
+    url: str
+    api_key: str
+    model: str
+
+
+class EndpointStats:
+    """端点的滚动统计（最近window_size次请求）"""
+
+    def __init__(self, window_size: int = 100):
+        self.outcomes: deque = deque(maxlen=window_size)   # (延迟秒数, 是否成功)
+        self.in_flight = 0
+        self.total = 0
+        self.ejected_until = 0.0
+
+    def record(self, latency: float, ok: bool):
+        self.outcomes.append((latency, ok))
+        self.total += 1
+
+    def latencies(self) -> List[float]:
+        return sorted(latency for latency, ok in self.outcomes if ok)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        latencies = self.latencies()
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * percent / 100))]
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for _, ok in self.outcomes if not ok) / len(self.outcomes)
+
+
+class ProviderRouter:
+    """
+    延迟感知的端点路由
+
+    Args:
+        endpoints: 候选端点
+        hedge_after: 固定的对冲阈值（秒）；为None时使用正在等待的端点的p95（样本足够时）
+        hedge: 是否启用对冲请求
+        max_error_rate: 错误率超过该值的端点暂时摘除
+        ejection_seconds: 摘除时长，到期后重新参与路由
+        min_samples: 计算p95阈值和判定错误率所需的最少样本数
+    """
+
+    def __init__(self, endpoints: Sequence[Endpoint], hedge_after: Optional[float] = None, hedge: bool = True,
+                 max_error_rate: float = 0.5, ejection_seconds: float = 30.0, min_samples: int = 10,
+                 window_size: int = 100, timeout: float = REQUEST_TIMEOUT):
+        if not endpoints:
+            raise ValueError("至少需要一个端点")
+        names = [endpoint.name for endpoint in endpoints]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"端点名称重复: {', '.join(duplicates)}")
+        self.endpoints = list(endpoints)
+        self.hedge_after = hedge_after
+        self.hedge = hedge
+        self.max_error_rate = max_error_rate
+        self.ejection_seconds = ejection_seconds
+        self.min_samples = min_samples
+        self.timeout = timeout
+        self._stats = {endpoint.name: EndpointStats(window_size) for endpoint in self.endpoints}
+        self._lock = threading.Lock()
+        # 每个端点最多同时有若干个请求（含对冲后仍在进行的请求）
+        self._executor = ThreadPoolExecutor(max_workers=8 * len(self.endpoints), thread_name_prefix="router")
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "ProviderRouter":
+        """
+        从配置构建路由，配置格式:
+        {"endpoints": [{"name": "...", "provider": "openai", "model": "...", "url": "...", "api_key": "..."}],
+         "hedge_after": 2.0, ...}
+
+        url缺省时按provider取官方地址，api_key缺省时按provider自动获取
+        """
+        endpoints = []
+        for entry in config.get("endpoints", []):
+            provider = entry.get("provider", "openai")
+            endpoints.append(Endpoint(
+                name=entry.get("name", provider),
+                url=entry.get("url") or PROVIDER_URLS[provider],
+                api_key=entry.get("api_key") or get_api_key(provider) or "",
+                model=entry["model"],
+            ))
+        options = {key: value for key, value in config.items() if key != "endpoints"}
+        return cls(endpoints, **options)
+
+    @classmethod
+    def from_file(cls, path: str) -> "ProviderRouter":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_config(json.load(f))
+
+    def _is_healthy(self, stats: EndpointStats, now: float) -> bool:
+        if stats.ejected_until > now:
+            return False
+        return len(stats.outcomes) < self.min_samples or stats.error_rate <= self.max_error_rate
+
+    def ranked_endpoints(self) -> List[Endpoint]:
+        """健康端点按p50升序排列（没有样本的端点排在前面以便探测），被摘除的端点排在最后"""
+        now = time.monotonic()
+        with self._lock:
+            def sort_key(endpoint: Endpoint):
+                stats = self._stats[endpoint.name]
+                p50 = stats.percentile(50)
+                return (not self._is_healthy(stats, now), p50 if p50 is not None else 0.0, stats.in_flight)
+            return sorted(self.endpoints, key=sort_key)
+
+    def _hedge_delay(self, endpoint: Endpoint) -> Optional[float]:
+        if not self.hedge:
+            return None
+        if self.hedge_after is not None:
+            return self.hedge_after
+        with self._lock:
+            stats = self._stats[endpoint.name]
+            if len(stats.outcomes) < self.min_samples:
+                return None
+            return stats.percentile(95)
+
+    def _record(self, endpoint: Endpoint, latency: float, ok: bool):
+        with self._lock:
+            stats = self._stats[endpoint.name]
+            stats.in_flight -= 1
+            stats.record(latency, ok)
+            if not ok and len(stats.outcomes) >= self.min_samples and stats.error_rate > self.max_error_rate:
+                stats.ejected_until = time.monotonic() + self.ejection_seconds
+                logger.warning(f"端点 {endpoint.name} 错误率 {stats.error_rate:.0%}，暂停路由 {self.ejection_seconds}s")
+
+    def _send(self, endpoint: Endpoint, messages: List[Dict[str, str]], temperature: float,
+              max_tokens: int) -> str:
+        with self._lock:
+            self._stats[endpoint.name].in_flight += 1
+        start_time = time.perf_counter()
+        try:
+            response = get_http_session().post(
+                endpoint.url,
+                headers={"Content-Type": "application/json", "Authorization": f"Bearer {endpoint.api_key}"},
+                json={"model": endpoint.model, "messages": messages, "temperature": temperature,
+                      "max_tokens": max_tokens},
+                timeout=self.timeout,
+            )
+            response.raise_for_status()
+            content = response.json()["choices"][0]["message"]["content"]
+        except Exception:
+            self._record(endpoint, time.perf_counter() - start_time, False)
+            raise
+        self._record(endpoint, time.perf_counter() - start_time, True)
+        return content
+
+    def complete(self, messages: List[Dict[str, str]], temperature: float = 0.7, max_tokens: int = 1000) -> str:
+        """
+        发送chat completion请求并返回最先成功的结果
+
+        Raises:
+            RouterError: 所有端点都失败
+        """
+        candidates = self.ranked_endpoints()
+        pending = {}
+        errors = []
+        next_index = 0
+        hedged_from = None
+
+        def launch():
+            nonlocal next_index
+            endpoint = candidates[next_index]
+            next_index += 1
+            pending[self._executor.submit(self._send, endpoint, messages, temperature, max_tokens)] = endpoint
+
+        launch()
+        while pending:
+            delay = None
+            if hedged_from is None and next_index < len(candidates):
+                # 对冲前只有一个请求在进行（失败切换后是后备端点），按它自己的延迟分布等待
+                delay = self._hedge_delay(candidates[next_index - 1])
+            done, _ = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+            if not done:
+                # 正在等待的端点超过阈值仍未返回，向下一个端点发出对冲请求
+                hedged_from = candidates[next_index - 1]
+                with self._lock:
+                    self.hedges += 1
+                launch()
+                continue
+
+            for future in done:
+                endpoint = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(f"{endpoint.name}: {e}")
+                    continue
+                if hedged_from is not None and endpoint is not hedged_from:
+                    with self._lock:
+                        self.hedge_wins += 1
+                return result
+
+            # 已发出的请求都失败时切换到下一个端点
+            if not pending and next_index < len(candidates):
+                with self._lock:
+                    self.failovers += 1
+                launch()
+
+        raise RouterError("所有端点均失败: " + "; ".join(errors))
+
+    def stats(self) -> Dict[str, Any]:
+        """各端点的p50/p95延迟、错误率和路由计数"""
+        now = time.monotonic()
+        with self._lock:
+            endpoints = {}
+            for endpoint in self.endpoints:
+                stats = self._stats[endpoint.name]
+                p50, p95 = stats.percentile(50), stats.percentile(95)
+                endpoints[endpoint.name] = {
+                    "p50_ms": round(p50 * 1000, 3) if p50 is not None else None,
+                    "p95_ms": round(p95 * 1000, 3) if p95 is not None else None,
+                    "error_rate": round(stats.error_rate, 4),
+                    "requests": stats.total,
+                    "in_flight": stats.in_flight,
+                    "healthy": self._is_healthy(stats, now),
+                }
+            return {"endpoints": endpoints, "hedges": self.hedges, "hedge_wins": self.hedge_wins,
+                    "failovers": self.failovers}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
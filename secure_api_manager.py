@@ -5,12 +5,19 @@
 """
 
 import os
+import sys
 import json
+import stat
+import errno
+import time
+import socket
 import hashlib
 import getpass
 import logging
 import re
-from typing import Optional, Dict, Any, List
+import threading
+import socketserver
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime, timedelta
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
@@ -21,6 +28,82 @@ import base64
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
+# 解锁后密钥在内存中保留的默认时长（秒）
+DEFAULT_VAULT_TTL = 8 * 60 * 60
+# 密钥代理的Unix套接字路径可通过环境变量覆盖
+AGENT_SOCKET_ENV = "AI_PROMPT_ENGINEER_AGENT_SOCK"
+AGENT_TIMEOUT = 0.5
+# 密钥文件格式: PBKDF2-SHA256哈希(32字节) + b'|' + 盐
+PASSWORD_HASH_SIZE = 32
+
+class KeyVault:
+    """
+    内存密钥保险箱
+    
+    主密码只在解锁时做一次PBKDF2派生，解密后的密钥保存在内存中直到过期或被锁定，
+    之后的查询只是一次字典读取
+    """
+    
+    def __init__(self):
+        self._keys: Dict[str, str] = {}
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        # 每次载入或锁定时递增，供密钥缓存判断保险箱状态是否变化
+        self.generation = 0
+    
+    def load(self, keys: Dict[str, str], ttl: float = DEFAULT_VAULT_TTL):
+        """载入解密后的密钥"""
+        with self._lock:
+            self._keys = dict(keys)
+            self._expires_at = time.monotonic() + ttl
+            self.generation += 1
+    
+    def get(self, provider: str) -> Optional[str]:
+        """获取密钥，已过期时清空保险箱并返回None"""
+        if not self._keys:
+            return None
+        if time.monotonic() >= self._expires_at:
+            self.lock()
+            return None
+        return self._keys.get(provider)
+    
+    def lock(self):
+        """清空内存中的密钥"""
+        with self._lock:
+            self._keys.clear()
+            self._expires_at = 0.0
+            self.generation += 1
+    
+    @property
+    def is_unlocked(self) -> bool:
+        return bool(self._keys) and time.monotonic() < self._expires_at
+    
+    @property
+    def remaining_seconds(self) -> float:
+        return max(0.0, self._expires_at - time.monotonic()) if self._keys else 0.0
+
+# 进程内共享的保险箱
+_vault = KeyVault()
+
+def _lock_process_memory():
+    """尽量锁定进程内存并禁用core dump，避免解密后的密钥被换出到磁盘（失败时仅记录警告）"""
+    try:
+        import resource
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    except (ImportError, ValueError, OSError) as e:
+        logger.warning(f"无法禁用core dump: {e}")
+    
+    if not sys.platform.startswith("linux"):
+        return
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        MCL_CURRENT, MCL_FUTURE = 1, 2
+        if libc.mlockall(MCL_CURRENT | MCL_FUTURE) != 0:
+            logger.warning(f"mlockall失败（errno={ctypes.get_errno()}），密钥内存可能被换出")
+    except (OSError, AttributeError) as e:
+        logger.warning(f"无法锁定进程内存: {e}")
+
 class SecureAPIManager:
     """安全API管理器"""
     
@@ -28,6 +111,7 @@ class SecureAPIManager:
         self.config_dir = os.path.expanduser("~/.ai_prompt_engineer")
         self.secure_config_file = os.path.join(self.config_dir, ".secure_config.enc")
         self.key_file = os.path.join(self.config_dir, ".key_hash")
+        self.agent_socket = os.environ.get(AGENT_SOCKET_ENV) or os.path.join(self.config_dir, "agent.sock")
         self.supported_providers = ["openai", "deepseek", "anthropic", "google"]
         
         # 确保配置目录存在
@@ -133,8 +217,7 @@ class SecureAPIManager:
             
             if os.path.exists(self.secure_config_file) and os.path.exists(self.key_file):
                 # 验证密码
-                with open(self.key_file, 'rb') as f:
-                    stored_hash, salt = f.read().split(b'|', 1)
+                stored_hash, salt = self._read_key_file()
                 
                 password_hash = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, 100000)
                 if password_hash != stored_hash:
@@ -256,10 +339,16 @@ class SecureAPIManager:
         return None
     
     def _get_secure_key(self, provider: str) -> Optional[str]:
-        """从安全存储获取API密钥"""
+        """从安全存储获取API密钥（仅使用已解锁的保险箱或密钥代理，不提示密码）"""
         try:
-            if not os.path.exists(self.secure_config_file) or not os.path.exists(self.key_file):
-                return None
+            # 1. 本进程已解锁的保险箱
+            key = _vault.get(provider)
+            if key:
+                return key
+            
+            # 2. 本机运行的密钥代理
+            if os.path.exists(self.agent_socket):
+                return self._query_agent(provider)
             
             # 这里不提示密码，避免在自动化场景中中断
             return None
@@ -268,6 +357,68 @@ class SecureAPIManager:
             logger.error(f"读取安全密钥失败: {e}")
             return None
     
+    def _read_key_file(self) -> Tuple[bytes, bytes]:
+        """读取密码哈希和盐（哈希为定长原始字节，可能包含分隔符，不能按分隔符切分）"""
+        with open(self.key_file, 'rb') as f:
+            data = f.read()
+        return data[:PASSWORD_HASH_SIZE], data[PASSWORD_HASH_SIZE + 1:]
+    
+    def _decrypt_secure_config(self, password: str) -> Optional[Dict[str, Any]]:
+        """验证主密码并解密安全存储（每次调用执行PBKDF2派生）"""
+        if not os.path.exists(self.secure_config_file) or not os.path.exists(self.key_file):
+            return None
+        
+        stored_hash, salt = self._read_key_file()
+        
+        password_hash = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, 100000)
+        if password_hash != stored_hash:
+            return None
+        
+        fernet, _ = self._generate_key_from_password(password, salt)
+        with open(self.secure_config_file, 'rb') as f:
+            encrypted_data = f.read()
+        return json.loads(fernet.decrypt(encrypted_data).decode())
+    
+    def unlock(self, password: Optional[str] = None, ttl: float = DEFAULT_VAULT_TTL) -> bool:
+        """
+        解锁安全存储，在本进程内保留解密后的密钥
+        
+        Args:
+            password: 主密码，为空时交互式输入
+            ttl: 密钥在内存中保留的秒数
+        
+        Returns:
+            bool: 是否解锁成功
+        """
+        if password is None:
+            password = self._get_master_password()
+        if not password:
+            return False
+        
+        try:
+            config = self._decrypt_secure_config(password)
+        except Exception as e:
+            logger.error(f"解密安全存储失败: {e}")
+            return False
+        
+        if config is None:
+            print("❌ 主密码错误或安全存储不存在")
+            return False
+        
+        _vault.load({provider: entry["api_key"] for provider, entry in config.items()}, ttl)
+        return True
+    
+    def lock(self):
+        """清空本进程保险箱中的密钥"""
+        _vault.lock()
+    
+    def _query_agent(self, provider: str) -> Optional[str]:
+        """向本机密钥代理查询API密钥"""
+        response = _agent_request(self.agent_socket, f"GET {provider}")
+        if response and response.startswith("OK "):
+            return response[3:]
+        return None
+    
     def _get_config_key(self, provider: str) -> Optional[str]:
         """从配置文件获取API密钥"""
         try:
@@ -404,11 +555,185 @@ class SecureAPIManager:
         
         return report
 
+# 密钥代理
+class _AgentHandler(socketserver.StreamRequestHandler):
+    """处理密钥代理请求：GET <provider> / STATUS / LOCK"""
+    
+    def handle(self):
+        if not self.server.peer_allowed(self.request):
+            return
+        line = self.rfile.readline(256).decode("utf-8", "replace").strip()
+        command, _, argument = line.partition(" ")
+        
+        if command == "GET":
+            key = _vault.get(argument)
+            reply = f"OK {key}" if key else "NONE"
+        elif command == "STATUS":
+            reply = f"OK {int(_vault.remaining_seconds)}" if _vault.is_unlocked else "LOCKED"
+        elif command == "LOCK":
+            _vault.lock()
+            reply = "OK"
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+        else:
+            reply = "ERROR unknown command"
+        self.wfile.write((reply + "\n").encode("utf-8"))
+
+class KeyAgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """本机密钥代理：通过仅所有者可访问的Unix套接字向本用户的其他进程提供已解锁的密钥"""
+    
+    daemon_threads = True
+    
+    def __init__(self, socket_path: str):
+        self._remove_stale_socket(socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _AgentHandler)
+        finally:
+            os.umask(old_umask)
+        self.socket_path = socket_path
+    
+    @staticmethod
+    def _remove_stale_socket(socket_path: str):
+        """删除遗留的套接字文件；已有代理在监听或路径不是套接字时拒绝接管"""
+        try:
+            mode = os.lstat(socket_path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise OSError(errno.EEXIST, f"密钥代理路径已存在且不是套接字: {socket_path}")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            probe.settimeout(AGENT_TIMEOUT)
+            try:
+                probe.connect(socket_path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(socket_path)
+                return
+            except OSError:
+                pass
+        raise OSError(errno.EADDRINUSE, f"已有密钥代理在运行: {socket_path}")
+    
+    def peer_allowed(self, connection: socket.socket) -> bool:
+        """只接受同一用户的进程连接（Linux上检查SO_PEERCRED）"""
+        if not hasattr(socket, "SO_PEERCRED"):
+            return True
+        import struct
+        creds = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        _, uid, _ = struct.unpack("3i", creds)
+        return uid == os.getuid()
+    
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+def _agent_request(socket_path: str, command: str) -> Optional[str]:
+    """向密钥代理发送一条命令，代理不可用时返回None"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(AGENT_TIMEOUT)
+            client.connect(socket_path)
+            client.sendall((command + "\n").encode("utf-8"))
+            data = b""
+            while not data.endswith(b"\n"):
+                chunk = client.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+        return data.decode("utf-8").strip()
+    except OSError:
+        return None
+
+def run_key_agent(ttl: float = DEFAULT_VAULT_TTL, password: Optional[str] = None) -> bool:
+    """
+    解锁安全存储并在前台运行密钥代理，直到TTL到期或收到LOCK命令
+    
+    Args:
+        ttl: 密钥保留的秒数
+        password: 主密码，为空时交互式输入
+    """
+    manager = SecureAPIManager()
+    _lock_process_memory()
+    if not manager.unlock(password, ttl):
+        return False
+    
+    try:
+        server = KeyAgentServer(manager.agent_socket)
+    except OSError as e:
+        _vault.lock()
+        print(f"❌ 无法启动密钥代理: {e}")
+        return False
+    # TTL到期后自动停止代理
+    expiry_timer = threading.Timer(ttl, server.shutdown)
+    expiry_timer.daemon = True
+    expiry_timer.start()
+    
+    print(f"🔓 密钥代理已启动: {manager.agent_socket}（{int(ttl)} 秒后自动锁定）")
+    print(f"   其他进程可设置 {AGENT_SOCKET_ENV}={manager.agent_socket} 使用非默认路径")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        expiry_timer.cancel()
+        _vault.lock()
+        server.server_close()
+        print("🔒 密钥代理已停止，内存中的密钥已清除")
+    return True
+
+# 进程内共享的管理器和密钥解析缓存
+_shared_manager: Optional[SecureAPIManager] = None
+_shared_lock = threading.Lock()
+_key_cache: Dict[str, Tuple[tuple, Optional[str]]] = {}
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    """文件的 (inode, mtime_ns, size)，文件不存在时返回None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def get_secure_api_manager() -> SecureAPIManager:
+    """获取进程内共享的SecureAPIManager（HOME变化时重新创建）"""
+    global _shared_manager
+    config_dir = os.path.expanduser("~/.ai_prompt_engineer")
+    manager = _shared_manager
+    if manager is None or manager.config_dir != config_dir:
+        with _shared_lock:
+            if _shared_manager is None or _shared_manager.config_dir != config_dir:
+                _shared_manager = SecureAPIManager()
+            manager = _shared_manager
+    return manager
+
+def _key_fingerprint(manager: SecureAPIManager, provider: str) -> tuple:
+    """影响密钥解析结果的全部输入：环境变量、相关文件的修改状态和保险箱状态"""
+    return (
+        os.environ.get(f"{provider.upper()}_API_KEY"),
+        manager.config_dir,
+        os.getcwd(),
+        _file_stamp("config.json"),
+        _file_stamp(manager.secure_config_file),
+        _file_stamp(manager.agent_socket),
+        _vault.generation,
+        _vault.is_unlocked,
+    )
+
+def clear_api_key_cache():
+    """清空密钥解析缓存"""
+    _key_cache.clear()
+
 # 便捷函数
 def get_api_key(provider: str) -> Optional[str]:
-    """获取API密钥的便捷函数"""
-    manager = SecureAPIManager()
-    return manager.get_api_key(provider)
+    """获取API密钥的便捷函数（按提供商缓存结果，环境变量或文件变化时自动失效）"""
+    manager = get_secure_api_manager()
+    fingerprint = _key_fingerprint(manager, provider)
+    cached = _key_cache.get(provider)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    
+    api_key = manager.get_api_key(provider)
+    _key_cache[provider] = (fingerprint, api_key)
+    return api_key
 
 def set_api_key_interactive(provider: str = None):
     """交互式设置API密钥"""
@@ -461,6 +786,10 @@ def main():
     parser.add_argument("--validate", action="store_true", help="验证所有API密钥")
     parser.add_argument("--security-check", action="store_true", help="执行安全检查")
     parser.add_argument("--remove", type=str, help="删除指定提供商的API密钥")
+    parser.add_argument("--agent", action="store_true", help="解锁安全存储并运行本机密钥代理")
+    parser.add_argument("--agent-ttl", type=int, default=DEFAULT_VAULT_TTL, help="密钥代理保留密钥的秒数")
+    parser.add_argument("--agent-status", action="store_true", help="查看密钥代理状态")
+    parser.add_argument("--agent-lock", action="store_true", help="锁定并停止密钥代理")
     
     args = parser.parse_args()
     manager = SecureAPIManager()
@@ -489,6 +818,18 @@ def main():
                 print(f"    - {rec}")
     elif args.remove:
         manager.remove_api_key(args.remove)
+    elif args.agent:
+        run_key_agent(ttl=args.agent_ttl)
+    elif args.agent_status or args.agent_lock:
+        response = _agent_request(manager.agent_socket, "LOCK" if args.agent_lock else "STATUS")
+        if response is None:
+            print("未检测到运行中的密钥代理")
+        elif response == "LOCKED":
+            print("🔒 密钥代理已锁定")
+        elif args.agent_lock:
+            print("🔒 密钥代理已锁定并停止")
+        else:
+            print(f"🔓 密钥代理运行中，剩余 {response[3:]} 秒")
     else:
         parser.print_help()
 
@@ -3,6 +3,7 @@ import json
 import os
 import sys
 from prompt_engineer import PromptEngineer
+from examples_loader import MAX_PROMPT_EXAMPLES, load_examples as read_examples_file
 
 def load_config():
     """Load configuration from config.json if available"""
@@ -18,12 +19,11 @@ def load_config():
     return config
 
 def load_examples(examples_file):
-    """Load examples from a JSON file"""
+    """Load examples from a JSON or JSONL file"""
     examples = []
     if examples_file and os.path.exists(examples_file):
         try:
-            with open(examples_file, "r", encoding="utf-8") as f:
-                examples = json.load(f)
+            examples = read_examples_file(examples_file, limit=MAX_PROMPT_EXAMPLES)
             print(f"已加载 {len(examples)} 个示例")
         except Exception as e:
             print(f"加载示例文件失败: {e}")
@@ -3,8 +3,14 @@ import json
 import os
 import time
 import random
+import io
 import base64
+import logging
+import threading
 from prompt_engineer import PromptEngineer
+from prompt_history import PromptHistoryStore, get_history_owner
+from example_index import ExampleIndex
+from examples_loader import iter_examples
 
 # 导入新的评估模块
 try:
@@ -17,7 +23,7 @@ except ImportError:
 # 导入编程模板和智能建议器
 try:
     from programming_prompt_templates import get_programming_templates, list_task_types, list_ai_tools
-    from prompt_advisor import PromptAdvisor
+    from prompt_advisor import get_prompt_advisor
     PROGRAMMING_TEMPLATES_AVAILABLE = True
 except ImportError:
     PROGRAMMING_TEMPLATES_AVAILABLE = False
@@ -25,7 +31,7 @@ except ImportError:
 
 # 导入API密钥管理模块
 try:
-    from api_secrets import get_api_key, get_api_config, save_api_key
+    from api_secrets import get_api_key, get_api_config, save_api_key, refresh_api_sources
     SECRETS_MODULE_AVAILABLE = True
 except ImportError:
     SECRETS_MODULE_AVAILABLE = False
@@ -44,6 +50,41 @@ def check_streamlit_secrets():
 
 STREAMLIT_SECRETS_AVAILABLE = check_streamlit_secrets()
 
+# 模板库和建议器在整个Streamlit服务进程内只构建一次，所有会话共享
+@st.cache_resource
+def get_cached_templates():
+    """获取共享的编程模板管理器"""
+    return get_programming_templates()
+
+@st.cache_resource
+def get_cached_advisor():
+    """获取共享的智能建议器"""
+    return get_prompt_advisor()
+
+@st.cache_resource
+def get_history_store():
+    """获取持久化的历史记录存储（所有会话共享同一数据库，记录按所属者隔离）"""
+    return PromptHistoryStore()
+
+@st.cache_resource
+def get_example_index(examples_file, stamp):
+    """获取示例文件的检索索引（stamp为文件大小和修改时间，文件变化后重新加载）"""
+    return ExampleIndex.from_file(examples_file)
+
+@st.cache_resource
+def get_uploaded_example_index(data):
+    """为上传的示例文件内容建检索索引（同一文件在页面重跑时不重复解析）"""
+    index = ExampleIndex()
+    index.add(list(iter_examples(io.StringIO(data.decode("utf-8")))))
+    return index
+
+# 历史记录每页显示条数
+HISTORY_PAGE_SIZE = 20
+# 示例格式只发送与需求最相关的若干个示例
+EXAMPLES_TOP_K = 5
+# 示例预览表格最多显示的行数
+EXAMPLES_PREVIEW_ROWS = 100
+
 # 设置页面配置
 st.set_page_config(
     page_title="AI提示工程师",
@@ -98,8 +139,6 @@ THEMES = {
 }
 
 # 初始化会话状态
-if 'history' not in st.session_state:
-    st.session_state.history = []
 if 'theme' not in st.session_state:
     st.session_state.theme = "light"
 if 'show_tips' not in st.session_state:
@@ -108,6 +147,9 @@ if 'prompt_count' not in st.session_state:
     st.session_state.prompt_count = 0
 if 'last_save_time' not in st.session_state:
     st.session_state.last_save_time = None
+if 'history_owner' not in st.session_state:
+    # 历史记录按配置的所属者保存，新会话和重启后仍能看到之前的记录
+    st.session_state.history_owner = get_history_owner()
 
 # 获取当前主题
 current_theme = THEMES[st.session_state.theme]
@@ -227,8 +269,42 @@ def get_css():
 st.markdown(get_css(), unsafe_allow_html=True)
 
 # 辅助函数
-def load_config():
-    """从多个来源加载配置"""
+logger = logging.getLogger(__name__)
+
+# 影响配置解析结果的文件和环境变量，任一发生变化时重新解析
+CONFIG_SOURCE_FILES = ("config.json", ".env", os.path.join(".streamlit", "secrets.toml"))
+CONFIG_ENV_VARS = ("DEEPSEEK_API_KEY", "OPENAI_API_KEY")
+
+@st.cache_resource
+def get_config_cache():
+    """获取进程内共享的配置解析缓存"""
+    return {"fingerprint": None, "config": None, "messages": [], "lock": threading.Lock()}
+
+def _config_fingerprint():
+    """配置来源的指纹：文件修改时间/大小和相关环境变量（只做stat，不读取文件内容）"""
+    stats = []
+    for path in CONFIG_SOURCE_FILES:
+        try:
+            stat = os.stat(path)
+            stats.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stats.append((path, None, None))
+    return tuple(stats) + tuple(os.environ.get(name) for name in CONFIG_ENV_VARS)
+
+def invalidate_config_cache():
+    """使配置缓存失效（保存配置后调用）"""
+    cache = get_config_cache()
+    with cache["lock"]:
+        cache["fingerprint"] = None
+        cache["config"] = None
+
+def _resolve_config():
+    """
+    从多个来源解析配置
+    
+    Returns:
+        (配置字典, 侧边栏消息列表)，消息为 (级别, 文本, 图标)
+    """
     config = {
         "api_key": "",
         "api_provider": "deepseek",
@@ -236,6 +312,7 @@ def load_config():
         "default_format": "standard",
         "language": "zh"
     }
+    messages = []
     
     # 首先尝试从config.json加载基本配置
     if os.path.exists("config.json"):
@@ -243,7 +320,7 @@ def load_config():
             with open("config.json", "r", encoding="utf-8") as f:
                 config.update(json.load(f))
         except Exception as e:
-            st.sidebar.warning(f"加载config.json失败: {e}", icon="⚠️")
+            messages.append(("warning", f"加载config.json失败: {e}", "⚠️"))
     
     # 然后尝试从不同来源加载API密钥
     api_key_loaded = False
@@ -251,13 +328,15 @@ def load_config():
     # 1. 尝试从API密钥管理模块加载
     if SECRETS_MODULE_AVAILABLE:
         try:
+            # 只有配置来源变化时才会重新解析，因此同步刷新密钥模块的文件缓存
+            refresh_api_sources()
             api_config = get_api_config()
             if api_config.get("api_key"):
                 config.update(api_config)
-                st.sidebar.success("✅ 已从安全存储加载API配置", icon="🔐")
+                messages.append(("success", "✅ 已从安全存储加载API配置", "🔐"))
                 api_key_loaded = True
         except Exception as e:
-            st.sidebar.warning(f"从安全存储加载失败: {e}", icon="⚠️")
+            messages.append(("warning", f"从安全存储加载失败: {e}", "⚠️"))
     
     # 2. 尝试从Streamlit secrets加载
     if not api_key_loaded and STREAMLIT_SECRETS_AVAILABLE:
@@ -266,10 +345,10 @@ def load_config():
             key_name = f"{provider.upper()}_API_KEY"
             if key_name in st.secrets:
                 config["api_key"] = st.secrets[key_name]
-                st.sidebar.success("✅ 已从Streamlit secrets加载API密钥", icon="🔑")
+                messages.append(("success", "✅ 已从Streamlit secrets加载API密钥", "🔑"))
                 api_key_loaded = True
         except Exception as e:
-            st.sidebar.warning(f"从Streamlit secrets加载失败: {e}", icon="⚠️")
+            messages.append(("warning", f"从Streamlit secrets加载失败: {e}", "⚠️"))
     
     # 3. 尝试从环境变量加载
     if not api_key_loaded:
@@ -278,12 +357,41 @@ def load_config():
         env_value = os.getenv(env_key)
         if env_value:
             config["api_key"] = env_value
-            st.sidebar.success(f"✅ 已从环境变量加载{provider}密钥", icon="🌍")
+            messages.append(("success", f"✅ 已从环境变量加载{provider}密钥", "🌍"))
             api_key_loaded = True
     
     # 如果没有找到API密钥，显示提示
     if not api_key_loaded and not config.get("api_key"):
-        st.sidebar.info("💡 请在侧边栏设置API密钥或使用安全存储", icon="💡")
+        messages.append(("info", "💡 请在侧边栏设置API密钥或使用安全存储", "💡"))
+    
+    return config, messages
+
+def load_config():
+    """加载配置；配置来源未变化时直接使用缓存，不读取任何文件"""
+    start_time = time.perf_counter()
+    cache = get_config_cache()
+    fingerprint = _config_fingerprint()
+    
+    with cache["lock"]:
+        cached = cache["config"] is not None and cache["fingerprint"] == fingerprint
+        if not cached:
+            config, messages = _resolve_config()
+            cache["fingerprint"] = fingerprint
+            cache["config"] = config
+            cache["messages"] = messages
+        config = dict(cache["config"])
+        messages = list(cache["messages"])
+    
+    for level, text, icon in messages:
+        getattr(st.sidebar, level)(text, icon=icon)
+    
+    # 记录每次重新运行时加载配置的耗时，便于对比缓存命中和未命中的开销
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    timings = st.session_state.setdefault("config_load_timings", {"cached": [], "uncached": []})
+    bucket = timings["cached" if cached else "uncached"]
+    bucket.append(elapsed_ms)
+    del bucket[:-50]
+    logger.debug(f"load_config: {elapsed_ms:.2f}ms ({'缓存命中' if cached else '重新解析'})")
     
     return config
 
@@ -310,13 +418,14 @@ def save_config(config):
             with open("config.json", "w", encoding="utf-8") as f:
                 json.dump(config, f, indent=2, ensure_ascii=False)
                 
+        invalidate_config_cache()
         st.session_state.last_save_time = time.time()
         st.sidebar.success("配置已保存", icon="✅")
     except Exception as e:
         st.sidebar.error(f"保存配置失败: {e}", icon="❌")
 
 def load_examples(examples_file=None):
-    """加载示例数据"""
+    """加载示例检索索引（整个示例文件都参与检索）"""
     default_examples = [
         {"input": "写一首关于自然的诗", "output": "树木轻轻摇曳..."},
         {"input": "解释量子物理", "output": "量子物理是研究..."}
@@ -328,13 +437,21 @@ def load_examples(examples_file=None):
     
     if examples_file and os.path.exists(examples_file):
         try:
-            with open(examples_file, "r", encoding="utf-8") as f:
-                examples = json.load(f)
-            return examples
+            # 索引按文件大小和修改时间缓存，页面重跑时不会重新解析示例文件
+            stat = os.stat(examples_file)
+            return get_example_index(os.path.abspath(examples_file), (stat.st_size, stat.st_mtime_ns))
         except Exception as e:
             st.sidebar.error(f"加载示例失败: {e}", icon="❌")
     
-    return default_examples
+    index = ExampleIndex()
+    index.add(default_examples)
+    return index
+
+def select_examples(examples, requirement):
+    """选出与需求最相关的示例（示例不多时全部使用）"""
+    if len(examples) <= EXAMPLES_TOP_K:
+        return examples.head(EXAMPLES_TOP_K)
+    return examples.top_k(requirement, EXAMPLES_TOP_K)
 
 def get_random_tip():
     """获取随机提示技巧"""
@@ -350,19 +467,9 @@ def get_random_tip():
     return random.choice(tips)
 
 def add_to_history(requirement, prompt, format_name, model_name):
-    """添加生成记录到历史"""
-    history_item = {
-        "timestamp": time.time(),
-        "requirement": requirement,
-        "prompt": prompt,
-        "format": format_name,
-        "model": model_name
-    }
-    st.session_state.history.insert(0, history_item)
+    """添加生成记录到持久化历史"""
+    get_history_store().add(requirement, prompt, format_name, model_name, owner=st.session_state.history_owner)
     st.session_state.prompt_count += 1
-    # 限制历史记录最多保存20条
-    if len(st.session_state.history) > 20:
-        st.session_state.history = st.session_state.history[:20]
 
 def get_format_badge(format_name):
     """获取格式对应的徽章HTML"""
@@ -422,7 +529,8 @@ with st.sidebar:
     
     # 如果API密钥管理模块可用，显示当前状态
     if SECRETS_MODULE_AVAILABLE:
-        current_key = get_api_key(config["api_provider"])
+        # 使用已解析（已缓存）的配置，避免每次重新运行都重新探测密钥来源
+        current_key = config.get("api_key")
         if current_key:
             st.success(f"✅ 已加载 {config['api_provider']} API密钥")
             # 显示部分遮蔽的API密钥作为安全措施
@@ -471,6 +579,16 @@ with st.sidebar:
     if st.session_state.last_save_time:
         st.markdown(f"⏱️ 上次保存: {format_timestamp(st.session_state.last_save_time)}")
     
+    # 配置加载耗时（缓存命中 vs 重新解析）
+    config_timings = st.session_state.get("config_load_timings", {})
+    with st.expander("⏱️ 配置加载耗时"):
+        for label, key in (("重新解析", "uncached"), ("缓存命中", "cached")):
+            samples = config_timings.get(key, [])
+            if samples:
+                st.caption(f"{label}: 平均 {sum(samples) / len(samples):.2f}ms（{len(samples)} 次）")
+            else:
+                st.caption(f"{label}: 暂无数据")
+    
     # 提示小贴士开关
     show_tips = st.toggle("显示提示技巧", value=st.session_state.show_tips)
     if show_tips != st.session_state.show_tips:
@@ -595,10 +713,10 @@ with tabs[0]:
         examples = None
         if prompt_format == "examples":
             st.subheader("示例设置")
-            example_file = st.file_uploader("上传示例文件(JSON格式)", type=["json"])
+            example_file = st.file_uploader("上传示例文件(JSON或JSONL格式)", type=["json", "jsonl"])
             if example_file:
                 try:
-                    examples = json.loads(example_file.getvalue().decode())
+                    examples = get_uploaded_example_index(example_file.getvalue())
                     st.success(f"已加载{len(examples)}个示例")
                 except Exception as e:
                     st.error(f"解析示例文件失败: {e}")
@@ -606,7 +724,7 @@ with tabs[0]:
             else:
                 examples = load_examples()
                 examples_df = st.dataframe(
-                    [{"输入": ex["input"], "输出": ex["output"]} for ex in examples],
+                    [{"输入": ex["input"], "输出": ex["output"]} for ex in examples.head(EXAMPLES_PREVIEW_ROWS)],
                     use_container_width=True,
                     height=150
                 )
@@ -673,7 +791,9 @@ with tabs[0]:
                         elif prompt_format == "expert-panel":
                             prompt = prompt_engineer.generate_expert_panel_prompt(requirement)
                         elif prompt_format == "examples":
-                            prompt = prompt_engineer.generate_prompt_with_examples(requirement, examples)
+                            prompt = prompt_engineer.generate_prompt_with_examples(
+                                requirement, select_examples(examples, requirement)
+                            )
                         elif prompt_format == "coding":
                             prompt = prompt_engineer.generate_coding_prompt(
                                 requirement, 
@@ -757,7 +877,7 @@ if PROGRAMMING_TEMPLATES_AVAILABLE:
             st.subheader("📋 选择模板")
             
             # 初始化模板管理器
-            templates_manager = get_programming_templates()
+            templates_manager = get_cached_templates()
             
             # 任务类型筛选
             task_types = list_task_types()
@@ -875,9 +995,7 @@ if PROGRAMMING_TEMPLATES_AVAILABLE:
                             st.error(f"请填写以下必需变量: {', '.join(missing_vars)}")
                         else:
                             # 生成模板ID
-                            template_id = list(templates_manager.templates.keys())[
-                                list(templates_manager.templates.values()).index(selected_template)
-                            ]
+                            template_id = templates_manager.get_template_id(selected_template)
                             
                             # 生成Prompt
                             generated_prompt = templates_manager.generate_prompt(template_id, **template_vars)
@@ -947,7 +1065,7 @@ if PROGRAMMING_TEMPLATES_AVAILABLE:
             if analyze_button and user_requirement:
                 try:
                     with st.spinner("正在分析您的需求..."):
-                        advisor = PromptAdvisor()
+                        advisor = get_cached_advisor()
                         result = advisor.analyze_and_recommend(user_requirement)
                         
                         # 显示分析结果
@@ -1067,14 +1185,15 @@ if EVALUATOR_AVAILABLE:
                     help="提供原始需求有助于更准确的评估"
                 )
             else:
-                if st.session_state.history:
+                recent_history = get_history_store().recent(20, owner=st.session_state.history_owner)
+                if recent_history:
                     selected_history = st.selectbox(
                         "选择历史记录",
-                        options=range(len(st.session_state.history)),
-                        format_func=lambda x: f"{st.session_state.history[x]['requirement'][:50]}... ({format_timestamp(st.session_state.history[x]['timestamp'])})"
+                        options=range(len(recent_history)),
+                        format_func=lambda x: f"{recent_history[x]['requirement'][:50]}... ({format_timestamp(recent_history[x]['timestamp'])})"
                     )
-                    prompt_to_evaluate = st.session_state.history[selected_history]['prompt']
-                    original_requirement = st.session_state.history[selected_history]['requirement']
+                    prompt_to_evaluate = recent_history[selected_history]['prompt']
+                    original_requirement = recent_history[selected_history]['requirement']
                     
                     st.text_area(
                         "提示词预览",
@@ -1200,13 +1319,15 @@ else:
 with tabs[history_tab_index]:
     st.header("📋 您的生成历史")
     
-    if not st.session_state.history:
+    history_store = get_history_store()
+    history_owner = st.session_state.history_owner
+    
+    if not history_store.count(owner=history_owner):
         st.info("还没有生成历史记录。生成一些提示后，它们将显示在这里。")
     else:
         # 历史记录筛选
-        filter_col1, filter_col2, filter_col3 = st.columns(3)
+        filter_col1, filter_col2, filter_col3, filter_col4 = st.columns(4)
         with filter_col1:
-            all_formats = list(set(item["format"] for item in st.session_state.history))
             format_labels = {
                 "standard": "标准", 
                 "expert-panel": "专家讨论", 
@@ -1217,38 +1338,50 @@ with tabs[history_tab_index]:
             }
             format_filter = st.multiselect(
                 "按格式筛选", 
-                options=all_formats,
+                options=history_store.distinct_formats(owner=history_owner),
                 format_func=lambda x: format_labels.get(x, x)
             )
         with filter_col2:
             model_filter = st.multiselect(
                 "按模型筛选", 
-                options=list(set(item["model"] for item in st.session_state.history))
+                options=history_store.distinct_models(owner=history_owner)
             )
         with filter_col3:
             sort_by = st.selectbox(
                 "排序方式",
                 options=["最新优先", "最旧优先"]
             )
+        with filter_col4:
+            search_text = st.text_input("搜索需求或提示", placeholder="输入关键词...")
         
-        # 应用筛选和排序
-        filtered_history = st.session_state.history.copy()
-        if format_filter:
-            filtered_history = [item for item in filtered_history if item["format"] in format_filter]
-        if model_filter:
-            filtered_history = [item for item in filtered_history if item["model"] in model_filter]
+        # 筛选、排序和分页都在数据库中完成
+        total_items = history_store.count(format_filter, model_filter, search_text, owner=history_owner)
+        total_pages = max(1, (total_items + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE)
+        page_col1, page_col2 = st.columns([1, 3])
+        with page_col1:
+            current_page = st.number_input("页码", min_value=1, max_value=total_pages, value=1, step=1)
+        with page_col2:
+            st.caption(f"共 {total_items} 条记录，{total_pages} 页")
         
-        if sort_by == "最旧优先":
-            filtered_history.reverse()
+        filtered_history = history_store.query(
+            page=current_page - 1,
+            page_size=HISTORY_PAGE_SIZE,
+            formats=format_filter,
+            models=model_filter,
+            search=search_text,
+            newest_first=(sort_by == "最新优先"),
+            owner=history_owner
+        )
             
         # 清空历史按钮
         if st.button("🗑️ 清空历史", use_container_width=True):
-            st.session_state.history = []
+            history_store.clear(owner=history_owner)
             st.session_state.prompt_count = 0
             st.rerun()
             
         # 显示历史记录
-        for i, history_item in enumerate(filtered_history):
+        for history_item in filtered_history:
+            i = history_item['id']
             with st.expander(f"{history_item['requirement'][:50]}... ({format_timestamp(history_item['timestamp'])})"):
                 st.markdown(f"""
                 <p>
@@ -1284,7 +1417,7 @@ with tabs[history_tab_index]:
                     st.rerun()
                 
                 if cols[3].button("删除", key=f"delete_{i}", use_container_width=True):
-                    st.session_state.history.remove(history_item)
+                    history_store.delete(history_item['id'], owner=history_owner)
                     st.rerun()
 
 # 使用帮助标签页
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+外部模板存储
+从目录中的YAML/JSON文件加载编程Prompt模板，维护按文件修改时间失效的编译缓存，
+模板正文在首次获取时才从缓存中读取。编译缓存保存在当前用户私有的缓存目录中，
+不会写入（也不会从）模板目录本身读取
+"""
+
+import os
+import json
+import hashlib
+import pickle
+import string
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Any, Optional, Set, Tuple, Iterator
+
+# 尝试导入yaml，如果安装了的话
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    YAML_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 4
+INDEX_CACHE_FILE = "index.pickle"
+BODY_CACHE_FILE = "bodies.bin"
+LIST_FIELDS = ("variables", "tips", "examples")
+TEMPLATE_EXTENSIONS = (".json", ".yaml", ".yml")
+
+
+@dataclass(frozen=True)
+class TemplateMeta:
+    """模板元数据（不含正文）"""
+    template_id: str
+    name: str
+    description: str
+    task_type: str
+    ai_tool: str
+    variables: Tuple[str, ...]
+    tips: Tuple[str, ...]
+    examples: Tuple[str, ...]
+    source: str          # 相对于模板目录的源文件路径
+    body_offset: int     # 正文在正文缓存文件中的字节偏移
+    body_length: int     # 正文的字节长度
+    body_digest: str     # 正文的sha1，读取时用于确认缓存文件未被其他进程改写
+
+
+def _parse_template_file(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    解析单个模板文件
+
+    文件内容可以是单个模板（包含template字段，ID取id字段或文件名），
+    也可以是 {模板ID: 模板字段} 形式的映射
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".json"):
+            data = json.load(f)
+        elif YAML_AVAILABLE:
+            data = yaml.safe_load(f)
+        else:
+            raise ValueError(f"未安装PyYAML，无法解析 {path}")
+
+    if not isinstance(data, dict):
+        raise ValueError(f"模板文件格式错误: {path}")
+
+    if "template" in data:
+        template_id = data.get("id") or os.path.splitext(os.path.basename(path))[0]
+        return {template_id: data}
+    return data
+
+
+def placeholder_root(field_name: str) -> str:
+    """占位符对应的变量名（去掉属性访问和下标部分）"""
+    return field_name.split(".")[0].split("[")[0]
+
+
+def _validate_entry(template_id: Any, data: Any, task_types: Optional[Set[str]],
+                    ai_tools: Optional[Set[str]]) -> Dict[str, Any]:
+    """检查单个模板条目，返回规范化后的元数据字段；不合法时抛出ValueError"""
+    if not isinstance(template_id, str) or not template_id:
+        raise ValueError(f"模板ID必须是非空字符串: {template_id!r}")
+    if not isinstance(data, dict):
+        raise ValueError("模板内容必须是映射")
+    if not isinstance(data.get("template"), str):
+        raise ValueError("缺少字符串类型的template字段")
+    for _, field_name, _, _ in string.Formatter().parse(data["template"]):
+        if field_name is not None and not placeholder_root(field_name).isidentifier():
+            raise ValueError(f"不支持位置占位符 {{{field_name}}}，请使用具名变量")
+
+    fields = {
+        "name": str(data.get("name", template_id)),
+        "description": str(data.get("description", "")),
+        "task_type": data.get("task_type", "code_generation"),
+        "ai_tool": data.get("ai_tool", "general"),
+    }
+    if task_types is not None and fields["task_type"] not in task_types:
+        raise ValueError(f"未知的task_type: {fields['task_type']!r}")
+    if ai_tools is not None and fields["ai_tool"] not in ai_tools:
+        raise ValueError(f"未知的ai_tool: {fields['ai_tool']!r}")
+    for field in LIST_FIELDS:
+        values = data.get(field, [])
+        if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+            raise ValueError(f"{field}必须是字符串列表")
+        fields[field] = tuple(values)
+    return fields
+
+
+def _default_cache_dir(template_dir: str) -> str:
+    """每个模板目录在用户缓存目录下对应一个子目录"""
+    digest = hashlib.sha1(template_dir.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(os.path.expanduser("~/.ai_prompt_engineer"), "cache", "templates", digest)
+
+
+class TemplateStore:
+    """基于目录的模板存储"""
+
+    def __init__(self, template_dir: str, use_cache: bool = True, cache_dir: Optional[str] = None,
+                 task_types: Optional[Set[str]] = None, ai_tools: Optional[Set[str]] = None):
+        """
+        Args:
+            template_dir: 模板目录
+            use_cache: 是否使用编译缓存
+            cache_dir: 编译缓存目录，默认为 ~/.ai_prompt_engineer/cache/templates 下按模板目录区分的子目录
+            task_types: 允许的task_type取值，为空时不检查
+            ai_tools: 允许的ai_tool取值，为空时不检查
+        """
+        self.template_dir = os.path.abspath(template_dir)
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir or _default_cache_dir(self.template_dir)
+        self.index_cache_path = os.path.join(self.cache_dir, INDEX_CACHE_FILE)
+        self.body_cache_path = os.path.join(self.cache_dir, BODY_CACHE_FILE)
+        self.task_types = task_types
+        self.ai_tools = ai_tools
+        self._lock = threading.Lock()
+        self._bodies: Dict[str, str] = {}
+        self._pending_bodies: Optional[Dict[str, str]] = None
+        self.index: Dict[str, TemplateMeta] = self._load_index()
+
+    def _scan_files(self) -> Dict[str, Tuple[int, int]]:
+        """扫描模板目录，返回 {相对路径: (mtime_ns, size)}"""
+        files = {}
+        for root, dirs, filenames in os.walk(self.template_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for filename in filenames:
+                if filename.startswith(".") or not filename.endswith(TEMPLATE_EXTENSIONS):
+                    continue
+                path = os.path.join(root, filename)
+                stat = os.stat(path)
+                files[os.path.relpath(path, self.template_dir)] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def _read_cache(self) -> Dict[str, Any]:
+        """读取编译缓存，缓存损坏或版本不符时返回空缓存"""
+        if not self.use_cache or not os.path.exists(self.index_cache_path):
+            return {}
+        try:
+            # 只反序列化当前用户自己写入的缓存
+            if hasattr(os, "getuid") and os.stat(self.index_cache_path).st_uid != os.getuid():
+                logger.warning(f"忽略不属于当前用户的模板缓存: {self.index_cache_path}")
+                return {}
+            with open(self.index_cache_path, "rb") as f:
+                cache = pickle.load(f)
+            if (cache.get("version") == CACHE_VERSION and cache.get("validation") == self._validation_key()
+                    and os.path.exists(self.body_cache_path)):
+                return cache
+        except Exception as e:
+            logger.warning(f"模板缓存读取失败，将重新编译: {e}")
+        return {}
+
+    def _validation_key(self) -> Tuple[Optional[Tuple[str, ...]], Optional[Tuple[str, ...]]]:
+        """校验条件也是缓存键的一部分，允许的取值变化后缓存中的条目需要重新校验"""
+        return (
+            tuple(sorted(self.task_types)) if self.task_types is not None else None,
+            tuple(sorted(self.ai_tools)) if self.ai_tools is not None else None,
+        )
+
+    def _load_index(self) -> Dict[str, TemplateMeta]:
+        """加载模板索引，只重新解析修改过的文件"""
+        files = self._scan_files()
+        cache = self._read_cache()
+        cached_files = cache.get("files", {})
+
+        if cache and {path: entry["stat"] for path, entry in cached_files.items()} == files:
+            return cache["index"]
+
+        # 未修改的文件沿用缓存中的正文，修改过的文件重新解析
+        old_index: Dict[str, TemplateMeta] = cache.get("index", {})
+        old_bodies = b""
+        if cache:
+            with open(self.body_cache_path, "rb") as f:
+                old_bodies = f.read()
+        bodies: Dict[str, str] = {}
+        raw_entries: Dict[str, Dict[str, Any]] = {}
+        file_entries: Dict[str, Dict[str, Any]] = {}
+
+        for rel_path in sorted(files):
+            cached = cached_files.get(rel_path)
+            if cached and cached["stat"] == files[rel_path]:
+                reused = {}
+                for template_id in cached["template_ids"]:
+                    meta = old_index[template_id]
+                    body = old_bodies[meta.body_offset:meta.body_offset + meta.body_length]
+                    if hashlib.sha1(body).hexdigest() != meta.body_digest:
+                        # 正文缓存已被其他进程改写，重新解析这个文件
+                        break
+                    reused[template_id] = body.decode("utf-8")
+                else:
+                    for template_id, body in reused.items():
+                        raw_entries[template_id] = {"meta": old_index[template_id]}
+                        bodies[template_id] = body
+                    file_entries[rel_path] = cached
+                    continue
+
+            try:
+                parsed = _parse_template_file(os.path.join(self.template_dir, rel_path))
+                template_ids = []
+                for template_id, data in parsed.items():
+                    try:
+                        fields = _validate_entry(template_id, data, self.task_types, self.ai_tools)
+                    except ValueError as e:
+                        logger.warning(f"跳过模板文件 {rel_path} 中无效的模板 {template_id!r}: {e}")
+                        continue
+                    raw_entries[template_id] = {"fields": fields, "source": rel_path}
+                    bodies[template_id] = data["template"]
+                    template_ids.append(template_id)
+            except Exception as e:
+                logger.warning(f"跳过无法解析的模板文件 {rel_path}: {e}")
+                continue
+
+            file_entries[rel_path] = {"stat": files[rel_path], "template_ids": template_ids}
+
+        index = self._write_cache(raw_entries, bodies, file_entries)
+        # 刚写入的正文直接保留在内存中，避免再读一次缓存文件
+        self._pending_bodies = bodies
+        return index
+
+    def _write_cache(self, raw_entries: Dict[str, Dict[str, Any]], bodies: Dict[str, str],
+                     file_entries: Dict[str, Dict[str, Any]]) -> Dict[str, TemplateMeta]:
+        """写入正文缓存和索引缓存"""
+        index = {}
+        body_chunks = []
+        offset = 0
+
+        for template_id, entry in raw_entries.items():
+            encoded = bodies[template_id].encode("utf-8")
+            if "meta" in entry:
+                meta = entry["meta"]
+                source = meta.source
+                fields = {
+                    "name": meta.name, "description": meta.description,
+                    "task_type": meta.task_type, "ai_tool": meta.ai_tool,
+                    "variables": meta.variables, "tips": meta.tips, "examples": meta.examples
+                }
+            else:
+                source = entry["source"]
+                fields = entry["fields"]
+            index[template_id] = TemplateMeta(
+                template_id=template_id, source=source, body_offset=offset, body_length=len(encoded),
+                body_digest=hashlib.sha1(encoded).hexdigest(), **fields
+            )
+            body_chunks.append(encoded)
+            offset += len(encoded)
+
+        if self.use_cache:
+            try:
+                self._atomic_write(self.body_cache_path, b"".join(body_chunks))
+                cache = {"version": CACHE_VERSION, "validation": self._validation_key(),
+                         "files": file_entries, "index": index}
+                self._atomic_write(self.index_cache_path, pickle.dumps(cache, protocol=pickle.HIGHEST_PROTOCOL))
+            except OSError as e:
+                logger.warning(f"无法写入模板缓存: {e}")
+        return index
+
+    def _atomic_write(self, path: str, data: bytes):
+        """先写临时文件再替换，避免并发进程读到半截缓存"""
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _read_body(self, meta: TemplateMeta) -> str:
+        """
+        从正文缓存文件中读取单个模板正文
+
+        索引和正文分两个文件写入，其他进程重建缓存后偏移可能已经对不上，
+        校验失败时直接从源文件重新解析该模板
+        """
+        try:
+            with open(self.body_cache_path, "rb") as f:
+                f.seek(meta.body_offset)
+                body = f.read(meta.body_length)
+            if hashlib.sha1(body).hexdigest() == meta.body_digest:
+                return body.decode("utf-8")
+        except OSError:
+            pass
+
+        logger.info(f"模板正文缓存已变化，从源文件重新读取: {meta.template_id}")
+        parsed = _parse_template_file(os.path.join(self.template_dir, meta.source))
+        data = parsed.get(meta.template_id)
+        if not isinstance(data, dict) or not isinstance(data.get("template"), str):
+            raise KeyError(meta.template_id)
+        return data["template"]
+
+    def get_body(self, template_id: str) -> str:
+        """获取模板正文（首次访问时读取并缓存）"""
+        body = self._bodies.get(template_id)
+        if body is not None:
+            return body
+
+        meta = self.index[template_id]
+        with self._lock:
+            if self._pending_bodies is not None:
+                body = self._pending_bodies[template_id]
+            else:
+                body = self._read_body(meta)
+            self._bodies[template_id] = body
+        return body
+
+    def iter_metadata(self) -> Iterator[TemplateMeta]:
+        """遍历所有模板的元数据（不读取正文）"""
+        return iter(self.index.values())
+
+    def __contains__(self, template_id: str) -> bool:
+        return template_id in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+
+def get_template_dirs_from_env() -> List[str]:
+    """从环境变量 PROMPT_TEMPLATE_DIRS 读取模板目录（多个目录用路径分隔符分隔）"""
+    value = os.environ.get("PROMPT_TEMPLATE_DIRS", "")
+    return [path for path in value.split(os.pathsep) if path]
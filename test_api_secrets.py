@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+测试API密钥来源链的缓存行为
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+import api_secrets
+
+def test_source_chain_parses_once():
+    """测试来源文件只解析一次，刷新后重新加载"""
+    print("🧪 测试API密钥来源链...")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        old_cwd = os.getcwd()
+        old_env_key = os.environ.pop("DEEPSEEK_API_KEY", None)
+        os.chdir(temp_dir)
+        api_secrets.refresh_api_sources()
+        try:
+            assert api_secrets.get_api_key("deepseek") is None
+            
+            Path("config.json").write_text('{"api_key": "sk-from-config", "model": "deepseek-coder"}', encoding="utf-8")
+            # 未刷新前沿用已解析的结果
+            assert api_secrets.get_api_key("deepseek") is None
+            api_secrets.refresh_api_sources()
+            assert api_secrets.get_api_key("deepseek") == "sk-from-config"
+            assert api_secrets.get_api_config()["model"] == "deepseek-coder"
+            
+            # 删除文件后仍从内存读取，不再访问磁盘
+            os.remove("config.json")
+            assert api_secrets.get_api_key("deepseek") == "sk-from-config"
+            
+            if api_secrets.DOTENV_AVAILABLE:
+                Path(".env").write_text('DEEPSEEK_API_KEY="sk-from-dotenv"\n', encoding="utf-8")
+                api_secrets.refresh_api_sources()
+                assert api_secrets.get_api_key("deepseek") == "sk-from-dotenv"
+                # .env不会写入进程环境变量
+                assert "DEEPSEEK_API_KEY" not in os.environ
+            
+            # 环境变量始终优先
+            os.environ["DEEPSEEK_API_KEY"] = "sk-from-env"
+            assert api_secrets.get_api_key("deepseek") == "sk-from-env"
+        finally:
+            os.environ.pop("DEEPSEEK_API_KEY", None)
+            os.chdir(old_cwd)
+            api_secrets.refresh_api_sources()
+            if old_env_key is not None:
+                os.environ["DEEPSEEK_API_KEY"] = old_env_key
+    
+    print("✅ API密钥来源链测试通过")
+
+if __name__ == "__main__":
+    test_source_chain_parses_once()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+测试AutoPromptEngineer的批量推理
+"""
+
+import os
+import json
+import string
+import tempfile
+import threading
+import time
+
+from auto_prompt_engineer import AutoPromptEngineer, deduplicate_prompts, parse_variations
+
+class BatchEchoModel:
+    """回显输入部分；记录每次批量调用的大小"""
+
+    def __init__(self):
+        self.batches = []
+
+    def generate(self, prompt):
+        raise AssertionError("实现了generate_batch的模型不应逐条调用")
+
+    def generate_batch(self, prompts):
+        self.batches.append(len(prompts))
+        return [prompt.rsplit("Input: ", 1)[-1] for prompt in prompts]
+
+class ExactScorer:
+    def score(self, generated, reference):
+        return float(generated == reference)
+
+def test_grid_is_sent_in_bounded_batches():
+    """测试候选×输入网格按批量上限分批发送，结果顺序与逐条调用一致"""
+    print("🧪 测试批量推理...")
+
+    model = BatchEchoModel()
+    ape = AutoPromptEngineer(model, ExactScorer(), inference_batch_size=4)
+    inputs = ["a", "b", "c"]
+    scores = ape.evaluate_prompts(["p1", "p2", "p3"], inputs, ["a", "x", "c"])
+    assert scores == [2 / 3] * 3
+    assert model.batches == [4, 4, 1]
+
+    per_input = ape.score_candidates(["p1"], inputs, ["a", "b", "x"])
+    assert per_input == [[1.0, 1.0, 0.0]]
+
+    # 只实现generate的模型逐条调用
+    class SingleModel:
+        calls = 0
+
+        def generate(self, prompt):
+            SingleModel.calls += 1
+            return prompt.rsplit("Input: ", 1)[-1]
+
+    assert AutoPromptEngineer(SingleModel(), ExactScorer()).evaluate_prompt("p", inputs, inputs) == 1.0
+    assert SingleModel.calls == 3
+
+    class ShortBatchModel(BatchEchoModel):
+        def generate_batch(self, prompts):
+            return super().generate_batch(prompts)[:-1]
+
+    try:
+        AutoPromptEngineer(ShortBatchModel(), ExactScorer()).evaluate_prompt("p", inputs, inputs)
+        assert False, "批量结果数量不符时应当报错"
+    except ValueError:
+        pass
+
+    print("✅ 批量推理测试通过")
+
+class CountingEchoModel:
+    """逐条回显；调用次数达到limit时模拟Ctrl-C"""
+
+    def __init__(self, limit=None):
+        self.calls = 0
+        self.limit = limit
+
+    def generate(self, prompt):
+        if self.calls == self.limit:
+            raise KeyboardInterrupt
+        self.calls += 1
+        return prompt.rsplit("Input: ", 1)[-1]
+
+class PrefixResampler:
+    """每次调用返回三种不同写法的变体，带前言和代码块围栏"""
+
+    STYLES = ["Answer briefly", "Think step by step", "Respond formally",
+              "Use plain language", "Cite evidence first", "Give one example"]
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, instruction):
+        self.calls += 1
+        base = instruction.rsplit("\n\n", 1)[-1]
+        styles = self.STYLES[(self.calls - 1) * 3:self.calls * 3]
+        return "Here are the variations:\n```json\n" + json.dumps([f"{style}: {base}" for style in styles]) + "\n```"
+
+def test_resume_continues_from_checkpoint():
+    """测试中断后从检查点继续：已评估的候选和已生成的变体不再重复请求，结果与不中断时一致"""
+    print("🧪 测试检查点恢复...")
+
+    inputs, references = ["a", "b"], ["a", "x"]
+    candidates = ["p1", "p2", "p3"]
+    expected_model = CountingEchoModel()
+    expected_ape = AutoPromptEngineer(expected_model, ExactScorer(), PrefixResampler())
+    expected = expected_ape.find_optimal_prompt(candidates, inputs, references, iterations=2)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "search.json")
+        ape = AutoPromptEngineer(CountingEchoModel(limit=9), ExactScorer(), PrefixResampler())
+        ape.set_demonstration_pairs([("q", "a")])
+        try:
+            ape.find_optimal_prompt(candidates, inputs, references, iterations=2, checkpoint_path=path)
+            assert False, "应当被中断"
+        except KeyboardInterrupt:
+            pass
+        assert os.listdir(tmp) == ["search.json"]
+        # 评估数据只在第一行写一次，之后每个候选追加一行进度
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        assert '"eval_inputs"' in lines[0] and not any('"eval_inputs"' in line for line in lines[1:])
+        assert len(lines) == 1 + 4 + 1
+        # 追加记录时中断留下的半行被忽略
+        with open(path, "a", encoding="utf-8") as f:
+            f.write('{"evaluated": {"prompt": "Thi')
+
+        model, resampler = CountingEchoModel(), PrefixResampler()
+        resampler.calls = 1  # 同一个重采样模型，接着第2次调用
+        resumed = AutoPromptEngineer(model, ExactScorer(), resampler)
+        assert resumed.resume(path) == expected
+        assert resumed.demo_pairs == [("q", "a")]
+        # 中断前完成了3个初始候选和第1轮的第1个变体（9次调用中的8次）
+        assert model.calls == expected_model.calls - 8
+        assert resumed.model_calls == expected_ape.model_calls
+        assert resampler.calls == 2
+
+    print("✅ 检查点恢复测试通过")
+
+class GrowingResampler:
+    """变异在末尾追加字母移位后的自身，交叉拼接两个父代；记录同时进行的请求数"""
+
+    SHIFT = str.maketrans(string.ascii_lowercase, string.ascii_lowercase[1:] + "a")
+
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def generate(self, instruction):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.01)
+        with self.lock:
+            self.active -= 1
+        if "Prompt 1:" in instruction:
+            first, second = instruction.split("Prompt 1:\n", 1)[1].split("\n\nPrompt 2:\n")
+            return first + " " + second
+        base = instruction.rsplit("\n\n", 1)[-1]
+        return json.dumps([base + " " + base.translate(self.SHIFT)])
+
+class LengthScorer:
+    """提示越长得分越高（回显模型把提示的长度作为输出）"""
+
+    def score(self, generated, reference):
+        return float(generated)
+
+def test_evolve_prompts_respects_budget():
+    """测试进化搜索：最优分数不下降、并行请求变体、不超出模型调用预算、同一种子结果可复现"""
+    print("🧪 测试进化搜索...")
+
+    class LengthModel:
+        def generate(self, prompt):
+            return str(len(prompt.split("\nInput: ")[0]))
+
+    inputs, references = ["a", "b"], ["", ""]
+    runs = []
+    for _ in range(2):
+        resampler = GrowingResampler()
+        ape = AutoPromptEngineer(LengthModel(), LengthScorer(), resampler, seed=3)
+        best_prompt, best_score = ape.evolve_prompts(["x", "yy", "zzz"], inputs, references, population_size=3,
+                                                     generations=10, offspring_per_generation=4,
+                                                     crossover_rate=0.5, max_model_calls=50)
+        runs.append((best_prompt, ape.generation_stats))
+
+        stats = ape.generation_stats
+        assert ape.model_calls <= 50 and stats[-1]["model_calls"] == ape.model_calls
+        assert all(earlier["best_score"] <= later["best_score"] for earlier, later in zip(stats, stats[1:]))
+        assert best_score == stats[-1]["best_score"] > 3
+        assert resampler.max_active > 1
+
+    assert runs[0] == runs[1]
+
+    # 预算不足以评估全部初始候选时只评估放得下的部分，一个都放不下时报错
+    ape = AutoPromptEngineer(LengthModel(), LengthScorer(), GrowingResampler())
+    ape.evolve_prompts(["x", "yy", "zzz"], inputs, references, max_model_calls=4)
+    assert ape.model_calls == 4
+    assert ape.generation_stats[0]["evaluated"] == 2 and len(ape.generation_stats) == 1
+    try:
+        ape.evolve_prompts(["x"], inputs, references, max_model_calls=1)
+        assert False, "预算不足时应当报错"
+    except ValueError:
+        pass
+
+    print("✅ 进化搜索测试通过")
+
+def test_variations_are_parsed_and_deduplicated():
+    """测试从带前言、编号或被截断的回复中解析变体，近似重复的变体不进入评估"""
+    print("🧪 测试变体解析与去重...")
+
+    reply = 'Sure! Here are [2] options:\n```json\n["Summarize the text.\\nKeep it short.", {"prompt": "Condense the passage"}, "Summ'
+    assert parse_variations(reply) == ["Summarize the text.\nKeep it short.", "Condense the passage"]
+    assert parse_variations("Here are the variations:\n1. Summarize the text\n- Condense the passage\n\n") == [
+        "Summarize the text", "Condense the passage"]
+    # 没有可用提示的回复不产生变体
+    for reply in ("[]", '["", " "]', "[1, 2]", 'Here you go:\n```json\n[{"text": "x"}, null]\n```'):
+        assert parse_variations(reply) == [], reply
+    # 前言中的方括号不是变体数组，按行解析；编号行以冒号结尾时仍是变体
+    assert parse_variations("Here are [3] variations:\n1. Foo bar\n2. Bar baz\n3. Baz qux") == [
+        "Foo bar", "Bar baz", "Baz qux"]
+    assert parse_variations("1. Answer the question below:\n2. Respond to the following:\n3. Reply concisely") == [
+        "Answer the question below:", "Respond to the following:", "Reply concisely"]
+
+    class EmptyResampler:
+        def generate(self, instruction):
+            return "[1, 2]"
+
+    model = CountingEchoModel()
+    AutoPromptEngineer(model, ExactScorer(), EmptyResampler()).find_optimal_prompt(["p"], ["a"], ["a"], iterations=2)
+    assert model.calls == 1
+
+    prompts = ["Summarize the following article in three sentences.",
+               "summarize the following article in three sentences",
+               "Summarize the following article in 3 sentences.",
+               "Write a three-sentence summary of this article.",
+               "  "]
+    assert deduplicate_prompts(prompts) == [prompts[0], prompts[3]]
+    assert deduplicate_prompts(prompts, known=[prompts[3]]) == [prompts[0]]
+
+    class RepeatingResampler:
+        def generate(self, instruction):
+            return json.dumps(["Answer: {q}", "answer {q}!", "Reply to {q} in one word", "Answer:  {q}"])
+
+    model = CountingEchoModel()
+    ape = AutoPromptEngineer(model, ExactScorer(), RepeatingResampler())
+    ape.find_optimal_prompt(["Answer: {q}"], ["a"], ["a"], iterations=2, variations_per_iter=4)
+    # 只有一个真正的新变体被评估；第2轮的变体都已评估过
+    assert model.calls == 2
+    assert ape.model_calls == 4
+
+    print("✅ 变体解析与去重测试通过")
+
+if __name__ == "__main__":
+    test_grid_is_sent_in_bounded_batches()
+    test_resume_continues_from_checkpoint()
+    test_evolve_prompts_respects_budget()
+    test_variations_are_parsed_and_deduplicated()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+测试离线批处理任务（使用本地模拟服务器，不需要网络）
+"""
+
+import json
+
+from batch_jobs import BatchAPIClient, OfflineBatchJob, build_batch_lines, parse_batch_results
+from mock_openai_server import MockOpenAIServer
+from prompt_engineer import PromptEngineer
+
+ITEMS = [
+    {"id": "req-1", "requirement": "创建一个排序函数", "format": "coding", "programming_language": "Go"},
+    {"id": "req-2", "requirement": "设计一个博客系统", "format": "architecture", "max_tokens": 500},
+    {"id": "req-3", "requirement": "写一首诗"},
+]
+
+def test_batch_round_trip():
+    """测试打包、提交、轮询和按请求ID取回结果"""
+    print("🧪 测试离线批处理...")
+    
+    engineer = PromptEngineer(api_key="sk-test", model_name="gpt-4o-mini", api_provider="openai")
+    lines = [json.loads(line) for line in build_batch_lines(engineer, ITEMS)]
+    assert [line["custom_id"] for line in lines] == ["req-1", "req-2", "req-3"]
+    assert lines[0]["url"] == "/v1/chat/completions"
+    assert "Go" in lines[0]["body"]["messages"][-1]["content"]
+    assert lines[1]["body"]["max_tokens"] == 500
+    
+    try:
+        list(build_batch_lines(engineer, ITEMS + [{"id": "req-1", "requirement": "重复"}]))
+        assert False, "应当拒绝重复的请求ID"
+    except ValueError:
+        pass
+    
+    with MockOpenAIServer(batch_delay=0.05) as server:
+        job = OfflineBatchJob(engineer, BatchAPIClient("sk-test", server.api_base))
+        statuses = []
+        batch = job.submit(ITEMS)
+        batch = job.client.wait_for_batch(batch["id"], poll_interval=0.02, timeout=10,
+                                          on_status=lambda b: statuses.append(b["status"]))
+        assert statuses[-1] == "completed"
+        assert batch["request_counts"]["completed"] == 3
+        
+        results = job.collect(batch)
+        assert set(results) == {"req-1", "req-2", "req-3"}
+        assert "创建一个排序函数" in results["req-1"]["prompt"]
+        
+        ordered = job.run(list(reversed(ITEMS)), poll_interval=0.02, timeout=10)
+        assert [result["id"] for result in ordered] == ["req-3", "req-2", "req-1"]
+        assert all(result["error"] is None for result in ordered)
+    
+    print("✅ 离线批处理测试通过")
+
+def test_parse_batch_errors():
+    """测试失败请求映射为错误信息"""
+    output = json.dumps({"custom_id": "ok", "response": {"status_code": 200, "body": {
+        "choices": [{"message": {"content": "结果"}}]}}, "error": None})
+    failed = json.dumps({"custom_id": "bad", "response": {"status_code": 400, "body": {
+        "error": {"message": "invalid model"}}}, "error": None})
+    errors = json.dumps({"custom_id": "err", "response": None, "error": {"message": "expired"}})
+    # 部分提供商直接以字符串返回错误
+    plain = "\n".join([
+        json.dumps({"custom_id": "plain", "response": None, "error": "rate limited"}),
+        json.dumps({"custom_id": "plain-body", "response": {"status_code": 500, "body": {"error": "server error"}}}),
+    ])
+    results = parse_batch_results(output + "\n" + failed, errors + "\n" + plain)
+    assert results["ok"] == {"prompt": "结果", "error": None}
+    assert results["bad"]["error"] == "invalid model"
+    assert results["err"]["error"] == "expired"
+    assert results["plain"]["error"] == "rate limited"
+    assert results["plain-body"]["error"] == "server error"
+
+if __name__ == "__main__":
+    test_batch_round_trip()
+    test_parse_batch_errors()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+测试批量评分指标及其在AutoPromptEngineer中的使用
+"""
+
+import random
+from collections import Counter
+
+from auto_prompt_engineer import AutoPromptEngineer
+from batch_metrics import (BatchMetricScorer, char_ngram_similarity, exact_match, rouge_l, token_f1,
+                           tokenize)
+
+def _reference_f1(generated, reference):
+    if not generated and not reference:
+        return 1.0
+    overlap = sum((Counter(generated) & Counter(reference)).values())
+    if not overlap:
+        return 0.0
+    precision, recall = overlap / len(generated), overlap / len(reference)
+    return 2 * precision * recall / (precision + recall)
+
+def _lcs(left, right):
+    row = [0] * (len(right) + 1)
+    for item in left:
+        diagonal = 0
+        for j, other in enumerate(right, 1):
+            above = row[j]
+            row[j] = diagonal + 1 if item == other else max(row[j], row[j - 1])
+            diagonal = above
+    return row[-1]
+
+def test_batch_metrics_match_per_pair_reference():
+    """测试向量化指标与逐对实现的结果一致"""
+    print("🧪 测试批量评分指标...")
+
+    rng = random.Random(0)
+    words = "the a cat dog 排序 函数 run fast slow 创建 Sort!".split()
+    generated = [" ".join(rng.choice(words) for _ in range(rng.randint(0, 25))) for _ in range(300)]
+    references = [" ".join(rng.choice(words) for _ in range(rng.randint(0, 25))) for _ in range(300)]
+
+    f1_scores = token_f1(generated, references)
+    rouge_scores = rouge_l(generated, references)
+    for index, (text, reference) in enumerate(zip(generated, references)):
+        tokens, reference_tokens = tokenize(text), tokenize(reference)
+        assert abs(f1_scores[index] - _reference_f1(tokens, reference_tokens)) < 1e-9
+        # LCS的精确率和召回率的F1即 2 * LCS / (两个长度之和)
+        lcs = _lcs(tokens, reference_tokens)
+        expected = 2 * lcs / (len(tokens) + len(reference_tokens)) if tokens or reference_tokens else 1.0
+        assert abs(rouge_scores[index] - expected) < 1e-9
+
+    assert exact_match(["Hello, World!", "a"], ["hello world", "b"]).tolist() == [1.0, 0.0]
+    ngram = char_ngram_similarity(["排序函数实现", "abc", ""], ["排序函数设计", "abc", "x"])
+    assert 0 < ngram[0] < 1 and ngram[1] == 1.0 and ngram[2] == 0.0
+    assert token_f1([], []).tolist() == []
+
+    # 西里尔字母、带重音的拉丁字母和带组合符号的文字按完整单词计分，不会被当作空文本
+    assert tokenize("Привет, мир!") == ["привет", "мир"]
+    assert tokenize("Wörld café naïve") == ["wörld", "café", "naïve"]
+    assert tokenize("हिन्दी भाषा sort_list") == ["हिन्दी", "भाषा", "sort_list"]
+    for metric in (token_f1, rouge_l):
+        assert metric(["Привет мир", "crème brûlée", "Привет мир"],
+                      ["Совсем другое", "crème fraîche", "привет, мир"]).tolist() == [0.0, 0.5, 1.0]
+
+    try:
+        rouge_l(["a"], [])
+        assert False, "长度不一致时应当报错"
+    except ValueError:
+        pass
+
+    print("✅ 批量评分指标测试通过")
+
+def test_evaluate_prompt_uses_score_batch():
+    """测试评分模型提供score_batch时每个候选只调用一次"""
+    print("🧪 测试AutoPromptEngineer批量评分...")
+
+    class EchoModel:
+        def generate(self, prompt):
+            return prompt.rsplit("Input: ", 1)[-1]
+
+    class CountingScorer(BatchMetricScorer):
+        batch_calls = 0
+
+        def score(self, generated, reference):
+            raise AssertionError("不应逐对评分")
+
+        def score_batch(self, generated_list, references):
+            CountingScorer.batch_calls += 1
+            return super().score_batch(generated_list, references)
+
+    ape = AutoPromptEngineer(EchoModel(), CountingScorer("exact_match"))
+    inputs = ["创建排序函数", "解释量子物理", "写一首诗"]
+    score = ape.evaluate_prompt("回答问题", inputs, ["创建排序函数", "解释量子物理", "别的"])
+    assert abs(score - 2 / 3) < 1e-9
+    assert CountingScorer.batch_calls == 1
+
+    # 只实现score的评分模型仍按逐对方式工作
+    class PairScorer:
+        def score(self, generated, reference):
+            return float(generated == reference)
+
+    assert AutoPromptEngineer(EchoModel(), PairScorer()).evaluate_prompt("p", inputs, inputs) == 1.0
+
+    print("✅ AutoPromptEngineer批量评分测试通过")
+
+if __name__ == "__main__":
+    test_batch_metrics_match_per_pair_reference()
+    test_evaluate_prompt_uses_score_batch()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+测试few-shot示例检索索引
+"""
+
+import os
+import json
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+import example_index
+from example_index import ExampleIndex, select_relevant_examples
+
+EXAMPLES = [
+    {"input": "创建一个Python函数来计算斐波那契数列", "output": "斐波那契"},
+    {"input": "重构这段重复的JavaScript代码", "output": "重构"},
+    {"input": "Create a marketing campaign for a new water bottle", "output": "marketing"},
+    {"input": "为React组件编写单元测试", "output": "测试"},
+    {"input": "Write a SQL query to find duplicate customers", "output": "sql"},
+]
+
+def test_relevance_ranking():
+    """测试按需求检索最相关的示例"""
+    print("🧪 测试示例检索...")
+    
+    index = ExampleIndex()
+    index.add(EXAMPLES)
+    
+    assert index.top_k("用Python实现斐波那契", 1)[0]["output"] == "斐波那契"
+    assert index.top_k("marketing plan for a bottle", 1)[0]["output"] == "marketing"
+    assert index.top_k("find duplicate rows with SQL", 2)[0]["output"] == "sql"
+    # 完全不相关时退回前k个示例
+    assert index.top_k("zzz", 2) == EXAMPLES[:2]
+    
+    selected = select_relevant_examples("编写React单元测试", EXAMPLES, top_k=2)
+    assert selected[0]["output"] == "测试"
+    assert select_relevant_examples("任意", EXAMPLES[:2], top_k=5) == EXAMPLES[:2]
+    
+    print("✅ 示例检索测试通过")
+
+def test_persisted_index_updates_incrementally():
+    """测试索引持久化，追加示例时只索引新增部分，修改已有示例时重建"""
+    print("🧪 测试示例索引持久化...")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        examples_path = Path(temp_dir) / "examples.json"
+        examples_path.write_text(json.dumps(EXAMPLES[:3], ensure_ascii=False), encoding="utf-8")
+        
+        index = ExampleIndex.from_file(str(examples_path))
+        assert len(index) == 3
+        assert Path(f"{examples_path}.index.npz").exists()
+        
+        # 索引文件不复制示例内容
+        with np.load(f"{examples_path}.index.npz") as data:
+            assert "examples" not in data.files
+        
+        # 未变化时直接加载，不读取示例文件也不重新向量化
+        original_add = ExampleIndex.add
+        original_iter = example_index.iter_examples
+        added = []
+        ExampleIndex.add = lambda self, examples: added.append(len(examples)) or original_add(self, examples)
+        try:
+            def fail_iter(*args, **kwargs):
+                raise AssertionError("示例文件未变化时不应重新读取")
+            example_index.iter_examples = fail_iter
+            unchanged = ExampleIndex.from_file(str(examples_path))
+            example_index.iter_examples = original_iter
+            assert len(unchanged) == 3 and added == []
+            # 检索结果按序号从示例文件读取
+            assert unchanged.top_k("Python斐波那契", 1) == [EXAMPLES[0]]
+            assert unchanged.top_k("zzz", 2) == EXAMPLES[:2]
+            assert unchanged.head(2) == EXAMPLES[:2] and unchanged.head(100) == EXAMPLES[:len(unchanged)]
+            
+            # 只有修改时间变化时不重建
+            stat = examples_path.stat()
+            os.utime(examples_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            assert len(ExampleIndex.from_file(str(examples_path))) == 3
+            assert added == []
+            
+            examples_path.write_text(json.dumps(EXAMPLES, ensure_ascii=False), encoding="utf-8")
+            index = ExampleIndex.from_file(str(examples_path))
+            assert added == [2]
+            assert index.top_k("SQL duplicate customers", 1)[0]["output"] == "sql"
+            
+            changed = [dict(EXAMPLES[0], input="完全不同的输入")] + EXAMPLES[1:]
+            examples_path.write_text(json.dumps(changed, ensure_ascii=False), encoding="utf-8")
+            index = ExampleIndex.from_file(str(examples_path))
+            assert added == [2, 5]
+        finally:
+            ExampleIndex.add = original_add
+            example_index.iter_examples = original_iter
+        
+        reloaded = ExampleIndex.load(f"{examples_path}.index.npz")
+        assert reloaded.examples == changed
+        assert reloaded.top_k("React单元测试", 1)[0]["output"] == "测试"
+    
+    print("✅ 示例索引持久化测试通过")
+
+if __name__ == "__main__":
+    test_relevance_ranking()
+    test_persisted_index_updates_incrementally()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+测试示例文件流式读取
+"""
+
+import io
+import os
+import json
+import tempfile
+
+import examples_loader
+from examples_loader import iter_examples, load_examples, sample_examples
+
+EXAMPLES = [{"input": f"需求 {i} " + "详细" * (i % 50), "output": f"结果 {i}", "score": i / 3} for i in range(2000)]
+
+def test_streaming_formats():
+    """测试JSON数组（跨越多个读取块）和JSONL解析结果一致，格式错误时抛出ValueError"""
+    print("🧪 测试示例流式解析...")
+
+    original = examples_loader.CHUNK_SIZE
+    examples_loader.CHUNK_SIZE = 31
+    try:
+        array_text = json.dumps(EXAMPLES, ensure_ascii=False, indent=2)
+        assert list(iter_examples(io.StringIO(array_text))) == EXAMPLES
+        jsonl_text = "\n".join(json.dumps(example, ensure_ascii=False) for example in EXAMPLES) + "\n\n"
+        assert list(iter_examples(io.StringIO(jsonl_text))) == EXAMPLES
+        assert list(iter_examples(io.StringIO("[1, 22 , 333]"))) == [1, 22, 333]
+        assert list(iter_examples(io.StringIO(" [ ] "))) == []
+    finally:
+        examples_loader.CHUNK_SIZE = original
+
+    for bad in ('[{"input": 1} {"input": 2}]', '[{"input": 1},', '{"input": 1}\n{oops}'):
+        try:
+            list(iter_examples(io.StringIO(bad)))
+            assert False, f"应当拒绝: {bad}"
+        except ValueError:
+            pass
+
+    # 只取前几个时不需要解析整个文件
+    stream = iter_examples(io.StringIO(json.dumps(EXAMPLES) + "\n这里不是JSON"))
+    assert next(stream) == EXAMPLES[0]
+    assert list(iter_examples(io.StringIO(json.dumps(EXAMPLES) + "\n这里不是JSON"), limit=3)) == EXAMPLES[:3]
+    jsonl_with_garbage = "\n".join(json.dumps(example) for example in EXAMPLES[:5]) + "\n{oops}\n"
+    assert list(iter_examples(io.StringIO(jsonl_with_garbage), limit=5)) == EXAMPLES[:5]
+    assert list(iter_examples(io.StringIO(jsonl_with_garbage), limit=0)) == []
+
+    sample = sample_examples(io.StringIO(json.dumps(EXAMPLES)), 10, seed=7)
+    assert len(sample) == 10 and all(example in EXAMPLES for example in sample)
+    assert sample == sample_examples(io.StringIO(json.dumps(EXAMPLES)), 10, seed=7)
+
+    print("✅ 示例流式解析测试通过")
+
+def test_load_examples_is_cached_by_mtime():
+    """测试按修改时间缓存，文件变化后重新读取"""
+    print("🧪 测试示例文件缓存...")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "examples.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(json.dumps(example, ensure_ascii=False) for example in EXAMPLES[:100]))
+
+        first = load_examples(path)
+        assert first == EXAMPLES[:100]
+        assert load_examples(path) is first
+        assert load_examples(path, limit=5) == EXAMPLES[:5]
+
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n" + json.dumps(EXAMPLES[100], ensure_ascii=False))
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        assert load_examples(path) == EXAMPLES[:101]
+
+    print("✅ 示例文件缓存测试通过")
+
+if __name__ == "__main__":
+    test_streaming_formats()
+    test_load_examples_is_cached_by_mtime()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+测试 prompt_engineer 的导入耗时，防止CLI启动重新引入重量级依赖
+"""
+
+import os
+import re
+import sys
+import subprocess
+
+# 导入耗时预算（毫秒），可通过环境变量调整
+IMPORT_BUDGET_MS = float(os.environ.get("PROMPT_ENGINEER_IMPORT_BUDGET_MS", "100"))
+HEAVY_MODULES = ("requests", "cryptography", "streamlit", "dotenv", "secure_api_manager", "api_secrets")
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _import_time_ms() -> float:
+    """用 -X importtime 测量导入 prompt_engineer 的累计耗时"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import prompt_engineer"],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True
+    )
+    match = re.search(r"^import time:\s+\d+ \|\s+(\d+) \| prompt_engineer$", result.stderr, re.MULTILINE)
+    assert match, result.stderr[-500:]
+    return int(match.group(1)) / 1000
+
+def test_prompt_engineer_import_budget():
+    """测试导入不加载重量级依赖，且耗时在预算之内"""
+    print("🧪 测试prompt_engineer导入耗时...")
+    
+    result = subprocess.run(
+        [sys.executable, "-c",
+         "import sys, prompt_engineer; print(','.join(m for m in %r if m in sys.modules))" % (HEAVY_MODULES,)],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "", f"导入时加载了重量级模块: {result.stdout.strip()}"
+    
+    # 取多次测量的最小值，降低机器抖动的影响
+    elapsed_ms = min(_import_time_ms() for _ in range(3))
+    print(f"   导入耗时: {elapsed_ms:.1f}ms（预算 {IMPORT_BUDGET_MS:.0f}ms）")
+    assert elapsed_ms < IMPORT_BUDGET_MS, f"导入耗时 {elapsed_ms:.1f}ms 超出预算 {IMPORT_BUDGET_MS:.0f}ms"
+    
+    print("✅ 导入耗时测试通过")
+
+if __name__ == "__main__":
+    test_prompt_engineer_import_budget()
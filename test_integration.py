@@ -118,6 +118,37 @@ def test_streamlit_integration():
         traceback.print_exc()
         return False
 
+def test_shared_instances():
+    """测试模板库和建议器在进程内只构建一次"""
+    print("\n🔁 测试共享实例...")
+    
+    import threading
+    from programming_prompt_templates import get_programming_templates
+    from prompt_advisor import get_prompt_advisor
+    
+    results = []
+    workers = [threading.Thread(target=lambda: results.append(get_prompt_advisor())) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    
+    assert all(advisor is results[0] for advisor in results)
+    assert results[0].templates is get_programming_templates()
+    
+    # 模板表只读，避免某个会话修改影响其他会话
+    templates = get_programming_templates()
+    try:
+        templates.templates["new"] = None
+        assert False, "模板表不应允许修改"
+    except TypeError:
+        pass
+    
+    template = templates.get_template("code_review")
+    assert templates.get_template_id(template) == "code_review"
+    print("✅ 共享实例正常")
+    return True
+
 def main():
     """主测试函数"""
     print("🚀 开始集成测试...")
@@ -126,7 +157,8 @@ def main():
     tests = [
         test_programming_templates,
         test_prompt_advisor,
-        test_streamlit_integration
+        test_streamlit_integration,
+        test_shared_instances
     ]
     
     passed = 0
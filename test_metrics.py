@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+测试热路径指标采集和导出
+"""
+
+import metrics
+from mock_openai_server import MockOpenAIServer
+from prompt_engineer import PromptEngineer
+
+def test_hot_path_metrics_exported():
+    """测试通过本地模拟服务器生成提示时记录各阶段耗时"""
+    print("🧪 测试热路径指标...")
+
+    metrics.REGISTRY.reset()
+    metrics.enable()
+    spans = []
+    listener = lambda name, start_ns, end_ns, labels: spans.append((name, end_ns - start_ns))
+    metrics.add_span_listener(listener)
+    try:
+        with MockOpenAIServer() as server:
+            engineer = PromptEngineer(api_key="sk-test", model_name="gpt-4o-mini",
+                                      base_url=server.api_base + "/chat/completions")
+            prompt = engineer.generate_coding_prompt("创建一个排序函数")
+            assert "创建一个排序函数" in prompt
+
+            engineer.base_url = server.api_base + "/missing"
+            engineer.generate_formatted_prompt("另一个需求")
+    finally:
+        metrics.remove_span_listener(listener)
+        metrics.enable(False)
+
+    snapshot = metrics.REGISTRY.snapshot()
+    for name in ("prompt_engineer_prompt_build_seconds", "prompt_engineer_generate_seconds",
+                 "prompt_engineer_http_connect_seconds", "prompt_engineer_http_ttfb_seconds",
+                 "prompt_engineer_http_total_seconds", "prompt_engineer_json_decode_seconds"):
+        assert name in snapshot, name
+    assert snapshot["prompt_engineer_generate_seconds"]['{format="coding"}']["count"] == 1
+    assert snapshot["prompt_engineer_fallbacks_total"]['{reason="HTTPError"}']["value"] == 1
+    assert snapshot["prompt_engineer_inflight_lookups_total"]['{result="leader"}']["value"] == 2
+    assert any(name == "prompt_engineer_http_total_seconds" and duration > 0 for name, duration in spans)
+
+    text = metrics.REGISTRY.export_prometheus()
+    assert "# TYPE prompt_engineer_http_ttfb_seconds histogram" in text
+    assert 'prompt_engineer_generate_seconds_bucket{format="coding",le="+Inf"} 1' in text
+
+    # 关闭时不再记录
+    metrics.REGISTRY.reset()
+    PromptEngineer(use_mock=True).generate_formatted_prompt("测试")
+    assert metrics.REGISTRY.snapshot() == {}
+
+    print("✅ 热路径指标测试通过")
+
+if __name__ == "__main__":
+    test_hot_path_metrics_exported()
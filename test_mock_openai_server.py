@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+测试本地OpenAI兼容模拟服务器的流式输出和生成速度模拟
+"""
+
+import json
+import time
+
+from mock_openai_server import MockOpenAIServer
+from prompt_engineer import get_http_session
+
+def test_streaming_and_token_rate():
+    """测试补齐输出长度、按生成速度延迟以及SSE流式输出与非流式内容一致"""
+    print("🧪 测试模拟服务器流式输出...")
+
+    session = get_http_session()
+    headers = {"Authorization": "Bearer sk-test"}
+    request = {"model": "mock", "messages": [{"role": "user", "content": "你好"}], "max_tokens": 40}
+    with MockOpenAIServer(token_rate=400, output_tokens=20) as server:
+        url = server.api_base + "/chat/completions"
+
+        start = time.perf_counter()
+        completion = session.post(url, headers=headers, json=request, timeout=10).json()
+        assert time.perf_counter() - start >= 20 / 400
+        text = completion["choices"][0]["message"]["content"]
+        assert completion["usage"]["completion_tokens"] == 20
+        assert text.startswith("[mock] Mock completion for: 你好")
+
+        response = session.post(url, headers=headers, json=dict(request, stream=True), timeout=10, stream=True)
+        assert response.headers["Content-Type"] == "text/event-stream"
+        events = [line[6:] for line in response.iter_lines() if line.startswith(b"data: ")]
+        assert events[-1] == b"[DONE]"
+        chunks = [json.loads(event) for event in events[:-1]]
+        assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+        assert "".join(chunk["choices"][0]["delta"].get("content", "") for chunk in chunks) == text
+
+        # 同一个keep-alive连接上的下一个请求仍然正常
+        assert session.post(url, headers=headers, json=request, timeout=10).status_code == 200
+
+    print("✅ 模拟服务器流式输出测试通过")
+
+if __name__ == "__main__":
+    test_streaming_and_token_rate()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+测试性能回归门禁的统计比较和合成语料
+"""
+
+import os
+import sys
+import json
+import random
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+
+from perf_gate import compare, mann_whitney_greater, run_gate, synthetic_prompt, synthetic_repo
+
+def _noisy(median, count=9, noise=0.1, seed=0):
+    rng = random.Random(seed)
+    return [median * (1 + rng.uniform(-noise, noise)) for _ in range(count)]
+
+def test_compare_detects_regressions_beyond_tolerance():
+    """测试超过容忍度且显著的变慢判定为回归，噪声和机器变慢不误报"""
+    print("🧪 测试性能比较...")
+
+    calibrations = [0.02] * 9
+    baseline = {"samples": _noisy(0.010), "calibrations": calibrations}
+
+    assert compare(_noisy(0.010, seed=1), calibrations, baseline)["status"] == "ok"
+    assert compare(_noisy(0.0105, seed=2), calibrations, baseline, tolerance=0.25)["status"] == "ok"
+    assert compare(_noisy(0.015, seed=3), calibrations, baseline, tolerance=0.25)["status"] == "regression"
+    assert compare(_noisy(0.015, seed=3), calibrations, baseline, tolerance=0.6)["status"] == "ok"
+    assert compare(_noisy(0.006, seed=4), calibrations, baseline)["status"] == "improvement"
+
+    # 整台机器慢一倍（校准负载同样变慢）时不算回归
+    assert compare(_noisy(0.020, seed=5), [0.04] * 9, baseline)["status"] == "ok"
+
+    # 单个离群样本不足以判定回归
+    outlier = _noisy(0.010, seed=6)
+    outlier[0] = 0.5
+    assert compare(outlier, calibrations, baseline)["status"] == "ok"
+
+    assert mann_whitney_greater([2.0, 3.0, 4.0, 5.0, 6.0], [1.0, 1.1, 1.2, 1.3, 1.4]) < 0.05
+    assert mann_whitney_greater([1.0, 1.1, 1.2], [1.0, 1.1, 1.2]) > 0.4
+
+    print("✅ 性能比较测试通过")
+
+def test_gate_runs_against_baseline_file():
+    """测试生成基线后再次运行门禁能完成比较，且合成语料是确定性的"""
+    print("🧪 测试性能门禁流程...")
+
+    assert synthetic_prompt(4096) == synthetic_prompt(4096)
+    assert len(synthetic_prompt(4096).encode("utf-8")) >= 4096
+
+    with tempfile.TemporaryDirectory() as tmp:
+        repo = os.path.join(tmp, "repo")
+        synthetic_repo(repo, 150)
+        assert len(os.listdir(repo)) == 4  # 两个包目录 + .gitignore + requirements.txt
+
+        baseline_path = os.path.join(tmp, "baseline.json")
+        passed, results = run_gate("quick", ["evaluator"], samples=3, baseline_path=baseline_path,
+                                   update_baseline=True)
+        assert passed and {result["status"] for result in results} == {"baseline"}
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            assert set(json.load(f)["cases"]) == {"evaluator/1KB", "evaluator/64KB"}
+
+        # 用很宽的容忍度比较，只验证流程而不受机器噪声影响
+        passed, results = run_gate("quick", ["evaluator"], samples=3, baseline_path=baseline_path,
+                                   tolerance=10.0)
+        assert passed and all("ratio" in result for result in results)
+
+    print("✅ 性能门禁流程测试通过")
+
+if __name__ == "__main__":
+    test_compare_detects_regressions_beyond_tolerance()
+    test_gate_runs_against_baseline_file()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+测试PromptEngineer的并发请求合并
+"""
+
+import time
+import asyncio
+import threading
+
+import prompt_engineer
+from prompt_engineer import PromptEngineer
+from token_budget import TokenBudget, TokenBudgetExceeded, estimate_tokens
+
+def _engineer_with_fake_api(calls, api_key="sk-test", base_url=None):
+    """构造一个不发起网络请求、每次调用耗时50ms的PromptEngineer"""
+    engineer = PromptEngineer(api_key=api_key, api_provider="deepseek", model_name="deepseek-chat",
+                              base_url=base_url)
+    
+    def fake_completion(messages, temperature, max_tokens):
+        calls.append(messages[-1]["content"])
+        time.sleep(0.05)
+        return f"结果: {engineer.base_url} {messages[-1]['content']}"
+    
+    engineer._request_completion = fake_completion
+    return engineer
+
+def test_threaded_calls_are_coalesced():
+    """测试多个线程的相同请求只调用一次API"""
+    print("🧪 测试线程请求合并...")
+    
+    calls = []
+    engineer = _engineer_with_fake_api(calls)
+    before = prompt_engineer.get_coalescing_stats()
+    messages = [{"role": "user", "content": "创建一个排序函数"}]
+    results = []
+    barrier = threading.Barrier(8)
+    
+    def worker():
+        barrier.wait()
+        results.append(engineer._call_api(messages, temperature=0.2, max_tokens=100))
+    
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(calls) == 1
+    assert results == [f"结果: {engineer.base_url} 创建一个排序函数"] * 8
+    stats = prompt_engineer.get_coalescing_stats()
+    assert stats["executed"] - before["executed"] == 1
+    assert stats["coalesced"] - before["coalesced"] == 7
+    assert stats["in_flight"] == 0
+    
+    # 参数不同的请求不会合并，完成后的请求也不会被复用
+    engineer._call_api(messages, temperature=0.9, max_tokens=100)
+    engineer._call_api(messages, temperature=0.2, max_tokens=100)
+    assert len(calls) == 3
+    
+    # 不同端点或不同API密钥的引擎不会共享进行中的请求
+    engineers = [engineer, _engineer_with_fake_api(calls, base_url="http://127.0.0.1:9/v1/chat/completions"),
+                 _engineer_with_fake_api(calls, api_key="sk-other")]
+    barrier = threading.Barrier(len(engineers))
+    results = [None] * len(engineers)
+    
+    def call(index):
+        barrier.wait()
+        results[index] = engineers[index]._call_api(messages, temperature=0.2, max_tokens=100)
+    
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(len(engineers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 6
+    assert results[1] == "结果: http://127.0.0.1:9/v1/chat/completions 创建一个排序函数"
+    
+    print("✅ 线程请求合并测试通过")
+
+def test_async_calls_are_coalesced():
+    """测试asyncio协程与线程共享同一个进行中的请求"""
+    print("🧪 测试协程请求合并...")
+    
+    calls = []
+    engineer = _engineer_with_fake_api(calls)
+    messages = [{"role": "user", "content": "设计用户接口"}]
+    
+    async def run():
+        thread_result = []
+        # 协程发起的请求进行中时，线程调用者也会合并到同一个请求上
+        async def late_thread_caller():
+            await asyncio.sleep(0.01)
+            await asyncio.to_thread(lambda: thread_result.append(engineer._call_api(messages)))
+        
+        results = await asyncio.gather(
+            *(engineer._call_api_async(messages) for _ in range(5)), late_thread_caller()
+        )
+        return results[:5] + thread_result
+    
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert results == [f"结果: {engineer.base_url} 设计用户接口"] * 6
+    
+    print("✅ 协程请求合并测试通过")
+
+def test_token_budget_trims_examples_and_rejects_oversized():
+    """测试按上下文窗口裁剪示例、收紧max_tokens并在请求前拒绝超长输入"""
+    print("🧪 测试token预算...")
+    
+    assert estimate_tokens("创建排序函数") == 6
+    assert estimate_tokens("hello world!") == 5
+    
+    requests_sent = []
+    engineer = PromptEngineer(api_key="sk-test", api_provider="deepseek", model_name="deepseek-chat")
+    engineer.token_budget = TokenBudget("deepseek-chat", context_window=1200, min_output_tokens=100)
+    engineer._request_completion = lambda messages, temperature, max_tokens: \
+        requests_sent.append((messages, max_tokens)) or "ok"
+    
+    examples = [{"input": f"示例输入{i} " + "x" * 200, "output": f"示例输出{i} " + "y" * 200} for i in range(20)]
+    assert engineer.generate_prompt_with_examples("写一个函数", examples, max_tokens=500) == "ok"
+    messages, max_tokens = requests_sent[-1]
+    user_content = messages[1]["content"]
+    assert "Example 1:" in user_content
+    assert "Example 20:" not in user_content
+    assert engineer.token_budget.count_messages(messages) + max_tokens <= 1200
+    assert max_tokens >= 100
+    
+    # 短请求保持原有的max_tokens
+    engineer.generate_formatted_prompt("写一个函数", max_tokens=300)
+    assert requests_sent[-1][1] == 300
+    
+    # 放不下的请求在发出前被拒绝
+    count_before = len(requests_sent)
+    try:
+        engineer.generate_formatted_prompt("需求" * 2000)
+        assert False, "应当拒绝超出上下文窗口的请求"
+    except TokenBudgetExceeded as e:
+        assert e.prompt_tokens > 1200
+    assert len(requests_sent) == count_before
+    
+    print("✅ token预算测试通过")
+
+if __name__ == "__main__":
+    test_threaded_calls_are_coalesced()
+    test_async_calls_are_coalesced()
+    test_token_budget_trims_examples_and_rejects_oversized()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+测试持久化历史记录存储
+"""
+
+import os
+import time
+import sqlite3
+import tempfile
+from pathlib import Path
+
+from prompt_history import PromptHistoryStore, get_history_owner, HISTORY_OWNER_ENV
+
+def test_history_store_queries():
+    """测试筛选、全文检索和分页"""
+    print("🧪 测试历史记录存储...")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = str(Path(temp_dir) / "history.db")
+        store = PromptHistoryStore(db_path)
+        
+        for i in range(45):
+            store.add(
+                requirement=f"需求{i}：创建一个排序函数" if i % 3 == 0 else f"需求{i}：设计用户接口",
+                prompt=f"提示内容 {i}",
+                format_name="coding" if i % 2 else "standard",
+                model_name="deepseek-chat",
+                timestamp=1000.0 + i
+            )
+        
+        assert store.count() == 45
+        assert store.distinct_formats() == ["coding", "standard"]
+        
+        first_page = store.query(page=0, page_size=20)
+        assert len(first_page) == 20
+        assert first_page[0]["requirement"].startswith("需求44")
+        last_page = store.query(page=2, page_size=20)
+        assert len(last_page) == 5
+        
+        oldest = store.query(page=0, page_size=1, newest_first=False)[0]
+        assert oldest["timestamp"] == 1000.0
+        
+        # 三元组全文检索（支持中文子串）与短关键词回退
+        assert store.count(search="排序函数") == 15
+        assert store.count(search="接口") == 30
+        assert store.count(formats=["coding"], search="排序函数") == 7
+        
+        store.delete(first_page[0]["id"])
+        assert store.count() == 44
+        store.close()
+        
+        # 重新打开后数据仍在
+        reopened = PromptHistoryStore(db_path)
+        assert reopened.count() == 44
+        assert reopened.count(search="排序函数") == 15
+        reopened.clear()
+        assert reopened.count() == 0
+        assert reopened.count(search="排序函数") == 0
+        reopened.close()
+    
+    print("✅ 历史记录存储正常")
+
+def test_history_is_scoped_by_owner():
+    """测试共享数据库的会话只能查询、删除和清空自己的记录，旧版数据库自动补齐owner列"""
+    print("🧪 测试历史记录隔离...")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = str(Path(temp_dir) / "history.db")
+        # 旧版表结构，没有owner列
+        with sqlite3.connect(db_path) as conn:
+            conn.execute("CREATE TABLE history (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp REAL NOT NULL, "
+                         "requirement TEXT NOT NULL, prompt TEXT NOT NULL, format TEXT NOT NULL, model TEXT NOT NULL)")
+            conn.execute("INSERT INTO history (timestamp, requirement, prompt, format, model) "
+                         "VALUES (1, '旧记录', '旧提示', 'standard', 'm')")
+        
+        store = PromptHistoryStore(db_path)
+        alice_id = store.add("Alice的需求", "Alice的提示", "coding", "m1", owner="alice")
+        store.add("Bob的需求", "Bob的提示", "standard", "m2", owner="bob")
+        
+        assert [item["requirement"] for item in store.recent(owner="alice")] == ["Alice的需求"]
+        assert store.count(owner="bob") == 1 and store.count() == 3
+        assert store.count(search="的提示", owner="alice") == 1
+        assert store.distinct_formats(owner="alice") == ["coding"]
+        assert store.distinct_models(owner="bob") == ["m2"]
+        
+        assert not store.delete(alice_id, owner="bob")
+        store.clear(owner="bob")
+        assert store.count(owner="bob") == 0
+        assert store.count(owner="alice") == 1 and store.count() == 2
+        assert store.delete(alice_id, owner="alice")
+        store.close()
+    
+    print("✅ 历史记录隔离正常")
+
+def test_history_survives_new_session_and_is_pruned():
+    """测试新会话按配置的所属者读回之前的记录，超出保留上限的旧记录被清理"""
+    print("🧪 测试历史记录保留...")
+    
+    old_owner = os.environ.pop(HISTORY_OWNER_ENV, None)
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            db_path = str(Path(temp_dir) / "history.db")
+            store = PromptHistoryStore(db_path, max_rows=3)
+            for i in range(5):
+                store.add(f"需求{i}", f"提示{i}", "standard", "m", timestamp=1000.0 + i, owner=get_history_owner())
+            store.add("他人的需求", "他人的提示", "standard", "m", owner="bob")
+            store.close()
+            
+            # 新会话重新打开数据库、重新获取所属者
+            reopened = PromptHistoryStore(db_path, max_rows=3)
+            owner = get_history_owner()
+            assert [item["requirement"] for item in reopened.recent(owner=owner)] == ["需求4", "需求3", "需求2"]
+            assert reopened.count(search="提示0") == 0
+            assert reopened.count(owner="bob") == 1
+            reopened.close()
+            
+            os.environ[HISTORY_OWNER_ENV] = "alice"
+            aged = PromptHistoryStore(db_path, max_age_days=1)
+            aged.add("很久以前", "旧提示", "standard", "m", timestamp=time.time() - 2 * 86400, owner=get_history_owner())
+            aged.add("刚刚", "新提示", "standard", "m", owner=get_history_owner())
+            assert [item["requirement"] for item in aged.recent(owner="alice")] == ["刚刚"]
+            aged.close()
+    finally:
+        os.environ.pop(HISTORY_OWNER_ENV, None)
+        if old_owner is not None:
+            os.environ[HISTORY_OWNER_ENV] = old_owner
+    
+    print("✅ 历史记录保留正常")
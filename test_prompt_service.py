@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+测试Prompt生成HTTP服务
+"""
+
+import json
+import socket
+import threading
+import urllib.request
+import urllib.error
+
+import prompt_service
+from prompt_service import PromptService, ServiceError, create_server
+
+def _request(base_url, method, path, payload=None):
+    data = json.dumps(payload).encode("utf-8") if payload is not None else None
+    request = urllib.request.Request(base_url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def test_service_endpoints():
+    """测试各接口通过HTTP正常工作"""
+    print("🧪 测试Prompt服务接口...")
+    
+    server = create_server(port=0, workers=2, max_queue=4, use_mock=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        status, body = _request(base_url, "GET", "/health")
+        assert status == 200 and body["status"] == "ok"
+        
+        status, body = _request(base_url, "GET", "/formats")
+        assert "coding" in body["formats"]
+        
+        for format_name in body["formats"]:
+            status, result = _request(base_url, "POST", "/generate",
+                                      {"requirement": "创建一个排序函数", "format": format_name})
+            assert status == 200, result
+            assert "创建一个排序函数" in result["prompt"]
+        
+        status, result = _request(base_url, "POST", "/evaluate", {"prompt": "## 任务\n请创建一个排序函数"})
+        assert status == 200 and result["grade"]
+        assert isinstance(result["scores"][0]["metric"], str)
+        
+        status, result = _request(base_url, "POST", "/advise", {"requirement": "帮我用Python写一个爬虫"})
+        assert status == 200 and result["recommendations"]
+        
+        status, result = _request(base_url, "GET", "/templates")
+        template = result["templates"][0]
+        variables = {name: "示例" for name in template["variables"]}
+        status, result = _request(base_url, "POST", "/render",
+                                  {"template_id": template["template_id"], "variables": variables})
+        assert status == 200 and result["prompt"]
+        
+        status, result = _request(base_url, "POST", "/render",
+                                  {"template_id": template["template_id"], "variables": {}})
+        assert status == 400
+        status, result = _request(base_url, "POST", "/generate", {"format": "standard"})
+        assert status == 400
+        status, result = _request(base_url, "GET", "/missing")
+        assert status == 404
+        
+        # 非法或缺失的Content-Length立即返回错误，不会阻塞工作线程
+        host, port = server.server_address[:2]
+        for header, expected in (("Content-Length: abc\r\n", 400), ("Content-Length: -1\r\n", 400), ("", 411)):
+            with socket.create_connection((host, port), timeout=5) as connection:
+                connection.sendall(f"POST /generate HTTP/1.1\r\nHost: x\r\n{header}\r\n".encode("ascii"))
+                assert connection.recv(64).split(b" ")[1] == str(expected).encode("ascii")
+        
+        # 客户端指定的模型不会让缓存的PromptEngineer无限增长
+        for index in range(prompt_service.MAX_CACHED_ENGINEERS + 5):
+            server.service.get_engineer("deepseek", f"model-{index}", True)
+        assert len(server.service._engineers) == prompt_service.MAX_CACHED_ENGINEERS
+        assert ("deepseek", "model-0", True) not in server.service._engineers
+    finally:
+        server.shutdown()
+        server.server_close()
+        server.service.shutdown()
+    
+    print("✅ Prompt服务接口测试通过")
+
+def test_service_backpressure():
+    """测试工作线程和排队名额用尽时返回503"""
+    print("🧪 测试Prompt服务背压...")
+    
+    service = PromptService(workers=1, max_queue=1, use_mock=True)
+    release = threading.Event()
+    try:
+        blocked = [service.pool.submit(release.wait) for _ in range(2)]
+        try:
+            service.pool.submit(release.wait)
+            assert False, "应当拒绝超出排队上限的请求"
+        except ServiceError as e:
+            assert e.status == 503
+        
+        status, body = service.dispatch("POST", "/generate", {"requirement": "测试"})
+        assert status == 503
+        # 健康检查不经过工作线程池
+        status, body = service.dispatch("GET", "/health", {})
+        assert status == 200 and body["pool"]["rejected"] == 2
+        
+        release.set()
+        for future in blocked:
+            future.result(timeout=5)
+        status, body = service.dispatch("POST", "/generate", {"requirement": "测试"})
+        assert status == 200
+    finally:
+        release.set()
+        service.shutdown()
+    
+    print("✅ Prompt服务背压测试通过")
+
+if __name__ == "__main__":
+    test_service_endpoints()
+    test_service_backpressure()
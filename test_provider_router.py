@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+测试多提供商路由（使用本地模拟服务器）
+"""
+
+import time
+import socket
+
+from mock_openai_server import MockOpenAIServer
+from prompt_engineer import PromptEngineer
+from provider_router import Endpoint, ProviderRouter, RouterError
+from token_budget import TokenBudgetExceeded
+
+MESSAGES = [{"role": "user", "content": "创建一个排序函数"}]
+
+def _endpoint(name, server=None, model="mock-model"):
+    if server is None:
+        # 绑定后立即释放的端口，连接会被拒绝
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        url = f"http://127.0.0.1:{port}/v1/chat/completions"
+    else:
+        url = server.api_base + "/chat/completions"
+    return Endpoint(name=name, url=url, api_key="sk-test", model=model)
+
+def test_failover_and_latency_routing():
+    """测试失败切换和按延迟选择端点"""
+    print("🧪 测试路由失败切换与延迟选择...")
+    
+    with MockOpenAIServer() as fast, MockOpenAIServer(latency=0.05) as slow:
+        router = ProviderRouter([_endpoint("dead"), _endpoint("slow", slow), _endpoint("fast", fast, "fast-model")],
+                                hedge=False, min_samples=2, ejection_seconds=60)
+        try:
+            # 首个端点不可用时切换到下一个
+            assert "Mock completion" in router.complete(MESSAGES)
+            assert router.stats()["failovers"] >= 1
+            
+            for _ in range(6):
+                router.complete(MESSAGES)
+            stats = router.stats()
+            assert stats["endpoints"]["dead"]["healthy"] is False
+            assert router.ranked_endpoints()[0].name == "fast"
+            assert stats["endpoints"]["fast"]["p50_ms"] < stats["endpoints"]["slow"]["p50_ms"]
+            assert router.complete(MESSAGES).startswith("[fast-model]")
+        finally:
+            router.shutdown()
+        
+        all_dead = ProviderRouter([_endpoint("dead-1"), _endpoint("dead-2")], hedge=False)
+        try:
+            all_dead.complete(MESSAGES)
+            assert False, "所有端点失败时应当抛出RouterError"
+        except RouterError:
+            pass
+        finally:
+            all_dead.shutdown()
+    
+    print("✅ 路由失败切换与延迟选择测试通过")
+
+def test_hedged_request():
+    """测试首选端点过慢时对冲请求先返回"""
+    print("🧪 测试对冲请求...")
+    
+    with MockOpenAIServer(latency=0.5) as slow, MockOpenAIServer() as fast:
+        router = ProviderRouter([_endpoint("slow", slow, "slow-model"), _endpoint("fast", fast, "fast-model")],
+                                hedge_after=0.05)
+        try:
+            start_time = time.perf_counter()
+            result = router.complete(MESSAGES)
+            elapsed = time.perf_counter() - start_time
+            assert result.startswith("[fast-model]")
+            assert elapsed < 0.4
+            stats = router.stats()
+            assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+        finally:
+            router.shutdown()
+        
+        # 失败切换后按正在等待的后备端点计算对冲阈值
+        router = ProviderRouter([_endpoint("dead"), _endpoint("slow", slow), _endpoint("fast", fast)])
+        delays_for = []
+        router._hedge_delay = lambda endpoint: delays_for.append(endpoint.name)
+        try:
+            router.complete(MESSAGES)
+            assert delays_for == ["dead", "slow"]
+        finally:
+            router.shutdown()
+        
+        try:
+            ProviderRouter([_endpoint("a", fast), _endpoint("a", slow)])
+            assert False, "端点名称重复时应当报错"
+        except ValueError:
+            pass
+    
+    print("✅ 对冲请求测试通过")
+
+def test_prompt_engineer_with_router():
+    """测试PromptEngineer通过路由发送请求"""
+    with MockOpenAIServer() as server:
+        router = ProviderRouter([_endpoint("local", server, "local-model")])
+        try:
+            engineer = PromptEngineer(model_name="deepseek-chat", api_provider="deepseek", router=router)
+            assert engineer.has_live_backend
+            prompt = engineer.generate_formatted_prompt("写一个爬虫")
+            assert prompt.startswith("[local-model]") and "写一个爬虫" in prompt
+        finally:
+            router.shutdown()
+        
+        # token预算按路由端点的模型计算：gpt-4的上下文窗口比deepseek-chat小得多
+        router = ProviderRouter([_endpoint("small", server, "gpt-4")])
+        try:
+            engineer = PromptEngineer(model_name="deepseek-chat", api_provider="deepseek", router=router)
+            try:
+                engineer.generate_formatted_prompt("需求" * 10000)
+                assert False, "应当按端点模型的上下文窗口拒绝请求"
+            except TokenBudgetExceeded as e:
+                assert e.context_window == 8192
+            assert router.stats()["endpoints"]["small"]["requests"] == 0
+        finally:
+            router.shutdown()
+        
+        engineer = PromptEngineer(api_key="sk-test", model_name="local-model",
+                                  base_url=server.api_base + "/chat/completions")
+        assert engineer.generate_formatted_prompt("写一个爬虫").startswith("[local-model]")
+
+if __name__ == "__main__":
+    test_failover_and_latency_routing()
+    test_hedged_request()
+    test_prompt_engineer_with_router()
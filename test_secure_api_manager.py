@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+测试安全存储的内存保险箱和密钥代理
+"""
+
+import os
+import time
+import socket
+import tempfile
+import threading
+from pathlib import Path
+
+import secure_api_manager
+from secure_api_manager import SecureAPIManager, KeyAgentServer, _agent_request
+
+def test_vault_and_agent():
+    """测试一次解锁后从保险箱和代理读取密钥"""
+    print("🧪 测试密钥保险箱...")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        old_home = os.environ.get("HOME")
+        old_env_key = os.environ.pop("DEEPSEEK_API_KEY", None)
+        os.environ["HOME"] = temp_dir
+        try:
+            manager = SecureAPIManager()
+            manager.agent_socket = str(Path(temp_dir) / "agent.sock")
+            manager._get_master_password = lambda confirm=False: "master-password"
+            assert manager._save_secure_key("deepseek", "sk-vault-test-key-123456")
+            
+            # 未解锁时不读取安全存储
+            assert manager._get_secure_key("deepseek") is None
+            
+            assert not manager.unlock("wrong-password")
+            assert manager.unlock("master-password", ttl=60)
+            assert manager.get_api_key("deepseek") == "sk-vault-test-key-123456"
+            
+            # 代理从同一个保险箱提供密钥，另一个管理器无需密码即可读取
+            server = KeyAgentServer(manager.agent_socket)
+            assert os.stat(manager.agent_socket).st_mode & 0o077 == 0
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                assert _agent_request(manager.agent_socket, "STATUS").startswith("OK ")
+                # 不接管正在运行的代理
+                try:
+                    KeyAgentServer(manager.agent_socket)
+                    assert False, "已有代理在运行时应当拒绝启动"
+                except OSError:
+                    pass
+                assert _agent_request(manager.agent_socket, "STATUS").startswith("OK ")
+                secure_api_manager._vault.lock()
+                assert _agent_request(manager.agent_socket, "GET deepseek") == "NONE"
+                
+                manager.unlock("master-password", ttl=60)
+                client = SecureAPIManager()
+                client.agent_socket = manager.agent_socket
+                secure_api_manager._vault.lock()
+                assert client._get_secure_key("deepseek") is None
+                manager.unlock("master-password", ttl=60)
+                assert client._query_agent("deepseek") == "sk-vault-test-key-123456"
+                
+                assert _agent_request(manager.agent_socket, "LOCK") == "OK"
+                thread.join(timeout=5)
+                assert not thread.is_alive()
+            finally:
+                server.server_close()
+            assert not os.path.exists(manager.agent_socket)
+            assert manager._get_secure_key("deepseek") is None
+            
+            # 进程退出后遗留的套接字文件可以被替换
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            stale.bind(manager.agent_socket)
+            stale.close()
+            KeyAgentServer(manager.agent_socket).server_close()
+            
+            # TTL到期后自动清空
+            manager.unlock("master-password", ttl=0.05)
+            time.sleep(0.1)
+            assert manager._get_secure_key("deepseek") is None
+        finally:
+            secure_api_manager._vault.lock()
+            if old_home is not None:
+                os.environ["HOME"] = old_home
+            if old_env_key is not None:
+                os.environ["DEEPSEEK_API_KEY"] = old_env_key
+    
+    print("✅ 密钥保险箱测试通过")
+
+def test_cached_key_resolution():
+    """测试密钥解析缓存在环境变量和配置文件变化时失效"""
+    print("🧪 测试密钥解析缓存...")
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        old_cwd = os.getcwd()
+        old_home = os.environ.get("HOME")
+        old_env_key = os.environ.pop("DEEPSEEK_API_KEY", None)
+        os.environ["HOME"] = temp_dir
+        os.chdir(temp_dir)
+        secure_api_manager.clear_api_key_cache()
+        try:
+            assert secure_api_manager.get_api_key("deepseek") is None
+            assert secure_api_manager.get_secure_api_manager() is secure_api_manager.get_secure_api_manager()
+            
+            Path("config.json").write_text('{"deepseek_api_key": "sk-from-config"}', encoding="utf-8")
+            assert secure_api_manager.get_api_key("deepseek") == "sk-from-config"
+            
+            # 缓存命中时不再调用管理器
+            calls = []
+            manager = secure_api_manager.get_secure_api_manager()
+            original = manager.get_api_key
+            manager.get_api_key = lambda provider: calls.append(provider) or original(provider)
+            try:
+                assert secure_api_manager.get_api_key("deepseek") == "sk-from-config"
+                assert calls == []
+                
+                os.environ["DEEPSEEK_API_KEY"] = "sk-from-env"
+                assert secure_api_manager.get_api_key("deepseek") == "sk-from-env"
+                del os.environ["DEEPSEEK_API_KEY"]
+                
+                Path("config.json").write_text('{"deepseek_api_key": "sk-config-updated"}', encoding="utf-8")
+                assert secure_api_manager.get_api_key("deepseek") == "sk-config-updated"
+                assert len(calls) == 2
+            finally:
+                manager.get_api_key = original
+        finally:
+            os.chdir(old_cwd)
+            secure_api_manager.clear_api_key_cache()
+            if old_home is not None:
+                os.environ["HOME"] = old_home
+            if old_env_key is not None:
+                os.environ["DEEPSEEK_API_KEY"] = old_env_key
+    
+    print("✅ 密钥解析缓存测试通过")
+
+if __name__ == "__main__":
+    test_vault_and_agent()
+    test_cached_key_resolution()
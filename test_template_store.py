@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+测试外部模板存储和编译缓存
+"""
+
+import os
+import json
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+from programming_prompt_templates import (
+    ProgrammingPromptTemplates, ProgrammingTaskType, MissingVariablesError, CompiledTemplate
+)
+from template_store import TemplateStore, INDEX_CACHE_FILE
+
+@contextmanager
+def temporary_home():
+    """把HOME指向临时目录，编译缓存不写入真实的用户目录"""
+    old_home = os.environ.get("HOME")
+    with tempfile.TemporaryDirectory() as home:
+        os.environ["HOME"] = home
+        try:
+            yield Path(home)
+        finally:
+            if old_home is not None:
+                os.environ["HOME"] = old_home
+
+def write_templates(template_dir: Path):
+    """创建测试模板文件"""
+    with open(template_dir / "sql_review.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "name": "SQL审查",
+            "description": "审查SQL语句",
+            "task_type": "code_review",
+            "ai_tool": "general",
+            "template": "请审查以下{dialect} SQL：\n{sql}",
+            "variables": ["dialect", "sql"]
+        }, f, ensure_ascii=False)
+    
+    with open(template_dir / "team.yaml", "w", encoding="utf-8") as f:
+        f.write(
+            "commit_message:\n"
+            "  name: 提交信息\n"
+            "  task_type: documentation\n"
+            "  template: \"为以下改动写提交信息：{diff}\"\n"
+            "  variables: [diff]\n"
+        )
+
+def test_external_templates():
+    """测试从目录加载外部模板"""
+    print("🧪 测试外部模板加载...")
+    
+    with temporary_home(), tempfile.TemporaryDirectory() as temp_dir:
+        write_templates(Path(temp_dir))
+        templates = ProgrammingPromptTemplates([temp_dir])
+        
+        assert "sql_review" in templates.templates
+        assert "commit_message" in templates.templates
+        assert "function_generation" in templates.templates
+        
+        prompt = templates.generate_prompt("sql_review", dialect="PostgreSQL", sql="SELECT 1")
+        assert "PostgreSQL" in prompt and "SELECT 1" in prompt
+        
+        review_templates = templates.get_templates_by_task_type(ProgrammingTaskType.CODE_REVIEW)
+        assert "SQL审查" in [template.name for template in review_templates]
+        assert templates.get_template_id(templates.get_template("commit_message")) == "commit_message"
+        # 模板不可修改，列表字段也以元组保存
+        assert templates.get_template("sql_review").variables == ("dialect", "sql")
+        assert isinstance(templates.get_template("function_generation").tips, tuple)
+    
+    print("✅ 外部模板加载正常")
+
+def test_compiled_cache_invalidation():
+    """测试编译缓存命中和按修改时间失效"""
+    print("🧪 测试模板编译缓存...")
+    
+    with temporary_home() as home, tempfile.TemporaryDirectory() as temp_dir:
+        template_dir = Path(temp_dir)
+        write_templates(template_dir)
+        
+        store = TemplateStore(temp_dir)
+        # 缓存写入用户目录，模板目录保持不变
+        assert Path(store.index_cache_path).exists()
+        assert Path(store.cache_dir).is_relative_to(home)
+        assert sorted(os.listdir(temp_dir)) == ["sql_review.json", "team.yaml"]
+        assert store.get_body("sql_review").startswith("请审查")
+        
+        # 缓存命中时只读取索引，正文在访问时才从缓存文件读取
+        cached_store = TemplateStore(temp_dir)
+        assert cached_store._pending_bodies is None
+        assert cached_store.get_body("commit_message") == "为以下改动写提交信息：{diff}"
+        
+        # 修改文件后缓存失效并重新解析
+        sql_path = template_dir / "sql_review.json"
+        data = json.loads(sql_path.read_text(encoding="utf-8"))
+        data["template"] = "新版本：{sql}"
+        data["variables"] = ["sql"]
+        sql_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        stat = sql_path.stat()
+        os.utime(sql_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        
+        updated_store = TemplateStore(temp_dir)
+        assert updated_store.get_body("sql_review") == "新版本：{sql}"
+        assert updated_store.index["sql_review"].variables == ("sql",)
+        assert updated_store.get_body("commit_message") == "为以下改动写提交信息：{diff}"
+
+        # 另一个进程重建缓存后，已加载的存储仍能读到正确的正文
+        loaded_store = TemplateStore(temp_dir)
+        data["template"] = "更长的新版本，正文偏移会变化：{sql}"
+        sql_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.utime(sql_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10**9))
+        TemplateStore(temp_dir)
+        assert loaded_store.get_body("commit_message") == "为以下改动写提交信息：{diff}"
+
+        # 校验条件变化时不复用按旧条件筛选的缓存
+        assert "sql_review" not in TemplateStore(temp_dir, task_types={"documentation"})
+        assert "sql_review" in TemplateStore(temp_dir)
+
+    print("✅ 模板编译缓存正常")
+
+def test_invalid_entries_are_skipped():
+    """测试缺少字段或取值无效的模板被跳过，同一目录中的其他模板正常加载"""
+    print("🧪 测试无效模板...")
+    
+    with temporary_home(), tempfile.TemporaryDirectory() as temp_dir:
+        template_dir = Path(temp_dir)
+        write_templates(template_dir)
+        with open(template_dir / "broken.json", "w", encoding="utf-8") as f:
+            json.dump({
+                "no_body": {"name": "缺少正文", "variables": []},
+                "bogus_type": {"template": "{x}", "task_type": "bogus"},
+                "bogus_tool": {"template": "{x}", "ai_tool": "bogus"},
+                "bad_variables": {"template": "{x}", "variables": "x"},
+                "positional": {"template": "检查{}和{0}", "variables": []},
+                "unbalanced": {"template": "检查{x", "variables": ["x"]},
+                "good_one": {"template": "检查{x}", "task_type": "testing", "variables": ["x"]}
+            }, f, ensure_ascii=False)
+        (template_dir / "garbage.json").write_text("{not json", encoding="utf-8")
+        
+        templates = ProgrammingPromptTemplates([temp_dir])
+        for template_id in ("no_body", "bogus_type", "bogus_tool", "bad_variables", "positional", "unbalanced"):
+            assert template_id not in templates.templates
+        assert "sql_review" in templates.templates and "commit_message" in templates.templates
+        assert templates.generate_prompt("good_one", x="代码") == "检查代码"
+        
+        # 按类型遍历和列出全部模板不会因无效条目失败
+        assert len(templates.list_all_templates()) == len(templates.templates)
+        testing = templates.get_templates_by_task_type(ProgrammingTaskType.TESTING)
+        assert "good_one" in [templates.get_template_id(template) for template in testing]
+        
+        # 直接编译带位置占位符的模板时给出明确错误
+        for text in ("检查{}", "检查{0.name}"):
+            try:
+                CompiledTemplate(text, [])
+                assert False, text
+            except ValueError as e:
+                assert "位置占位符" in str(e)
+        assert CompiledTemplate("{user.name}和{{}}", []).required == ("user",)
+    
+    print("✅ 无效模板被跳过")
+
+def test_render_many():
+    """测试预编译模板批量渲染和缺失变量校验"""
+    print("🧪 测试批量渲染...")
+    
+    templates = ProgrammingPromptTemplates()
+    rows = [
+        {"language": "Go", "code_content": "func main() {}", "context_info": "CLI工具"},
+        {"language": "Rust", "code_content": "fn main() {}", "context_info": 42},
+    ]
+    prompts = templates.render_many("code_review", rows)
+    
+    template_text = templates.get_template("code_review").template
+    assert prompts == [template_text.format(**row) for row in rows]
+    
+    # 一次报告全部缺失变量
+    try:
+        templates.generate_prompt("code_review", language="Go")
+        assert False, "缺少变量时应抛出异常"
+    except MissingVariablesError as e:
+        assert e.missing == ["code_content", "context_info"]
+    
+    try:
+        templates.render_many("code_review", rows + [{"language": "C"}])
+        assert False, "缺少变量时应抛出异常"
+    except ValueError as e:
+        assert e.row_index == 2
+    
+    print("✅ 批量渲染正常")
+
+def test_render_file_cli():
+    """测试从CSV/JSONL流式批量渲染"""
+    print("🧪 测试批量渲染文件...")
+    
+    from programming_prompt_templates import render_file
+    
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_path = Path(temp_dir) / "rows.jsonl"
+        with open(input_path, "w", encoding="utf-8") as f:
+            for i in range(50):
+                f.write(json.dumps({"language": "Python", "code_content": f"x = {i}", "context_info": "demo"}) + "\n")
+            f.write(json.dumps({"language": "Python"}) + "\n")
+        
+        single_path = Path(temp_dir) / "single.jsonl"
+        stats = render_file("code_review", str(input_path), str(single_path),
+                            chunk_size=8, skip_invalid=True, progress_interval=0)
+        assert stats["rendered"] == 50 and stats["skipped"] == 1
+        
+        multi_path = Path(temp_dir) / "multi.jsonl"
+        render_file("code_review", str(input_path), str(multi_path), workers=2,
+                    chunk_size=8, skip_invalid=True, progress_interval=0)
+        assert single_path.read_text(encoding="utf-8") == multi_path.read_text(encoding="utf-8")
+        
+        records = [json.loads(line) for line in single_path.read_text(encoding="utf-8").splitlines()]
+        assert [record["row"] for record in records] == list(range(50))
+        assert "x = 49" in records[-1]["prompt"]
+        
+        # 多进程渲染时缺少变量的错误带着行号传回主进程
+        try:
+            render_file("code_review", str(input_path), str(Path(temp_dir) / "failed.jsonl"), workers=2,
+                        chunk_size=8, progress_interval=0)
+            assert False, "应当抛出MissingVariablesError"
+        except MissingVariablesError as e:
+            assert e.row_index == 50
+            assert sorted(e.missing) == ["code_content", "context_info"]
+            assert "第51行" in str(e)
+    
+    print("✅ 批量渲染文件正常")
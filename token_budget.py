@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Token预算
+在发起API请求前本地统计消息的token数，按模型上下文窗口裁剪示例、
+收紧max_tokens，并拒绝放不下的请求
+"""
+
+import re
+import math
+import logging
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# 模型上下文窗口（按最长前缀匹配）
+MODEL_CONTEXT_WINDOWS: Dict[str, int] = {
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "deepseek-chat": 65536,
+    "deepseek-coder": 65536,
+    "deepseek-reasoner": 65536,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# 对话格式的固定开销：每条消息约4个token，回复起始约3个token
+TOKENS_PER_MESSAGE = 4
+TOKENS_PER_REPLY = 3
+# 至少要为输出保留的token数
+MIN_OUTPUT_TOKENS = 256
+
+_CJK_PATTERN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯＀-￯]")
+_WORD_PATTERN = re.compile(r"[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")
+
+
+class TokenBudgetExceeded(ValueError):
+    """请求在模型上下文窗口中放不下"""
+
+    def __init__(self, prompt_tokens: int, context_window: int, min_output_tokens: int):
+        self.prompt_tokens = prompt_tokens
+        self.context_window = context_window
+        super().__init__(
+            f"请求共 {prompt_tokens} 个token，加上至少 {min_output_tokens} 个输出token"
+            f"超出了模型的上下文窗口（{context_window}）"
+        )
+
+
+def get_context_window(model_name: str) -> int:
+    """按模型名的最长前缀查找上下文窗口"""
+    best = None
+    for prefix in MODEL_CONTEXT_WINDOWS:
+        if model_name.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return MODEL_CONTEXT_WINDOWS[best] if best else DEFAULT_CONTEXT_WINDOW
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model_name: str):
+    """获取模型的分词器；tiktoken在第一次计数时才导入，未安装时返回None（使用保守的估算）"""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    不依赖分词器的保守估算
+
+    中日韩字符按每字1个token计，连续的字母数字按每4个字符1个token计，标点各计1个
+    """
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    text = _CJK_PATTERN.sub(" ", text)
+    return cjk_count + sum(
+        math.ceil(len(piece) / 4) if piece[0].isalnum() or piece[0] == "_" else 1
+        for piece in _WORD_PATTERN.findall(text)
+    )
+
+
+def count_tokens(text: str, model_name: str = "gpt-3.5-turbo") -> int:
+    """统计文本的token数（有tiktoken时精确计数，否则估算）"""
+    encoding = _get_encoding(model_name)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+class TokenBudget:
+    """单个模型的token预算"""
+
+    def __init__(self, model_name: str, context_window: Optional[int] = None,
+                 min_output_tokens: int = MIN_OUTPUT_TOKENS):
+        self.model_name = model_name
+        self.context_window = context_window or get_context_window(model_name)
+        self.min_output_tokens = min_output_tokens
+
+    def count_text(self, text: str) -> int:
+        return count_tokens(text, self.model_name)
+
+    def count_messages(self, messages: Sequence[Dict[str, str]]) -> int:
+        """统计对话消息的token数（包括格式开销）"""
+        return sum(TOKENS_PER_MESSAGE + self.count_text(message["content"]) for message in messages) \
+            + TOKENS_PER_REPLY
+
+    def _required_output(self, max_tokens: int) -> int:
+        return min(max_tokens, self.min_output_tokens)
+
+    def fit_max_tokens(self, messages: Sequence[Dict[str, str]], max_tokens: int) -> int:
+        """
+        把max_tokens收紧到上下文窗口的剩余空间
+
+        Raises:
+            TokenBudgetExceeded: 剩余空间不足以容纳最少的输出
+        """
+        prompt_tokens = self.count_messages(messages)
+        available = self.context_window - prompt_tokens
+        required = self._required_output(max_tokens)
+        if available < required:
+            raise TokenBudgetExceeded(prompt_tokens, self.context_window, required)
+        if available < max_tokens:
+            logger.info(f"max_tokens从 {max_tokens} 收紧到 {available}（提示占用 {prompt_tokens} 个token）")
+        return min(max_tokens, available)
+
+    def select_examples(self, example_texts: Sequence[str], prompt_tokens: int, max_tokens: int) -> int:
+        """
+        按顺序选取能放进预算的示例
+
+        Args:
+            example_texts: 每个示例格式化后的文本
+            prompt_tokens: 不含示例时请求的token数
+            max_tokens: 期望的输出token数
+
+        Returns:
+            可以保留的示例个数（保留前N个）
+        """
+        remaining = self.context_window - prompt_tokens - self._required_output(max_tokens)
+        kept = 0
+        for text in example_texts:
+            cost = self.count_text(text)
+            if cost > remaining:
+                break
+            remaining -= cost
+            kept += 1
+        return kept